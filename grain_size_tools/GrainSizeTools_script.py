@@ -22,26 +22,45 @@
 #    download at https://github.com/marcoalopez/GrainSizeTools/releases        #
 #                                                                              #
 #    Requirements:                                                             #
-#        Python     v3.6 or higher                                             #
-#        Numpy      v1.11 or higher                                            #
+#        Python     v3.7 or higher                                             #
+#        Numpy      v1.15 or higher                                            #
 #        Matplotlib v2.0 or higher                                             #
 #        Scipy      v1.0 or higher                                             #
 #        Pandas     v0.16 or higher                                            #
 #                                                                              #
 # ============================================================================ #
 
-# import grain_size_tools modules
-import plot
-import averages
-import stereology
-import piezometers
-import template
-import get
+# import grain_size_tools modules. The plotting and stereology modules (and
+# hence matplotlib and scipy.optimize) are only loaded when first needed
+try:
+    from . import averages, memo, piezometers, timings
+    from .population import GrainPopulation
+except ImportError:  # run as a script from within the grain_size_tools folder
+    import averages
+    import memo
+    import piezometers
+    import timings
+    from population import GrainPopulation
 
 # import neccesary Python scientific modules
+import importlib
+from collections.abc import Mapping
 import numpy as np
-import pandas as pd
-from scipy.stats import sem, t, shapiro
+
+_lazy_modules = ('plot', 'stereology', 'template', 'get', 'loader')
+
+
+def __getattr__(name):
+    """ Import the plotting-related modules on first access
+    (e.g. GrainSizeTools_script.plot) instead of at import time."""
+    if name in _lazy_modules:
+        if __package__:
+            module = importlib.import_module('.' + name, __package__)
+        else:
+            module = importlib.import_module(name)
+        globals()[name] = module
+        return module
+    raise AttributeError('module {!r} has no attribute {!r}' .format(__name__, name))
 
 
 def conf_interval(data, confidence=0.95):
@@ -72,6 +91,8 @@ def conf_interval(data, confidence=0.95):
     the arithmetic mean, the error, and the limits of the confidence interval
     """
 
+    from scipy.stats import sem, t
+
     dof = len(data) - 1
     amean = np.mean(data)
     std_err = sem(data)  # Standard error of the mean SD / sqrt(n)
@@ -95,7 +116,7 @@ def summarize(data, avg=('amean', 'gmean', 'median', 'mode'), ci_level=0.95,
 
     Parameters
     ----------
-    data : array_like
+    data : array_like or GrainPopulation
         the size of the grains
 
     avg : string, tuple or list; optional
@@ -134,39 +155,19 @@ def summarize(data, avg=('amean', 'gmean', 'median', 'mode'), ci_level=0.95,
     None
     """
 
-    # remove missing and infinite values
-    data = data[~np.isnan(data) & ~np.isinf(data)]
+    results = describe(data, avg, ci_level, bandwidth, precision)
+    W, p_value = results['shapiro']  # the first, as it may subsample the data at random
+    W2, p_value2 = results['shapiro_log']
 
-    # check for negative values and remove
-    if data[data <= 0].size > 0:
+    if results['removed'] > 0:
         print('Warning: There were negative and/or zero values in your dataset!')
-        data = data[data > 0]
         print('Negative/zero values were automatically removed')
         print('')
 
-    # estimate Shapiro-Wilk test to check normality and lognormality
-    # In Shapiro-Wilk tests, the chances of the null hypothesis being
-    # rejected becomes larger for large sample sizes. We limit the
-    # sample size to a maximum of 250
-    if len(data) > 250:
-        W, p_value = shapiro(np.random.choice(data, size=250))
-        W2, p_value2 = shapiro(np.random.choice(np.log(data), size=250))
-    else:
-        W, p_value = shapiro(data)
-        W2, p_value2 = shapiro(np.log(data))
-
     if 'amean' in avg:
-        if p_value2 < 0.05:
-            amean, __, ci, length = averages.amean(data, ci_level, method='ASTM')
-        else:
-            if len(data) > 99:
-                amean, __, (low_ci, high_ci), length2 = averages.amean(data, ci_level, method='mCox')
-            else:
-                amean, __, (low_ci, high_ci), length2 = averages.amean(data, ci_level, method='GCI')
-
-            # estimate coefficients of variation
-            lower_cvar = 100 * (amean - low_ci) / amean
-            upper_cvar = 100 * (high_ci - amean) / amean
+        amean, (low_ci, high_ci) = results['amean'], results['amean_ci']
+        lower_cvar = 100 * (amean - low_ci) / amean
+        upper_cvar = 100 * (high_ci - amean) / amean
 
         print(' ')
         print('============================================================================')
@@ -174,22 +175,16 @@ def summarize(data, avg=('amean', 'gmean', 'median', 'mode'), ci_level=0.95,
         print('============================================================================')
         print('Arithmetic mean = {:0.2f} microns' .format(amean))
         print('Confidence intervals at {:0.1f} %' .format(ci_level * 100))
-        if p_value2 < 0.05:
+        if results['amean_method'] == 'ASTM':
             print('CLT (ASTM) method: {:0.2f} - {:0.2f}, (±{:0.1f}%), length = {:0.3f}'
-                  .format(ci[0], ci[1], 100 * (ci[1] - amean) / amean, length))
+                  .format(low_ci, high_ci, upper_cvar, results['amean_length']))
         else:
-            if len(data) > 99:
-                print('mCox method: {:0.2f} - {:0.2f} (-{:0.1f}%, +{:0.1f}%), length = {:0.3f}'
-                      .format(low_ci, high_ci, lower_cvar, upper_cvar, length2))
-            else:
-                print('GCI method: {:0.2f} - {:0.2f} (-{:0.1f}%, +{:0.1f}%), length = {:0.3f}'
-                      .format(low_ci, high_ci, lower_cvar, upper_cvar, length2))
+            print('{} method: {:0.2f} - {:0.2f} (-{:0.1f}%, +{:0.1f}%), length = {:0.3f}'
+                  .format(results['amean_method'], low_ci, high_ci, lower_cvar, upper_cvar,
+                          results['amean_length']))
 
     if 'gmean' in avg:
-        m = 'CLT' if len(data) > 99 else 'bayes'  # choose optimal method to estimate confidence intervals
-        gmean, msd, (low_ci, high_ci), length = averages.gmean(data, ci_level, method=m)
-
-        # estimate coefficients of variation
+        gmean, (low_ci, high_ci) = results['gmean'], results['gmean_ci']
         lower_cvar = 100 * (gmean - low_ci) / gmean
         upper_cvar = 100 * (high_ci - gmean) / gmean
 
@@ -197,12 +192,11 @@ def summarize(data, avg=('amean', 'gmean', 'median', 'mode'), ci_level=0.95,
         print('Geometric mean = {:0.2f} microns' .format(gmean))
         print('Confidence interval at {:0.1f} %' .format(ci_level * 100))
         print('{} method: {:0.2f} - {:0.2f} (-{:0.1f}%, +{:0.1f}%), length = {:0.3f}'
-              .format(m, low_ci, high_ci, lower_cvar, upper_cvar, length))
+              .format(results['gmean_method'], low_ci, high_ci, lower_cvar, upper_cvar,
+                      results['gmean_length']))
 
     if 'median' in avg:
-        median, iqr, (low_ci, high_ci), length = averages.median(data, ci_level)
-
-        # estimate coefficients of variation
+        median, (low_ci, high_ci) = results['median'], results['median_ci']
         lower_cvar = 100 * (median - low_ci) / median
         upper_cvar = 100 * (high_ci - median) / median
 
@@ -210,17 +204,15 @@ def summarize(data, avg=('amean', 'gmean', 'median', 'mode'), ci_level=0.95,
         print('Median = {:0.2f} microns' .format(median))
         print('Confidence interval at {:0.1f} %' .format(ci_level * 100))
         print('robust method: {:0.2f} - {:0.2f} (-{:0.1f}%, +{:0.1f}%), length = {:0.3f}'
-              .format(low_ci, high_ci, lower_cvar, upper_cvar, length))
+              .format(low_ci, high_ci, lower_cvar, upper_cvar, results['median_length']))
 
     if 'mode' in avg:
-        __, mode, __, bw = averages.freq_peak(data, bandwidth, precision)
-
         print('============================================================================')
-        print('Mode (KDE-based) = {:0.2f} microns' .format(mode))
+        print('Mode (KDE-based) = {:0.2f} microns' .format(results['mode']))
         print('Maximum precision set to', precision)
 
         if type(bandwidth) is str:
-            print('KDE bandwidth = {} ({} rule)' .format(bw, bandwidth))
+            print('KDE bandwidth = {} ({} rule)' .format(results['bandwidth'], bandwidth))
         else:
             print('KDE bandwidth =', bandwidth)
 
@@ -228,12 +220,12 @@ def summarize(data, avg=('amean', 'gmean', 'median', 'mode'), ci_level=0.95,
     print('============================================================================')
     print('DISTRIBUTION FEATURES')
     print('============================================================================')
-    print('Sample size (n) = {}' . format(len(data)))
-    print('Standard deviation = {:0.2f} (1-sigma)' .format(np.std(data)))
+    print('Sample size (n) = {}' . format(results['n']))
+    print('Standard deviation = {:0.2f} (1-sigma)' .format(results['sd']))
     if 'median' in avg:
-        print('Interquartile range (IQR) = {:0.2f}' .format(iqr))
+        print('Interquartile range (IQR) = {:0.2f}' .format(results['iqr']))
     if 'gmean' in avg:
-        print('Lognormal shape (Multiplicative Standard Deviation) = {:0.2f}' .format(msd))
+        print('Lognormal shape (Multiplicative Standard Deviation) = {:0.2f}' .format(results['msd']))
     print('============================================================================')
     print('Shapiro-Wilk test warnings:')
     if p_value < 0.05:
@@ -247,7 +239,170 @@ def summarize(data, avg=('amean', 'gmean', 'median', 'mode'), ci_level=0.95,
     return None
 
 
-def calc_diffstress(grain_size, phase, piezometer, correction=False):
+def describe(data, avg=('amean', 'gmean', 'median', 'mode'), ci_level=0.95,
+             bandwidth='silverman', precision=0.1):
+    """ Estimate the same grain size statistics as summarize but, instead
+    of printing them, returns them in a (lazy) Summary object. Use it in
+    scripts or batch jobs (see the cli module). Parameters as in summarize.
+
+    Examples
+    --------
+    >>> results = describe(dataset['diameters'])
+    >>> results['amean'], results['amean_ci']
+    >>> results.gmean, results.msd
+    >>> dict(results)  # compute all
+
+    Returns
+    -------
+    A Summary (a read-only dict-like object) with the keys 'n', 'removed'
+    (negative/zero values removed), 'sd', 'shapiro' and 'shapiro_log' (test
+    statistic, p-value), plus, depending on the averages requested: 'amean',
+    'amean_ci', 'amean_length', 'amean_method', 'gmean', 'msd', 'gmean_ci',
+    'gmean_length', 'gmean_method', 'median', 'iqr', 'median_ci',
+    'median_length', 'mode', and 'bandwidth'
+    """
+
+    return Summary(data, avg, ci_level, bandwidth, precision)
+
+
+class Summary(Mapping):
+    """ The grain size statistics returned by describe. Each statistic is
+    estimated on first access and then stored, so that reading e.g. the
+    geometric mean and the MSD does not pay for the normality tests, the
+    Monte Carlo confidence intervals or the KDE mode. The statistics that
+    depend on the same quantities (e.g. the log moments) share them through
+    the GrainPopulation.
+
+    The Monte Carlo based confidence intervals (and the subsampling of the
+    normality tests) use the Numpy global random generator when first
+    accessed, so with a seed the values depend on the order of access.
+    dict(summary) computes everything in the same order as summarize.
+
+    Parameters as in summarize.
+
+    Attributes
+    ----------
+    population : the GrainPopulation with the clean data
+    and each of the keys (e.g. summary.gmean, summary.msd)
+    """
+
+    _groups = {'amean': ('amean', 'amean_ci', 'amean_length', 'amean_method'),
+               'gmean': ('gmean', 'msd', 'gmean_ci', 'gmean_length', 'gmean_method'),
+               'median': ('median', 'iqr', 'median_ci', 'median_length'),
+               'mode': ('mode', 'bandwidth')}
+
+    # statistics derived directly from the (cached) population
+    _direct = {'n': len,
+               'removed': lambda pop: pop.removed,
+               'sd': lambda pop: pop.std(ddof=0),
+               'amean': lambda pop: pop.mean(),
+               'gmean': lambda pop: np.exp(pop.mean(log=True)),
+               'msd': lambda pop: np.exp(pop.std(ddof=1, log=True)),
+               'gmean_method': lambda pop: 'CLT' if len(pop) > 99 else 'bayes',
+               'median': lambda pop: pop.median(),
+               'iqr': lambda pop: np.subtract(*pop.percentile([75, 25]))}
+
+    def __init__(self, data, avg=('amean', 'gmean', 'median', 'mode'), ci_level=0.95,
+                 bandwidth='silverman', precision=0.1):
+        # remove missing, infinite, negative and zero values. The population
+        # caches the logarithms, moments, and sorted values shared by the
+        # different estimators
+        with timings.stage('summarize.clean', len(data)):
+            self.population = data if isinstance(data, GrainPopulation) else GrainPopulation(data)
+        self.ci_level, self.bandwidth, self.precision = ci_level, bandwidth, precision
+        self._keys = ('n', 'removed', 'sd', 'shapiro', 'shapiro_log') + \
+            tuple(key for name in ('amean', 'gmean', 'median', 'mode') if name in avg
+                  for key in self._groups[name])
+        self._results = {}
+
+    def __getitem__(self, key):
+        if key not in self._results:
+            if key not in self._keys:
+                raise KeyError(key)
+            self._estimate(key)
+        return self._results[key]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError('Summary has no attribute {!r}' .format(name)) from None
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return 'Summary(n={}, computed={})' .format(len(self.population), sorted(self._results))
+
+    def _estimate(self, key):
+        pop = self.population
+        if key in self._direct:
+            self._results[key] = self._direct[key](pop)
+        elif key in ('shapiro', 'shapiro_log'):
+            self._results.update(_estimate(pop, 'normality'))
+        elif key == 'amean_method':
+            if self['shapiro_log'][1] < 0.05:
+                self._results[key] = 'ASTM'
+            else:
+                self._results[key] = 'mCox' if len(pop) > 99 else 'GCI'
+        elif key in ('amean_ci', 'amean_length'):
+            self._results.update(_estimate(pop, 'amean', self.ci_level, self['amean_method']))
+        elif key in ('gmean_ci', 'gmean_length'):
+            self._results.update(_estimate(pop, 'gmean', self.ci_level, self['gmean_method']))
+        elif key in ('median_ci', 'median_length'):
+            self._results.update(_estimate(pop, 'median', self.ci_level))
+        else:
+            self._results.update(_estimate(pop, 'mode', bandwidth=self.bandwidth,
+                                           precision=self.precision))
+
+
+@memo.memoize(random=True)
+def _estimate(data, name, ci_level=None, method=None, bandwidth=None, precision=None):
+    """ Estimate the costly statistics of a Summary: the normality tests,
+    the confidence intervals, or the KDE mode. Returns a dict."""
+
+    if name == 'normality':
+        from scipy.stats import shapiro
+
+        # In Shapiro-Wilk tests, the chances of the null hypothesis being
+        # rejected becomes larger for large sample sizes. We limit the
+        # sample size to a maximum of 250
+        with timings.stage('summarize.shapiro', len(data)):
+            if len(data) > 250:
+                W, p_value = shapiro(np.random.choice(data.values, size=250))
+                W2, p_value2 = shapiro(np.random.choice(data.log, size=250))
+            else:
+                W, p_value = shapiro(data.values)
+                W2, p_value2 = shapiro(data.log)
+        return {'shapiro': (float(W), float(p_value)), 'shapiro_log': (float(W2), float(p_value2))}
+
+    elif name == 'amean':
+        with timings.stage('summarize.amean', len(data)):
+            __, __, ci, length = averages.amean(data, ci_level, method=method)
+        return {'amean_ci': tuple(ci), 'amean_length': length}
+
+    elif name == 'gmean':
+        with timings.stage('summarize.gmean', len(data)):
+            __, __, ci, length = averages.gmean(data, ci_level, method=method)
+        return {'gmean_ci': tuple(ci), 'gmean_length': length}
+
+    elif name == 'median':
+        with timings.stage('summarize.median', len(data)):
+            __, __, ci, length = averages.median(data, ci_level)
+        return {'median_ci': tuple(ci), 'median_length': length}
+
+    else:
+        with timings.stage('summarize.mode', len(data)):
+            __, mode, __, bw = averages.freq_peak(data, bandwidth, precision)
+        return {'mode': mode, 'bandwidth': bw}
+
+
+def calc_diffstress(grain_size, phase, piezometer, correction=False, temperature=None):
     """ Apply different piezometric relations to estimate the differential
     stress from average apparent grain sizes. The piezometric relation has
     the following general form:
@@ -272,6 +427,10 @@ def calc_diffstress(grain_size, phase, piezometer, correction=False):
     correction : bool, default False
         correct the stress values for plane stress (Paterson and Olgaard, 2000)
 
+    temperature : scalar or None, default None
+        the temperature during deformation in C degrees (Shimizu piezometer
+        only). If None, it is asked interactively
+
      References
     -----------
     Paterson and Olgaard (2000) https://doi.org/10.1016/S0191-8141(00)00042-0
@@ -305,6 +464,44 @@ def calc_diffstress(grain_size, phase, piezometer, correction=False):
     The differential stress in MPa (a float)
     """
 
+    if piezometer == 'Shimizu' and temperature is None:
+        temperature = float(input("Please, enter the temperature [in C degrees] during deformation: "))
+
+    diff_stress, warn, linear_interceps = estimate_stress(grain_size, phase, piezometer,
+                                                          correction, temperature)
+
+    print('============================================================================')
+    if isinstance(diff_stress, (int, float)):
+        print('differential stress = {:0.2f} MPa' .format(diff_stress))
+        print('')
+        print('INFO:')
+        print(warn)
+        if linear_interceps is True:
+            print('ECD was converted to linear intercepts using de Hoff and Rhines (1968) correction')
+        print('============================================================================')
+        return None
+    else:
+        print('INFO:')
+        print(warn)
+        if linear_interceps is True:
+            print('ECD was converted to linear intercepts using de Hoff and Rhines (1968) correction')
+        print('Differential stresses in MPa')
+
+        return np.around(diff_stress, 2)
+
+
+def estimate_stress(grain_size, phase, piezometer, correction=False, temperature=None):
+    """ Estimate the differential stress as calc_diffstress but without
+    printing or asking for input, e.g. for scripts and batch jobs.
+    Parameters as in calc_diffstress, except that the temperature is
+    required for the Shimizu piezometer.
+
+    Returns
+    -------
+    the differential stress in MPa (float or array), the piezometer notes
+    (string), and whether the grain size was converted to linear intercepts
+    """
+
     if phase == 'quartz':
         B, m, warn, linear_interceps, correction_factor = piezometers.quartz(piezometer)
     elif phase == 'olivine':
@@ -322,34 +519,16 @@ def calc_diffstress(grain_size, phase, piezometer, correction=False):
 
     # Estimate differential stress
     if piezometer == 'Shimizu':
-        T = float(input("Please, enter the temperature [in C degrees] during deformation: "))
-        diff_stress = B * grain_size**(-m) * np.exp(698 / (T + 273.15))
-        if correction is True:
-            diff_stress = diff_stress * 2 / np.sqrt(3)
-
+        if temperature is None:
+            raise ValueError('The Shimizu piezometer requires the temperature during deformation')
+        diff_stress = B * grain_size**(-m) * np.exp(698 / (temperature + 273.15))
     else:
         diff_stress = B * grain_size**-m
-        if correction is True:
-            diff_stress = diff_stress * 2 / np.sqrt(3)
 
-    print('============================================================================')
-    if isinstance(diff_stress, (int, float)):
-        print('differential stress = {:0.2f} MPa' .format(diff_stress))
-        print('')
-        print('INFO:')
-        print(warn)
-        if linear_interceps is True:
-            print('ECD was converted to linear intercepts using de Hoff and Rhines (1968) correction')
-        print('============================================================================')
-        return None
-    else:
-        print('INFO:')
-        print(warn)
-        if linear_interceps is True:
-            print('ECD was converted to linear intercepts using de Hoff and Rhines (1968) correction')
-        print('Differential stresses in MPa')
+    if correction is True:
+        diff_stress = diff_stress * 2 / np.sqrt(3)
 
-        return np.around(diff_stress, 2)
+    return diff_stress, warn, linear_interceps
 
 
 def get_filepath():
@@ -373,6 +552,17 @@ def get_filepath():
     return file_path
 
 
-if float(np.__version__[0:4]) < 1.11:
+if tuple(int(v) for v in np.__version__.split('.')[:2]) < (1, 15):
     print('The installed Numpy version', np.__version__, 'is too old.')
-    print('Please upgrade to v1.11 or higher')
+    print('Please upgrade to v1.15 or higher')
+
+if __name__ == '__main__':
+    # interactive session (e.g. Spyder's "Run file" or %run in Jupyter): load
+    # everything up front, set the plot style and greet the user
+    import pandas as pd
+    for _name in _lazy_modules:
+        __getattr__(_name)
+    for _name in ('plot', 'averages', 'stereology', 'piezometers', 'template'):
+        print('module {} imported' .format(_name))
+    template.set_style()
+    print(get.welcome)
@@ -1,3 +1,30 @@
 # -*- coding: utf-8 -*-
+""" GrainSizeTools package.
 
-__all__ = ['GrainSizeTools_script', 'averages', 'get', 'piezometers', 'plot', 'stereology', 'template']
+Submodules are imported lazily the first time they are accessed (e.g.
+``grain_size_tools.averages``) so that importing the package does not pull
+in matplotlib, pandas or scipy until they are actually needed. Importing
+the package or any of its submodules has no side effects: no banners are
+printed and the matplotlib style is only applied on request via
+``template.set_style()``.
+"""
+
+import importlib
+
+__version__ = '3.0'
+
+__all__ = ['GrainSizeTools_script', 'averages', 'benchmarks', 'cache', 'cli', 'get', 'loader',
+           'memo', 'mixture', 'piezometers', 'plot', 'population', 'render', 'service',
+           'simulate', 'spatial', 'stereology', 'template', 'timings']
+
+
+def __getattr__(name):
+    if name in __all__:
+        module = importlib.import_module('.' + name, __name__)
+        globals()[name] = module  # subsequent lookups bypass __getattr__
+        return module
+    raise AttributeError('module {!r} has no attribute {!r}' .format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,6 @@
+# Allows running the command-line interface as python -m grain_size_tools
+import sys
+
+from grain_size_tools.cli import main
+
+sys.exit(main())
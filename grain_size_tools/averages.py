@@ -24,10 +24,15 @@
 #                                                                              #
 # ============================================================================ #
 
-# Imports
-from scipy.stats import bayes_mvs, gaussian_kde, iqr, t, norm
+# Imports (scipy.stats is imported within the functions that need it to
+# keep the import of this module cheap)
 import numpy as np
 
+try:
+    from .population import GrainPopulation, SizeIndex
+except ImportError:
+    from population import GrainPopulation, SizeIndex
+
 # ============================================================================ #
 # AVERAGES                                                                     #
 # ============================================================================ #
@@ -39,7 +44,7 @@ def amean(pop, ci=0.95, method='ASTM'):
 
     Parameters
     ----------
-    pop : array-like
+    pop : array-like or GrainPopulation
         the population
 
     ci : float, scalar between 0 and 1
@@ -72,7 +77,10 @@ def amean(pop, ci=0.95, method='ASTM'):
     """
 
     n = len(pop)
-    mean, std = np.mean(pop), np.std(pop, ddof=1)  # SD using n-1 degrees of freedom (Bessel corrected)
+    if isinstance(pop, GrainPopulation):
+        mean, std = pop.mean(), pop.std(ddof=1)
+    else:
+        mean, std = np.mean(pop), np.std(pop, ddof=1)  # SD using n-1 degrees of freedom (Bessel corrected)
 
     # confidence interval
     if method == 'ASTM':
@@ -97,7 +105,7 @@ def gmean(pop, ci=0.95, method='CLT'):
 
     Parameters
     ----------
-    pop : array-like
+    pop : array-like or GrainPopulation
         the population
 
     ci : float, scalar between 0 and 1
@@ -129,8 +137,13 @@ def gmean(pop, ci=0.95, method='CLT'):
     """
 
     # compute statistics of the log-transformed data
-    mean_log, n = np.mean(np.log(pop)), len(pop)
-    std_log = np.std(np.log(pop), ddof=1)  # Bessel corrected SD (n-1 degrees of freedom)
+    n = len(pop)
+    if isinstance(pop, GrainPopulation):
+        mean_log, std_log = pop.mean(log=True), pop.std(ddof=1, log=True)
+    else:
+        log_pop = np.log(pop)
+        mean_log = np.mean(log_pop)
+        std_log = np.std(log_pop, ddof=1)  # Bessel corrected SD (n-1 degrees of freedom)
 
     # compute the back-transformed values (gmean and mSD in linear scale)
     gmean = np.exp(mean_log)
@@ -156,7 +169,7 @@ def median(pop, ci=0.95):
 
     Parameters
     ----------
-    pop : array-like
+    pop : array-like or GrainPopulation
         the population
 
     ci : float, scalar between 0 and 1
@@ -186,8 +199,14 @@ def median(pop, ci=0.95):
     the confidence interval (tuple),
     the confidence length (float)
     """
-    pop, n = np.sort(pop), len(pop)
-    median, iqr_range = np.median(pop), iqr(pop)
+    from scipy.stats import iqr
+
+    if isinstance(pop, GrainPopulation):
+        q1, q3 = pop.percentile([25, 75])  # sorts the data (once)
+        median, iqr_range, pop, n = pop.median(), q3 - q1, pop.sorted, len(pop)
+    else:
+        pop, n = np.sort(pop), len(pop)
+        median, iqr_range = np.median(pop), iqr(pop)
 
     # compute confidence intervals
     ci_limits, length = median_ci(pop, n, ci)
@@ -202,7 +221,7 @@ def freq_peak(pop, bandwidth='silverman', max_precision=0.05):
 
     Parameters
     ----------
-    pop : array_like
+    pop : array_like or GrainPopulation
         the diameters of the grains
 
     bandwidth : string, positive scalar or callable
@@ -225,26 +244,148 @@ def freq_peak(pop, bandwidth='silverman', max_precision=0.05):
     the bandwidth
     """
 
+    from scipy.stats import gaussian_kde
+
+    low, high = pop.min(), pop.max()
+    if isinstance(pop, GrainPopulation):
+        std, pop = pop.std(ddof=1), pop.values
+    else:
+        std = np.std(pop, ddof=1)
+
     # check bandwidth and estimate Gaussian kernel density function
     if isinstance(bandwidth, (int, float)):
-        bw = bandwidth / np.std(pop, ddof=1)
+        bw = bandwidth / std
         kde = gaussian_kde(pop, bw_method=bw)
 
     elif isinstance(bandwidth, str):
         kde = gaussian_kde(pop, bw_method=bandwidth)
-        bw = round(kde.covariance_factor() * pop.std(ddof=1), 2)
+        bw = round(kde.covariance_factor() * std, 2)
 
     else:
         raise ValueError("bandwidth must be integer, float, or plug-in methods 'silverman' or 'scott'")
 
     # locate and get the frequency peak
-    xgrid = gen_xgrid(pop.min(), pop.max(), max_precision)
+    xgrid = gen_xgrid(low, high, max_precision)
     densities = kde(xgrid)
     y_max, peak_grain_size = np.max(densities), xgrid[np.argmax(densities)]
 
     return (xgrid, densities), peak_grain_size, y_max, bw
 
 
+def area_weighted(areas, diameters=None, ci=0.95, percentiles=(10, 25, 50, 75, 90),
+                  bandwidth='silverman', precision=0.1, area_column='Area'):
+    """ Returns the area-weighted grain size statistics: the arithmetic and
+    geometric means with their confidence intervals, the median and other
+    percentiles, and the frequency peak (mode) of the weighted Gaussian KDE.
+    The percentiles come from a single sort and cumulative sum of the areas.
+
+    Parameters
+    ----------
+    areas : array_like, DataFrame or GrainPopulation
+        the sectional areas (e.g. the 'Area' column of ImageJ/MTEX tables),
+        a table with an area_column, or a GrainPopulation
+
+    diameters : array_like or None, optional
+        the grain sizes. If None (default) the equivalent circular diameters
+        are computed from the areas
+
+    ci : float, scalar between 0 and 1
+        the confidence interval, default = 0.95
+
+    percentiles : array_like, optional
+        the area-weighted percentiles to estimate (between 0 and 100)
+
+    bandwidth : string {'silverman' or 'scott'} or positive scalar
+        the plug-in method (using the effective sample size) or a scalar
+        directly defining the bandwidth of the KDE
+
+    precision : positive scalar, optional
+        the maximum precision of the mode, default = 0.1
+
+    area_column : string, optional
+        the column with the areas if a table is passed. Default 'Area'
+
+    Reference
+    ---------
+    Gatz and Smith (1995) https://doi.org/10.1016/1352-2310(94)00210-C
+    (standard error of the weighted mean)
+    Kish (1965) Survey sampling. John Wiley, New York (effective sample size)
+
+    Call functions
+    --------------
+    - SizeIndex (from population)
+    - linear_binning and kde_from_counts
+
+    Examples
+    --------
+    >>> results = area_weighted(dataset['Area'])
+    >>> results = area_weighted(dataset, percentiles=(50, 90))
+    >>> results['amean'], results['amean_ci']
+
+    Returns
+    -------
+    A dict with the keys 'n', 'n_eff' (effective sample size), 'amean',
+    'amean_ci', 'gmean', 'gmean_ci', 'median', 'percentiles' (one value per
+    percentile requested), 'mode', and 'bandwidth'
+    """
+
+    if isinstance(areas, GrainPopulation):
+        pop = areas
+        index, areas, diameters = pop.index, pop.areas, pop.values
+    else:
+        if hasattr(areas, 'columns'):
+            areas = areas[area_column]
+        areas = np.asarray(areas, dtype='float64')
+        valid = np.isfinite(areas) & (areas > 0)
+        if diameters is None:
+            diameters = 2 * np.sqrt(areas[valid] / np.pi)
+        else:
+            diameters = np.asarray(diameters, dtype='float64')
+            valid &= np.isfinite(diameters) & (diameters > 0)
+            diameters = diameters[valid]
+        areas = areas[valid]
+        if len(areas) < 2:
+            raise ValueError('At least two grains with positive areas are required')
+        index = SizeIndex(diameters, areas)
+
+    n = len(areas)
+    total = np.sum(areas)
+    n_eff = total**2 / np.sum(np.square(areas))
+
+    def weighted_mean_ci(values):
+        # weighted mean and its standard error (Gatz and Smith, 1995)
+        mean = np.sum(areas * values) / total
+        w_mean = total / n
+        wx = areas * values - w_mean * mean
+        dw = areas - w_mean
+        var = n / ((n - 1) * total**2) * (np.sum(wx**2) - 2 * mean * np.sum(dw * wx) + mean**2 * np.sum(dw**2))
+        err = critical_t(ci, n) * np.sqrt(var)
+        return mean, (mean - err, mean + err)
+
+    amean, amean_ci = weighted_mean_ci(diameters)
+    mean_log, (low, high) = weighted_mean_ci(np.log(diameters))
+
+    # weighted KDE (binned) using the effective sample size in the plug-in rules
+    if isinstance(bandwidth, (int, float)):
+        bw = float(bandwidth)
+    elif bandwidth in ('silverman', 'scott'):
+        factor = (n_eff * 3 / 4.)**(-1 / 5.) if bandwidth == 'silverman' else n_eff**(-1 / 5.)
+        std = np.sqrt(np.sum(areas * (diameters - amean)**2) / total * n_eff / (n_eff - 1))
+        bw = factor * std
+    else:
+        raise ValueError("bandwidth must be integer, float, or plug-in methods 'silverman' or 'scott'")
+    xgrid = gen_xgrid(index.sorted[0], index.sorted[-1], precision)
+    counts = linear_binning(diameters, xgrid, weights=areas)
+    densities = kde_from_counts(counts, xgrid[1] - xgrid[0], bw)
+
+    return {'n': n, 'n_eff': n_eff,
+            'amean': amean, 'amean_ci': amean_ci,
+            'gmean': np.exp(mean_log), 'gmean_ci': (np.exp(low), np.exp(high)),
+            'median': index.size_at(50, weighted=True),
+            'percentiles': index.size_at(percentiles, weighted=True),
+            'mode': xgrid[np.argmax(densities)], 'bandwidth': bw}
+
+
 # ============================================================================ #
 # CONFIDENCE INTERVAL METHODS                                                  #
 # ============================================================================ #
@@ -341,7 +482,7 @@ def mCox_ci(data, ci=0.95):
 
     Parameters
     ----------
-    data : array_like
+    data : array_like or GrainPopulation
         the dataset
 
     ci : float, scalar between 0 and 1
@@ -363,9 +504,27 @@ def mCox_ci(data, ci=0.95):
     """
 
     n = len(data)
+    if isinstance(data, GrainPopulation):
+        mean_log, std_log = data.mean(log=True), data.std(ddof=1, log=True)
+    else:
+        data = np.log(data)
+        mean_log, std_log = np.mean(data), np.std(data, ddof=1)
+
+    return mCox_equation(mean_log, std_log, n, ci)
+
+
+def mCox_equation(mean_log, std_log, n, ci=0.95):
+    """ Returns the modified Cox confidence interval from the mean and the
+    Bessel corrected SD of the log-transformed data (scalars or arrays).
+    See mCox_ci.
+
+    Returns
+    -------
+    the lower and upper confidence intervals (tuple)
+    the interval length
+    """
+
     t = critical_t(confidence=ci, sample_size=n)
-    data = np.log(data)
-    mean_log, std_log = np.mean(data), np.std(data, ddof=1)
 
     lower = np.exp(mean_log + 0.5 * std_log**2 - t * (std_log / np.sqrt(n)) * np.sqrt(1 + (std_log**2 * n) / (2 * (n + 1))))
     upper = np.exp(mean_log + 0.5 * std_log**2 + t * (std_log / np.sqrt(n)) * np.sqrt(1 + (std_log**2 * n) / (2 * (n + 1))))
@@ -381,7 +540,7 @@ def GCI_ci(data, ci=0.95, runs=10000):
 
     Parameters
     ----------
-    data : array_like
+    data : array_like or GrainPopulation
         the dataset
 
     ci : float, scalar between 0 and 1
@@ -409,8 +568,11 @@ def GCI_ci(data, ci=0.95, runs=10000):
     """
 
     # estimate the log-transformed population y = ln(x) and the degrees of freedom
-    data = np.log(data)
-    mu_log, var_log, n = np.mean(data), np.var(data), len(data)
+    if isinstance(data, GrainPopulation):
+        mu_log, var_log, n = data.mean(log=True), data.var(ddof=0, log=True), len(data)
+    else:
+        data = np.log(data)
+        mu_log, var_log, n = np.mean(data), np.var(data), len(data)
     ddof = n - 1
     alpha = 1 - ci
 
@@ -471,7 +633,7 @@ def bayesian_ci(data, ci=0.95):
 
     Parameters
     ----------
-    data : array_like
+    data : array_like or GrainPopulation
         the dataset
 
     ci : float, scalar between 0 and 1
@@ -495,7 +657,9 @@ def bayesian_ci(data, ci=0.95):
     the interval length (scalar)
     """
 
-    data = np.log(data)
+    from scipy.stats import bayes_mvs
+
+    data = data.log if isinstance(data, GrainPopulation) else np.log(data)
     mu_log, var_log, std_log = bayes_mvs(data, alpha=ci)
     mu, (lower_log, upper_log) = mu_log
     lower, upper = np.exp(lower_log), np.exp(upper_log)
@@ -510,7 +674,7 @@ def median_ci(pop, n, ci=0.95):
 
     Parameters
     ----------
-    pop : numpy array
+    pop : numpy array or GrainPopulation
         a sorted dataset
 
     n : scalar, positive int
@@ -534,6 +698,10 @@ def median_ci(pop, n, ci=0.95):
     the interval length (scalar)
     """
 
+    from scipy.stats import norm
+
+    if isinstance(pop, GrainPopulation):
+        pop = pop.sorted
     z_score = norm.ppf(1 - (1 - ci) / 2)  # two-tailed z score
 
     id_upper = 1 + (n / 2) + (z_score * np.sqrt(n)) / 2
@@ -544,6 +712,255 @@ def median_ci(pop, n, ci=0.95):
     return (lower_ci, upper_ci), interval
 
 
+# ============================================================================ #
+# CUTOFF SENSITIVITY                                                           #
+# ============================================================================ #
+
+
+def cutoff_sweep(data, cutoffs, ci=0.95):
+    """ Returns the averages and their confidence intervals after removing
+    the grains smaller than each of the cutoffs. The diameters are sorted
+    once and the sums of d, d**2, log(d) and log(d)**2 above each grain
+    are accumulated, so that all the cutoffs are evaluated in
+    O(n log n + k) instead of filtering the data k times.
+
+    Parameters
+    ----------
+    data : array_like or GrainPopulation
+        the apparent diameters
+
+    cutoffs : scalar or array_like
+        the minimum grain sizes, grains smaller than these are discarded
+
+    ci : float, scalar between 0 and 1
+        the confidence interval, default = 0.95
+
+    Call functions
+    --------------
+    - CLT_ci, mCox_equation, and CLT2_ci
+
+    Examples
+    --------
+    >>> sweep = cutoff_sweep(dataset['diameters'], np.arange(0, 20, 0.1))
+    >>> plt.plot(sweep['cutoff'], sweep['amean'])
+    >>> pd.DataFrame(sweep)
+
+    Returns
+    -------
+    A dict of arrays (one value per cutoff) with the keys 'cutoff', 'n',
+    'amean', 'sd' (Bessel corrected), 'amean_ASTM_low', 'amean_ASTM_high',
+    'amean_mCox_low', 'amean_mCox_high', 'gmean', 'msd', 'gmean_low',
+    'gmean_high' (CLT method), and 'median'. The statistics are NaN when
+    less than two grains remain.
+    """
+
+    pop = data if isinstance(data, GrainPopulation) else GrainPopulation(data)
+    cutoffs = np.atleast_1d(np.asarray(cutoffs, dtype='float64'))
+    sorted_data = pop.sorted
+    total = len(sorted_data)
+
+    # sums over the grains from each position to the end (shifted to avoid
+    # the loss of precision of the sums of squares)
+    def tail_sums(values, shift):
+        values = values - shift
+        sums = np.zeros((2, total + 1))
+        sums[0, :-1] = np.cumsum(values[::-1])[::-1]
+        sums[1, :-1] = np.cumsum(np.square(values)[::-1])[::-1]
+        return sums
+
+    sums = tail_sums(sorted_data, pop.mean())
+    log_sums = tail_sums(np.log(sorted_data), pop.mean(log=True))
+
+    start = np.searchsorted(sorted_data, cutoffs, side='left')
+    n = total - start
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_shift = sums[0, start] / n
+        amean = pop.mean() + mean_shift
+        sd = np.sqrt(np.maximum(sums[1, start] - n * mean_shift**2, 0) / (n - 1))
+        log_shift = log_sums[0, start] / n
+        mean_log = pop.mean(log=True) + log_shift
+        std_log = np.sqrt(np.maximum(log_sums[1, start] - n * log_shift**2, 0) / (n - 1))
+
+        (ASTM_low, ASTM_high), __ = CLT_ci(amean, sd, n, ci)
+        (mCox_low, mCox_high), __ = mCox_equation(mean_log, std_log, n, ci)
+        (gmean_low, gmean_high), __ = CLT2_ci(mean_log, std_log, n, ci)
+
+    # median of sorted_data[start:]
+    lower = np.minimum(start + (n - 1) // 2, total - 1)
+    upper = np.minimum(start + n // 2, total - 1)
+    median = (sorted_data[lower] + sorted_data[upper]) / 2
+
+    results = {'cutoff': cutoffs, 'n': n, 'amean': amean, 'sd': sd,
+               'amean_ASTM_low': ASTM_low, 'amean_ASTM_high': ASTM_high,
+               'amean_mCox_low': mCox_low, 'amean_mCox_high': mCox_high,
+               'gmean': np.exp(mean_log), 'msd': np.exp(std_log),
+               'gmean_low': gmean_low, 'gmean_high': gmean_high, 'median': median}
+
+    few = n < 2
+    for key, value in results.items():
+        if key not in ('cutoff', 'n'):
+            value[few] = np.nan
+
+    return results
+
+
+# ============================================================================ #
+# BINNED KERNEL DENSITY ESTIMATION                                             #
+# ============================================================================ #
+
+
+def kde_bandwidth(data, bandwidth='silverman'):
+    """ Returns the bandwidth (in data units) of a Gaussian kernel density
+    estimator using the same plug-in rules as Scipy's gaussian_kde.
+
+    Parameters
+    ----------
+    data : array_like or GrainPopulation
+        the dataset
+
+    bandwidth : string {'silverman' or 'scott'} or positive scalar
+        the plug-in method or a scalar directly defining the bandwidth
+    """
+
+    if isinstance(bandwidth, (int, float)):
+        return float(bandwidth)
+
+    n = len(data)
+    if bandwidth == 'silverman':
+        factor = (n * 3 / 4.)**(-1 / 5.)
+    elif bandwidth == 'scott':
+        factor = n**(-1 / 5.)
+    else:
+        raise ValueError("bandwidth must be integer, float, or plug-in methods 'silverman' or 'scott'")
+
+    if isinstance(data, GrainPopulation):
+        return factor * data.std(ddof=1)
+    return factor * np.std(data, ddof=1)
+
+
+def linear_binning(data, xgrid, chunksize=2**20, weights=None):
+    """ Distribute the data over the nodes of a regular mesh using linear
+    binning, i.e. each value is split between its two neighbouring nodes
+    in proportion to its distance to them. Values outside the mesh are
+    assigned to the end nodes. The data is processed in chunks so that
+    memory use does not grow with the size of the dataset.
+
+    Parameters
+    ----------
+    data : array_like or GrainPopulation
+        the dataset
+
+    xgrid : array_like
+        a regular (evenly spaced) mesh with at least two nodes
+
+    chunksize : positive integer, optional
+        the number of values processed at once
+
+    weights : array_like or None, optional
+        the weight of each value (e.g. the sectional areas). Default None
+
+    Returns
+    -------
+    the (fractional) counts at each node, which sum up to len(data) or to
+    the sum of the weights
+    """
+
+    if isinstance(data, GrainPopulation):
+        data = data.values
+    start, step, m = xgrid[0], xgrid[1] - xgrid[0], len(xgrid)
+    counts = np.zeros(m)
+
+    for i in range(0, len(data), chunksize):
+        pos = (np.asarray(data[i:i + chunksize], dtype=float) - start) / step
+        np.clip(pos, 0, m - 1, out=pos)
+        idx = np.minimum(pos.astype(np.intp), m - 2)
+        frac = pos - idx
+        if weights is None:
+            counts += np.bincount(idx, weights=1 - frac, minlength=m)
+            counts += np.bincount(idx + 1, weights=frac, minlength=m)
+        else:
+            w = np.asarray(weights[i:i + chunksize], dtype=float)
+            counts += np.bincount(idx, weights=w * (1 - frac), minlength=m)
+            counts += np.bincount(idx + 1, weights=w * frac, minlength=m)
+
+    return counts
+
+
+def kde_from_counts(counts, step, bw):
+    """ Estimate Gaussian kernel densities from binned data by convolving the
+    counts with the kernel via FFT. Several samples binned on the same mesh
+    can be processed at once passing a 2D array of counts (one sample per
+    row) and one bandwidth per sample.
+
+    Parameters
+    ----------
+    counts : array_like, 1D or 2D
+        the counts at each node of a regular mesh
+
+    step : positive scalar
+        the spacing of the mesh
+
+    bw : positive scalar or array_like
+        the bandwidth(s) of the kernel in data units
+
+    Returns
+    -------
+    the densities at the nodes of the mesh (same shape as counts)
+    """
+
+    counts = np.asarray(counts, dtype=float)
+    weights = np.atleast_2d(counts)
+    bw = np.atleast_1d(np.asarray(bw, dtype=float)).reshape(-1, 1)
+    m = weights.shape[1]
+
+    # zero-pad beyond the kernel support (4 bandwidths) to avoid wrap-around
+    L = m + int(np.ceil(4 * bw.max() / step))
+    L = 1 << int(np.ceil(np.log2(L)))
+    omega = 2 * np.pi * np.fft.rfftfreq(L, d=step)
+    kernel_ft = np.exp(-0.5 * (bw * omega)**2)
+    signal_ft = np.fft.rfft(weights / weights.sum(axis=1, keepdims=True), n=L)
+    densities = np.fft.irfft(signal_ft * kernel_ft, n=L)[:, :m] / step
+    np.clip(densities, 0, None, out=densities)  # remove FFT round-off
+
+    return densities.reshape(counts.shape)
+
+
+def binned_kde(data, xgrid, bandwidth='silverman'):
+    """ Returns the Gaussian kernel density estimate of the data evaluated at
+    the nodes of a regular mesh using linear binning and FFT convolution. The
+    cost is O(n + m log m) instead of the O(n * m) of Scipy's gaussian_kde,
+    which makes it suitable for very large datasets.
+
+    Parameters
+    ----------
+    data : array_like or GrainPopulation
+        the dataset
+
+    xgrid : array_like
+        a regular (evenly spaced) mesh
+
+    bandwidth : string {'silverman' or 'scott'} or positive scalar
+        the plug-in method or a scalar directly defining the bandwidth
+
+    Call functions
+    --------------
+    - kde_bandwidth
+    - linear_binning
+    - kde_from_counts
+
+    Returns
+    -------
+    the densities at the nodes of the mesh, the bandwidth
+    """
+
+    bw = kde_bandwidth(data, bandwidth)
+    counts = linear_binning(data, xgrid)
+    densities = kde_from_counts(counts, xgrid[1] - xgrid[0], bw)
+
+    return densities, bw
+
+
 # ============================================================================ #
 # AUXILIARY FUNCTIONS                                                          #
 # ============================================================================ #
@@ -565,6 +982,8 @@ def critical_t(confidence, sample_size):
     - the population is symmetric
     """
 
+    from scipy.stats import t
+
     # recalculate confidence for the two-tailed t-distribution
     confidence = confidence + ((1 - confidence) / 2)
 
@@ -598,5 +1017,3 @@ def gen_xgrid(start, stop, precision):
 
 if __name__ == '__main__':
     pass
-else:
-    print('module averages imported')
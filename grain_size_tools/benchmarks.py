@@ -0,0 +1,360 @@
+# ============================================================================ #
+#                                                                              #
+#    This is part of the "GrainSizeTools Script"                               #
+#    A Python script for characterizing grain size from thin sections          #
+#                                                                              #
+#    Copyright (c) 2014-present   Marco A. Lopez-Sanchez                       #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License");           #
+#    you may not use this file except in compliance with the License.          #
+#    You may obtain a copy of the License at                                   #
+#                                                                              #
+#        http://www.apache.org/licenses/LICENSE-2.0                            #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS,         #
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  #
+#    See the License for the specific language governing permissions and       #
+#    limitations under the License.                                            #
+#                                                                              #
+#    Version 3.0rc                                                             #
+#    For details see: http://marcoalopez.github.io/GrainSizeTools/             #
+#    download at https://github.com/marcoalopez/GrainSizeTools/releases        #
+#                                                                              #
+# ============================================================================ #
+
+# ============================================================================ #
+# Benchmark suite for the hot paths of the GrainSizeTools modules. It works    #
+# offline on synthetic datasets. Usage:                                        #
+#                                                                              #
+#   python -m grain_size_tools.benchmarks                                      #
+#   python -m grain_size_tools.benchmarks --sizes 1e3 1e5 --save base.json     #
+#   python -m grain_size_tools.benchmarks --compare base.json                  #
+#                                                                              #
+# See python -m grain_size_tools.benchmarks --help for all the options         #
+# ============================================================================ #
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+try:
+    from . import memo
+except ImportError:
+    import memo
+
+
+# ============================================================================ #
+# SYNTHETIC DATASETS                                                           #
+# ============================================================================ #
+
+
+def lognormal_dataset(n, seed=None):
+    """ Returns n apparent diameters drawn from a lognormal distribution with
+    a geometric mean of 35 microns and a MSD of 1.6.
+
+    Parameters
+    ----------
+    n : positive integer
+        the number of grains
+
+    seed : integer or None, optional
+        the seed of the random generator
+    """
+    rng = np.random.RandomState(seed)
+    return rng.lognormal(mean=np.log(35), sigma=np.log(1.6), size=n)
+
+
+def bimodal_dataset(n, seed=None, fraction=0.6):
+    """ Returns n apparent diameters drawn from a mixture of two lognormal
+    populations (e.g. recrystallized grains and porphyroclasts) with
+    geometric means of 20 and 80 microns.
+
+    Parameters
+    ----------
+    n : positive integer
+        the number of grains
+
+    seed : integer or None, optional
+        the seed of the random generator
+
+    fraction : scalar between 0 and 1, optional
+        the proportion of grains of the finer population. Default 0.6
+    """
+    rng = np.random.RandomState(seed)
+    n_fine = int(round(n * fraction))
+    fine = rng.lognormal(mean=np.log(20), sigma=np.log(1.4), size=n_fine)
+    coarse = rng.lognormal(mean=np.log(80), sigma=np.log(1.3), size=n - n_fine)
+    data = np.concatenate((fine, coarse))
+    rng.shuffle(data)
+    return data
+
+
+def section_dataset(n, seed=None):
+    """ Returns the apparent diameters of n grains from a random section
+    through spheres with lognormally distributed diameters (geometric mean
+    of 35 microns and MSD of 1.6), i.e. with a known 3D ground truth.
+
+    Parameters
+    ----------
+    n : positive integer
+        the number of grains
+
+    seed : integer or None, optional
+        the seed of the random generator
+    """
+    try:
+        from . import simulate
+    except ImportError:
+        import simulate
+    return simulate.section_diameters(n, shape=1.6, scale=35.0, seed=seed)
+
+
+datasets = {'lognormal': lognormal_dataset,
+            'bimodal': bimodal_dataset,
+            'section': section_dataset}
+
+
+# ============================================================================ #
+# BENCHMARK CASES                                                              #
+# ============================================================================ #
+
+
+def _modules():
+    """ Import the package modules using the non-interactive Agg backend."""
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+    try:
+        from . import averages, plot, stereology, GrainSizeTools_script
+    except ImportError:
+        import averages
+        import plot
+        import stereology
+        import GrainSizeTools_script
+    return averages, plot, stereology, GrainSizeTools_script
+
+
+def _cases():
+    """ Returns the benchmark cases as {name: (setup, function, max_size)}.
+    setup(diameters) prepares the arguments (not timed) and function(*args)
+    is the timed call. Cases are skipped for sizes above max_size because of
+    their quadratic cost (e.g. Scipy's gaussian_kde); use no_limits=True in
+    run() to force them."""
+    averages, plot, stereology, gst = _modules()
+
+    def histogram(d):
+        freq, bin_edges = np.histogram(d, bins=15, range=(0, d.max()), density=True)
+        binsize = bin_edges[1] - bin_edges[0]
+        return freq, bin_edges, binsize, bin_edges[:-1] + binsize / 2
+
+    def unfold(freq, bin_edges, binsize, mid_points):
+        return stereology.unfold_population(freq.copy(), bin_edges, binsize, mid_points)
+
+    def area_weighted(d, areas):
+        result = plot.area_weighted(d, areas)
+        plot.plt.close('all')
+        return result
+
+    def calc_shape(d):
+        result = stereology.calc_shape(d)
+        plot.plt.close('all')
+        return result
+
+    return {
+        'Saltykov': (lambda d: (d,), lambda d: stereology.Saltykov(d, numbins=15, return_data=True), None),
+        'calc_shape': (lambda d: (d,), calc_shape, None),
+        'unfold_population': (histogram, unfold, None),
+        'GCI_ci': (lambda d: (d,), averages.GCI_ci, None),
+        'freq_peak': (lambda d: (d,), averages.freq_peak, 10**5),
+        'summarize': (lambda d: (d,), gst.summarize, 10**5),
+        'area_weighted': (lambda d: (d, np.pi * (d / 2)**2), area_weighted, None),
+        'calc_diffstress': (lambda d: (d, 'quartz', 'Stipp_Tullis'), gst.calc_diffstress, None),
+    }
+
+
+# ============================================================================ #
+# RUNNER                                                                       #
+# ============================================================================ #
+
+
+def run(sizes=(10**3, 10**4, 10**5, 10**6, 10**7), cases=None, kinds=('lognormal', 'bimodal'),
+        repeat=3, seed=42, no_limits=False, verbose=True):
+    """ Run the benchmarks and returns the results.
+
+    Parameters
+    ----------
+    sizes : tuple or list of positive integers, optional
+        the number of grains of the synthetic datasets
+
+    cases : tuple or list of strings or None, optional
+        the functions to benchmark. If None, all of them
+
+    kinds : tuple or list of strings, optional
+        the type of synthetic datasets, 'lognormal', 'bimodal' and/or
+        'section'
+
+    repeat : positive integer, optional
+        the number of timed runs; the best (minimum) time is reported
+
+    seed : integer, optional
+        the seed used to generate the datasets
+
+    no_limits : bool, optional
+        if True, do not skip the slow cases at large sizes
+
+    The memoization (see the memo module) is turned off while the
+    benchmarks run, so that the repeated runs are not served from the cache.
+
+    verbose : bool, optional
+        print each result as soon as it is available
+
+    Returns
+    -------
+    a dict {'meta': {...}, 'results': {'case/kind/size': {'time': seconds,
+    'peak_mb': megabytes}}}
+    """
+
+    all_cases = _cases()
+    if cases is None:
+        cases = list(all_cases)
+    for name in cases:
+        if name not in all_cases:
+            raise ValueError('Unknown benchmark case {!r}. Choose between {}' .format(name, list(all_cases)))
+
+    results = {}
+    with memo.disabled():
+        for kind in kinds:
+            for size in sizes:
+                size = int(size)
+                diameters = datasets[kind](size, seed=seed)
+                for name in cases:
+                    setup, func, max_size = all_cases[name]
+                    key = '{}/{}/{}' .format(name, kind, size)
+                    if max_size is not None and size > max_size and not no_limits:
+                        continue
+                    args = setup(diameters)
+                    results[key] = _measure(func, args, repeat)
+                    if verbose:
+                        print('{:<40} {:>10.4f} s {:>10.1f} MB'
+                              .format(key, results[key]['time'], results[key]['peak_mb']))
+                        sys.stdout.flush()
+
+    meta = {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'repeat': repeat,
+            'seed': seed}
+
+    return {'meta': meta, 'results': results}
+
+
+def _measure(func, args, repeat):
+    """ Returns the best wall time of several runs and the peak memory
+    allocated during one extra (traced) run. Output is discarded."""
+    times = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for __ in range(repeat):
+            np.random.seed(0)  # for the Monte Carlo based methods
+            start = time.perf_counter()
+            func(*args)
+            times.append(time.perf_counter() - start)
+
+        # memory is traced apart because tracing slows down the execution
+        tracemalloc.start()
+        try:
+            func(*args)
+            __, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {'time': min(times), 'peak_mb': peak / 2**20}
+
+
+def compare(results, baseline, tolerance=0.25, mem_tolerance=0.10):
+    """ Compare benchmark results against a baseline and returns the
+    regressions.
+
+    Parameters
+    ----------
+    results, baseline : dict
+        the outputs of run() (or the 'results' entries of them)
+
+    tolerance : positive scalar, optional
+        the maximum allowed relative increase in time. Default 0.25 (25%)
+
+    mem_tolerance : positive scalar, optional
+        the maximum allowed relative increase in peak memory. Default 0.10
+
+    Returns
+    -------
+    a list of (key, metric, baseline value, new value, ratio) tuples
+    """
+
+    results = results.get('results', results)
+    baseline = baseline.get('results', baseline)
+
+    regressions = []
+    for key in sorted(set(results) & set(baseline)):
+        for metric, tol in (('time', tolerance), ('peak_mb', mem_tolerance)):
+            old, new = baseline[key][metric], results[key][metric]
+            if old > 0 and new / old > 1 + tol:
+                regressions.append((key, metric, old, new, new / old))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m grain_size_tools.benchmarks',
+                                     description='Benchmark the GrainSizeTools hot paths on synthetic datasets.')
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1e3, 1e4, 1e5, 1e6, 1e7],
+                        help='number of grains of the datasets (default: 1e3 to 1e7)')
+    parser.add_argument('--cases', nargs='+', default=None,
+                        help='functions to benchmark (default: all)')
+    parser.add_argument('--kinds', nargs='+', default=['lognormal', 'bimodal'],
+                        choices=sorted(datasets), help='synthetic datasets to use')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs (best is kept)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-limits', action='store_true',
+                        help='do not skip the quadratic-cost cases at large sizes')
+    parser.add_argument('--save', metavar='FILE', help='store the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare the results against a JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative slowdown before flagging a regression (default: 0.25)')
+    parser.add_argument('--mem-tolerance', type=float, default=0.10,
+                        help='allowed relative increase of peak memory (default: 0.10)')
+    args = parser.parse_args(argv)
+
+    results = run(sizes=[int(s) for s in args.sizes], cases=args.cases, kinds=args.kinds,
+                  repeat=args.repeat, seed=args.seed, no_limits=args.no_limits)
+
+    if args.save:
+        with open(args.save, 'w') as fh:
+            json.dump(results, fh, indent=1, sort_keys=True)
+        print('Results stored in', args.save)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        regressions = compare(results, baseline, args.tolerance, args.mem_tolerance)
+        print('=======================================')
+        if regressions:
+            print('REGRESSIONS')
+            for key, metric, old, new, ratio in regressions:
+                print('{:<40} {:<8} {:.4g} -> {:.4g} (x{:.2f})' .format(key, metric, old, new, ratio))
+            print('=======================================')
+            return 1
+        print('No regressions against', args.compare)
+        print('=======================================')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+# ============================================================================ #
+#                                                                              #
+#    This is part of the "GrainSizeTools Script"                               #
+#    A Python script for characterizing grain size from thin sections          #
+#                                                                              #
+#    Copyright (c) 2014-present   Marco A. Lopez-Sanchez                       #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License");           #
+#    you may not use this file except in compliance with the License.          #
+#    You may obtain a copy of the License at                                   #
+#                                                                              #
+#        http://www.apache.org/licenses/LICENSE-2.0                            #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS,         #
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  #
+#    See the License for the specific language governing permissions and       #
+#    limitations under the License.                                            #
+#                                                                              #
+#    Version 3.0rc                                                             #
+#    For details see: http://marcoalopez.github.io/GrainSizeTools/             #
+#    download at https://github.com/marcoalopez/GrainSizeTools/releases        #
+#                                                                              #
+# ============================================================================ #
+
+# ============================================================================ #
+# On-disk cache of parsed grain tables. Each column is stored as a .npy file   #
+# and reopened memory-mapped (zero-copy). Entries are keyed by the content     #
+# hash of the source file plus the loader options and the package version, so #
+# a modified file, a different set of options or an upgrade never returns      #
+# stale data.                                                                  #
+# ============================================================================ #
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+try:
+    from . import __version__, loader
+except ImportError:
+    import loader
+    __version__ = None
+
+
+def default_directory():
+    """ Returns the default cache location, either the GRAINSIZETOOLS_CACHE
+    environment variable or ~/.cache/grain_size_tools."""
+    return os.environ.get('GRAINSIZETOOLS_CACHE',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'grain_size_tools'))
+
+
+def file_hash(filepath, blocksize=2**20):
+    """ Returns the SHA-1 hash of the content of a file, read in blocks."""
+    h = hashlib.sha1()
+    with open(filepath, 'rb') as fh:
+        for block in iter(lambda: fh.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class DatasetCache(object):
+    """ A cache of parsed grain tables stored as memory-mapped .npy files.
+
+    Parameters
+    ----------
+    directory : string or None; optional
+        where to store the cache. If None, see default_directory()
+
+    max_bytes : positive integer or None; optional
+        the maximum size of the cache. When exceeded, the least recently
+        used entries are removed. Default: None (no limit)
+
+    Examples
+    --------
+    >>> cache = DatasetCache(max_bytes=10 * 2**30)
+    >>> dataset = cache.load('DATA/data_set.txt')
+    >>> dataset = cache.load(filepath, columns=('Area', 'FeretX', 'FeretY'), scale=0.5)
+    >>> summarize(dataset['diameters'])
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = default_directory() if directory is None else directory
+        self.max_bytes = max_bytes
+        self._hashes = {}  # {(path, size, mtime): content hash} of this session
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, filepath, **options):
+        """ Returns the cache key of a file loaded with the given options
+        (see loader.load_grains) by this version of the package."""
+        stat = os.stat(filepath)
+        id_stat = (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+        if id_stat not in self._hashes:
+            self._hashes[id_stat] = file_hash(filepath)
+        options = json.dumps(sorted(options.items()), default=str)
+        return hashlib.sha1((self._hashes[id_stat] + options + str(__version__)).encode()).hexdigest()
+
+    def load(self, filepath, **options):
+        """ Returns the columns of a grain table as a dict of read-only
+        memory-mapped arrays, parsing the file only if it is not cached yet.
+        The keyword arguments are passed to loader.load_grains."""
+        key = self.key(filepath, **options)
+        entry = os.path.join(self.directory, key)
+
+        if not os.path.exists(os.path.join(entry, 'meta.json')):
+            self._store(entry, loader.load_grains(filepath, **options), filepath)
+            self.evict(keep=entry)
+
+        return self._open(entry)
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self.directory, key, 'meta.json'))
+
+    def size(self):
+        """ Returns the size of the cache in bytes."""
+        return sum(size for __, __, size in self._entries())
+
+    def evict(self, keep=None):
+        """ Remove the least recently used entries until the cache size is
+        below max_bytes. The entry defined in keep (a path) is never removed."""
+        if self.max_bytes is None:
+            return None
+        entries = sorted(self._entries())  # oldest access first
+        total = sum(size for __, __, size in entries)
+        for __, entry, size in entries:
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+        return None
+
+    def clear(self):
+        """ Remove all the entries of the cache."""
+        for __, entry, __ in self._entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def _open(self, entry):
+        meta_path = os.path.join(entry, 'meta.json')
+        with open(meta_path) as fh:
+            meta = json.load(fh)
+        os.utime(meta_path)  # record the access for the LRU eviction
+        return {name: np.load(os.path.join(entry, 'col{}.npy' .format(i)), mmap_mode='r')
+                for i, name in enumerate(meta['columns'])}
+
+    def _store(self, entry, dataset, filepath):
+        """ Write the entry in a temporary folder and then move it to its final
+        location, so that concurrent or interrupted runs never leave a
+        partial entry behind."""
+        tmp = tempfile.mkdtemp(prefix='.tmp-', dir=self.directory)
+        try:
+            for i, name in enumerate(dataset.columns):
+                np.save(os.path.join(tmp, 'col{}.npy' .format(i)), dataset[name].to_numpy())
+            with open(os.path.join(tmp, 'meta.json'), 'w') as fh:
+                json.dump({'columns': list(dataset.columns), 'source': os.path.abspath(filepath)}, fh)
+            os.rename(tmp, entry)
+        except OSError:
+            if not os.path.exists(os.path.join(entry, 'meta.json')):
+                raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _entries(self):
+        """ Returns a list of (last access, path, size in bytes) tuples."""
+        entries = []
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            meta_path = os.path.join(entry, 'meta.json')
+            if name.startswith('.tmp-'):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                entries.append((os.path.getmtime(meta_path), entry, size))
+            except OSError:  # incomplete or removed by another process
+                continue
+        return entries
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,474 @@
+# ============================================================================ #
+#                                                                              #
+#    This is part of the "GrainSizeTools Script"                               #
+#    A Python script for characterizing grain size from thin sections          #
+#                                                                              #
+#    Copyright (c) 2014-present   Marco A. Lopez-Sanchez                       #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License");           #
+#    you may not use this file except in compliance with the License.          #
+#    You may obtain a copy of the License at                                   #
+#                                                                              #
+#        http://www.apache.org/licenses/LICENSE-2.0                            #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS,         #
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  #
+#    See the License for the specific language governing permissions and       #
+#    limitations under the License.                                            #
+#                                                                              #
+#    Version 3.0rc                                                             #
+#    For details see: http://marcoalopez.github.io/GrainSizeTools/             #
+#    download at https://github.com/marcoalopez/GrainSizeTools/releases        #
+#                                                                              #
+# ============================================================================ #
+
+# ============================================================================ #
+# Non-interactive batch processing of grain tables from the command line. It   #
+# needs no display and no keyboard input, so it can run on headless nodes:     #
+#                                                                              #
+#   grainsizetools "data/*.txt" --tasks summarize saltykov -o results.csv      #
+#   grainsizetools "data/**/*.csv" --jobs 8 --quiet -o results.npz             #
+#   grainsizetools sample.txt --tasks stress --piezometer Shimizu \            #
+#       --temperature 450                                                      #
+#                                                                              #
+# Re-runs only process new or modified files (or all of them if the tasks,     #
+# the parameters or the package version changed), see the --manifest option.   #
+# See grainsizetools --help (or python -m grain_size_tools --help) for all     #
+# the options                                                                  #
+# ============================================================================ #
+
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+try:
+    from . import GrainSizeTools_script, cache, loader, stereology
+    from . import __version__
+except ImportError:
+    import GrainSizeTools_script
+    import cache
+    import loader
+    import stereology
+    __version__ = None
+
+available_tasks = ('summarize', 'saltykov', 'shape', 'stress')
+
+default_options = {'area_column': 'Area',
+                   'scale': None,
+                   'sep': None,
+                   'ci_level': 0.95,
+                   'bandwidth': 'silverman',
+                   'precision': 0.1,
+                   'numbins': 10,
+                   'class_range': (10, 20),
+                   'phase': 'quartz',
+                   'piezometer': 'Stipp_Tullis',
+                   'average': 'rms',
+                   'correction': False,
+                   'temperature': None,
+                   'seed': None}
+
+
+def expand_paths(patterns):
+    """ Returns the sorted list of files matching a list of glob patterns
+    (recursive '**' patterns allowed), without duplicates."""
+    filepaths = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        if not matches and os.path.isfile(pattern):
+            matches = [pattern]
+        filepaths.update(path for path in matches if os.path.isfile(path))
+    return sorted(filepaths)
+
+
+def grain_average(diameters, average):
+    """ Returns the average grain size used to estimate the stress.
+
+    Parameters
+    ----------
+    diameters : array_like
+        the apparent diameters
+
+    average : string {'rms', 'amean', 'gmean', 'median'}
+        the type of average required by the piezometer (see the piezometer
+        notes in calc_diffstress)
+    """
+    if average == 'rms':
+        return np.sqrt(np.mean(diameters**2))
+    elif average == 'amean':
+        return np.mean(diameters)
+    elif average == 'gmean':
+        return np.exp(np.mean(np.log(diameters)))
+    elif average == 'median':
+        return np.median(diameters)
+    else:
+        raise ValueError("average must be 'rms', 'amean', 'gmean' or 'median'")
+
+
+def process_file(filepath, tasks=('summarize',), options=None):
+    """ Apply the tasks to the grains of a file and returns the results as
+    a flat dict (one row of the result table). Nothing is printed.
+
+    Parameters
+    ----------
+    filepath : string
+        the file location (.txt, .csv or .xlsx)
+
+    tasks : tuple or list of strings; optional
+        'summarize', 'saltykov', 'shape' and/or 'stress'
+
+    options : dict or None; optional
+        the parameters of the tasks, see default_options
+
+    Call functions
+    --------------
+    - loader.load_grains
+    - describe and estimate_stress (from GrainSizeTools_script)
+    - Saltykov and twostep_fit (from stereology)
+
+    Returns
+    -------
+    A dict {column name: value}
+    """
+
+    opts = dict(default_options)
+    opts.update(options or {})
+    if opts['seed'] is not None:
+        np.random.seed(opts['seed'])  # for the Monte Carlo based methods
+
+    dataset = loader.load_grains(filepath, columns=(opts['area_column'],), scale=opts['scale'],
+                                 sep=opts['sep'], area_column=opts['area_column'])
+    diameters = dataset['diameters'].to_numpy()
+    diameters = diameters[np.isfinite(diameters) & (diameters > 0)]
+
+    row = {'filepath': filepath, 'n': len(diameters)}
+
+    if 'summarize' in tasks:
+        results = GrainSizeTools_script.describe(diameters, ci_level=opts['ci_level'],
+                                                 bandwidth=opts['bandwidth'],
+                                                 precision=opts['precision'])
+        for name in ('amean', 'gmean', 'median'):
+            row[name] = results[name]
+            row[name + '_low'], row[name + '_high'] = results[name + '_ci']
+        row['amean_method'] = results['amean_method']
+        row['gmean_method'] = results['gmean_method']
+        row['mode'], row['bandwidth'] = results['mode'], results['bandwidth']
+        row['sd'], row['iqr'], row['msd'] = results['sd'], results['iqr'], results['msd']
+        row['shapiro_W'], row['shapiro_p'] = results['shapiro']
+        row['shapiro_log_W'], row['shapiro_log_p'] = results['shapiro_log']
+
+    if 'saltykov' in tasks:
+        mid_points, freq3D = stereology.Saltykov(diameters, numbins=opts['numbins'], return_data=True)
+        for i, (x, y) in enumerate(zip(mid_points, freq3D)):
+            row['saltykov_mid_{:02d}' .format(i)] = x
+            row['saltykov_freq_{:02d}' .format(i)] = y
+
+    if 'shape' in tasks:
+        num_classes, params, sigma_err, __, __ = stereology.twostep_fit(diameters, opts['class_range'])
+        row['shape_classes'] = num_classes
+        row['shape_msd'], row['shape_msd_err'] = params[0], 3 * sigma_err[0]
+        row['shape_gmean'], row['shape_gmean_err'] = params[1], 3 * sigma_err[1]
+
+    if 'stress' in tasks:
+        grain_size = grain_average(diameters, opts['average'])
+        stress, __, __ = GrainSizeTools_script.estimate_stress(grain_size, opts['phase'],
+                                                               opts['piezometer'],
+                                                               opts['correction'],
+                                                               opts['temperature'])
+        row['stress_grain_size'], row['stress'] = grain_size, stress
+
+    return row
+
+
+def _process_task(filepath, tasks, options):
+    """ Worker function: process a file discarding any output and
+    returning the error message (if any) instead of raising."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            return process_file(filepath, tasks, options)
+        except Exception as error:
+            return {'filepath': filepath, 'error': '{}: {}' .format(type(error).__name__, error)}
+
+
+def run_batch(filepaths, tasks=('summarize',), jobs=1, options=None, quiet=True,
+              manifest=None, force=False, checkpoint=100):
+    """ Process a list of files, optionally in parallel, and returns the
+    results in the same order as the files. Files that cannot be processed
+    get a row with an 'error' entry instead of stopping the batch.
+
+    Parameters
+    ----------
+    filepaths : list of strings
+        the file locations
+
+    tasks : tuple or list of strings; optional
+        'summarize', 'saltykov', 'shape' and/or 'stress'
+
+    jobs : positive integer; optional
+        the number of worker processes. Default: 1 (no subprocesses)
+
+    options : dict or None; optional
+        the parameters of the tasks, see default_options
+
+    quiet : bool; optional
+        if False, print the progress. Default: True
+
+    manifest : string or None; optional
+        a JSON file recording, for each file processed, the hash of its
+        content, the tasks, the parameters and the package version used,
+        together with the results. Files already recorded with the same
+        content, tasks, parameters and version are not processed again.
+        Default: None (no manifest, process all the files)
+
+    force : bool; optional
+        if True, process all the files even if they are recorded in the
+        manifest (the manifest is updated). Default: False
+
+    checkpoint : positive integer; optional
+        the manifest is stored (atomically) every time this number of files
+        have been processed, so that an interrupted run resumes from the
+        last checkpoint. Default: 100
+
+    Examples
+    --------
+    >>> rows = run_batch(expand_paths(['data/*.txt']), tasks=('summarize', 'stress'), jobs=4)
+    >>> rows = run_batch(filepaths, manifest='results_manifest.json')
+    >>> write_table(rows, 'results.csv')
+
+    Returns
+    -------
+    A list of dicts (see process_file)
+    """
+
+    for task in tasks:
+        if task not in available_tasks:
+            raise ValueError('Unknown task {!r}. Choose between {}' .format(task, available_tasks))
+
+    rows = [None] * len(filepaths)
+    pending = list(range(len(filepaths)))
+    done = 0
+
+    if manifest is not None:
+        entries = read_manifest(manifest)
+        params = dict(default_options)
+        params.update(options or {})
+        params = json.loads(json.dumps(params))  # as stored (e.g. tuples as lists)
+        records = {}
+        pending = []
+        for i, filepath in enumerate(filepaths):
+            path = os.path.abspath(filepath)
+            records[i] = _file_record(path, entries.get(path), tasks, params)
+            entry = entries.get(path)
+            # entries with missing keys (e.g. older manifests) count as changed
+            if not force and entry is not None and 'row' in entry and \
+                    all(entry.get(key) == records[i][key] for key in records[i] if key not in ('size', 'mtime')):
+                entry.update(size=records[i]['size'], mtime=records[i]['mtime'])  # avoid rehashing
+                rows[i] = dict(entry['row'], filepath=filepath)
+            else:
+                pending.append(i)
+        if quiet is False:
+            print('{} files up to date, {} to process' .format(len(filepaths) - len(pending), len(pending)))
+
+    def collect(i, row):
+        nonlocal done
+        rows[i] = row
+        done += 1
+        if 'error' in row:
+            print('{}: {}' .format(row['filepath'], row['error']), file=sys.stderr)
+        elif quiet is False:
+            print('[{}/{}] {}' .format(done, len(pending), row['filepath']))
+        if manifest is not None and 'error' not in row:
+            entries[os.path.abspath(row['filepath'])] = dict(records[i], row=_to_builtin(row))
+            if done % checkpoint == 0:
+                write_manifest(manifest, entries)
+
+    try:
+        if jobs == 1:
+            for i in pending:
+                collect(i, _process_task(filepaths[i], tasks, options))
+        else:
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = {executor.submit(_process_task, filepaths[i], tasks, options): i for i in pending}
+                for future in as_completed(futures):
+                    collect(futures[future], future.result())
+    finally:
+        if manifest is not None:
+            write_manifest(manifest, entries)  # last checkpoint, also if interrupted
+
+    return rows
+
+
+def _file_record(path, entry, tasks, params):
+    """ Returns the manifest record of a file. The content hash is computed
+    only if the size or the modification time of the file changed since it
+    was recorded."""
+    stat = os.stat(path)
+    size, mtime = stat.st_size, stat.st_mtime_ns
+    if entry is not None and entry.get('size') == size and entry.get('mtime') == mtime \
+            and entry.get('hash') is not None:
+        content_hash = entry['hash']
+    else:
+        content_hash = cache.file_hash(path)
+
+    return {'hash': content_hash,
+            'size': size,
+            'mtime': mtime,
+            'tasks': sorted(tasks),
+            'params': params,
+            'version': __version__}
+
+
+def _to_builtin(row):
+    """ Convert the numpy scalars of a row to Python types (JSON)."""
+    return {key: value.item() if isinstance(value, np.generic) else value for key, value in row.items()}
+
+
+def read_manifest(filepath):
+    """ Returns the entries of a manifest file as a dict {absolute file
+    path: record}, or an empty dict if the file does not exist."""
+    try:
+        with open(filepath) as fh:
+            return json.load(fh)['files']
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def write_manifest(filepath, entries):
+    """ Store the manifest atomically so that an interrupted run never
+    leaves a truncated file behind."""
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, tmp = tempfile.mkstemp(prefix='.tmp-', suffix='.json', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            json.dump({'files': entries}, fh, indent=1, sort_keys=True)
+        os.replace(tmp, filepath)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def write_table(rows, filepath):
+    """ Store the results as a single table, either a CSV file or a
+    numpy .npz file with one array per column (depending on the file
+    extension). Missing values are stored as NaN (or empty strings).
+    The file is replaced atomically."""
+
+    import pandas as pd
+
+    table = pd.DataFrame(rows)
+    if 'error' not in table:
+        table['error'] = ''
+    table['error'] = table['error'].fillna('')
+
+    directory = os.path.dirname(os.path.abspath(filepath))
+    extension = os.path.splitext(filepath)[1].lower()
+    fd, tmp = tempfile.mkstemp(prefix='.tmp-', suffix=extension, dir=directory)
+    os.close(fd)
+    try:
+        if extension == '.npz':
+            columns = {}
+            for name in table.columns:
+                if pd.api.types.is_numeric_dtype(table[name]):
+                    columns[name] = table[name].to_numpy()
+                else:
+                    columns[name] = table[name].fillna('').astype(str).to_numpy(dtype=str)
+            np.savez(tmp, **columns)
+        else:
+            table.to_csv(tmp, index=False)
+        os.replace(tmp, filepath)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='grainsizetools',
+                                     description='Batch grain size analysis of grain tables (ImageJ, MTEX...).')
+    parser.add_argument('files', nargs='+', help='input files or glob patterns (e.g. "data/**/*.txt")')
+    parser.add_argument('-t', '--tasks', nargs='+', default=['summarize'], choices=available_tasks,
+                        help='analyses to perform (default: summarize)')
+    parser.add_argument('-o', '--output', default='results.csv',
+                        help='result table, .csv or .npz (default: results.csv)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of worker processes (default: 1)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not print the progress')
+    parser.add_argument('--manifest', help='record of the files already processed, to skip them if unchanged '
+                                           '(default: the output name ending in _manifest.json)')
+    parser.add_argument('--force', action='store_true', help='process all the files, even if unchanged')
+    parser.add_argument('--checkpoint', type=int, default=100,
+                        help='store the manifest every N files processed (default: 100)')
+
+    group = parser.add_argument_group('input')
+    group.add_argument('--area-column', default='Area', help='column with the sectional areas (default: Area)')
+    group.add_argument('--scale', type=float, help='pixel size in microns, if the areas are in pixels')
+    group.add_argument('--sep', help='column separator (default: tab for .txt, comma for .csv)')
+
+    group = parser.add_argument_group('summarize')
+    group.add_argument('--ci-level', type=float, default=0.95, help='confidence level (default: 0.95)')
+    group.add_argument('--bandwidth', default='silverman',
+                       help="KDE bandwidth, 'silverman', 'scott' or a number (default: silverman)")
+    group.add_argument('--precision', type=float, default=0.1, help='precision of the KDE mode (default: 0.1)')
+    group.add_argument('--seed', type=int, help='seed for the Monte Carlo based estimates')
+
+    group = parser.add_argument_group('saltykov and shape')
+    group.add_argument('--numbins', type=int, default=10, help='number of classes for saltykov (default: 10)')
+    group.add_argument('--class-range', type=int, nargs=2, default=[10, 20], metavar=('MIN', 'MAX'),
+                       help='range of classes tested by shape (default: 10 20)')
+
+    group = parser.add_argument_group('stress')
+    group.add_argument('--phase', default='quartz', choices=('quartz', 'olivine', 'calcite', 'feldspar'))
+    group.add_argument('--piezometer', default='Stipp_Tullis', help='piezometric relation (default: Stipp_Tullis)')
+    group.add_argument('--average', default='rms', choices=('rms', 'amean', 'gmean', 'median'),
+                       help='average grain size required by the piezometer (default: rms)')
+    group.add_argument('--correction', action='store_true', help='correct the stress for plane strain')
+    group.add_argument('--temperature', type=float, help='deformation temperature in C (Shimizu piezometer)')
+    args = parser.parse_args(argv)
+
+    if args.jobs < 1:
+        parser.error('--jobs must be a positive integer')
+    if args.checkpoint < 1:
+        parser.error('--checkpoint must be a positive integer')
+    if 'stress' in args.tasks and args.piezometer == 'Shimizu' and args.temperature is None:
+        parser.error('the Shimizu piezometer requires --temperature')
+    try:
+        bandwidth = float(args.bandwidth)
+    except ValueError:
+        bandwidth = args.bandwidth
+
+    filepaths = expand_paths(args.files)
+    if not filepaths:
+        parser.error('no input files found')
+
+    options = {'area_column': args.area_column, 'scale': args.scale, 'sep': args.sep,
+               'ci_level': args.ci_level, 'bandwidth': bandwidth, 'precision': args.precision,
+               'numbins': args.numbins, 'class_range': tuple(args.class_range),
+               'phase': args.phase, 'piezometer': args.piezometer, 'average': args.average,
+               'correction': args.correction, 'temperature': args.temperature, 'seed': args.seed}
+
+    if args.manifest is None:
+        args.manifest = os.path.splitext(args.output)[0] + '_manifest.json'
+
+    rows = run_batch(filepaths, args.tasks, args.jobs, options, quiet=args.quiet,
+                     manifest=args.manifest, force=args.force, checkpoint=args.checkpoint)
+    write_table(rows, args.output)
+
+    failed = sum(1 for row in rows if 'error' in row)
+    if not args.quiet:
+        print('{} files processed ({} failed). Results stored in {}'
+              .format(len(rows), failed, args.output))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
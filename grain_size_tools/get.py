@@ -18,11 +18,13 @@ List of main functions
 summarize              -> get the properties of the data population
 conf_interval          -> estimate a robust confidence interval using the t-distribution
 calc_diffstress        -> estimate diff. stress from grain size using piezometers
+loader.load_grains     -> load a grain table (only the columns needed) and compute the ECDs
 
 plot.distribution      -> visualize the distribution of grain sizes and locate the averages
 plot.qq_plot           -> test the lognormality of the dataset (q-q plot + Shapiro-Wilk test)
 plot.area_weighted     -> visualize the area-weighed distribution of grain sizes
 plot.normalized        -> visualize a normalized distribution of grain sizes
+plot.normalized_multi  -> compare the normalized distributions of several samples
 
 stereology.Saltykov    -> approximate the actual grain size distribution via the Saltykov method
 stereology.calc_shape  -> approximate the lognormal shape of the actual distribution
@@ -43,6 +45,4 @@ def functions_list():
 
 
 if __name__ == '__main__':
-    pass
-else:
     print(welcome)
@@ -0,0 +1,491 @@
+# ============================================================================ #
+#                                                                              #
+#    This is part of the "GrainSizeTools Script"                               #
+#    A Python script for characterizing grain size from thin sections          #
+#                                                                              #
+#    Copyright (c) 2014-present   Marco A. Lopez-Sanchez                       #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License");           #
+#    you may not use this file except in compliance with the License.          #
+#    You may obtain a copy of the License at                                   #
+#                                                                              #
+#        http://www.apache.org/licenses/LICENSE-2.0                            #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS,         #
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  #
+#    See the License for the specific language governing permissions and       #
+#    limitations under the License.                                            #
+#                                                                              #
+#    Version 3.0rc                                                             #
+#    For details see: http://marcoalopez.github.io/GrainSizeTools/             #
+#    download at https://github.com/marcoalopez/GrainSizeTools/releases        #
+#                                                                              #
+# ============================================================================ #
+
+# ============================================================================ #
+# Functions to load the grain tables exported by ImageJ, MTEX or similar       #
+# applications (one grain per row) reading only the columns needed, including  #
+# mosaics acquired as several (overlapping) tiles.                             #
+# ============================================================================ #
+
+import collections
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# columns (ImageJ names) with lengths or areas, used to convert from pixels
+# to microns. Any other column (e.g. Circ., AR, FeretAngle) is dimensionless
+area_columns = ('Area',)
+length_columns = ('Perim.', 'Feret', 'FeretX', 'FeretY', 'MinFeret', 'Major', 'Minor',
+                  'X', 'Y', 'XM', 'YM', 'BX', 'BY', 'Width', 'Height')
+
+
+def load_grains(filepath=None, columns=('Area',), diameters=True, scale=None,
+                dtype='float64', sep=None, area_column='Area', sheet_name=0):
+    """ Load a table of grains reading only the columns requested with
+    explicit data types, and compute the equivalent circular diameters (ECD)
+    from the sectional areas during the load.
+
+    Parameters
+    ----------
+    filepath : string or None; optional
+        the file location (.txt, .csv or .xlsx). If None, a file selection
+        dialog is shown
+
+    columns : tuple or list of strings; optional
+        the columns to read. Default: ('Area',)
+
+    diameters : bool; optional
+        if True (default) add a 'diameters' column with the ECD estimated
+        from the area_column as 2 * sqrt(area / pi)
+
+    scale : positive scalar or None; optional
+        the size of the pixel in microns. If defined, lengths (e.g. Feret,
+        FeretX) are multiplied by scale and areas by scale**2. Default: None,
+        i.e. the data is already in microns
+
+    dtype : string or numpy dtype; optional
+        the data type of the columns, e.g. 'float32' to halve the memory
+        used. Default: 'float64'
+
+    sep : string or None; optional
+        the column separator. If None, tab for .txt files and comma for
+        .csv files
+
+    area_column : string; optional
+        the name of the column with the sectional areas. Default: 'Area'
+
+    sheet_name : string or integer; optional
+        the Excel sheet to read (.xlsx files only). Default: the first one
+
+    Examples
+    --------
+    >>> dataset = load_grains('DATA/data_set.txt')
+    >>> dataset = load_grains('sample.csv', columns=('Area', 'FeretX', 'FeretY'), scale=0.5)
+    >>> dataset = load_grains(filepath, dtype='float32')
+
+    Returns
+    -------
+    A pandas DataFrame with the requested columns (plus 'diameters')
+    """
+
+    import pandas as pd
+
+    if filepath is None:
+        try:
+            from .GrainSizeTools_script import get_filepath
+        except ImportError:
+            from GrainSizeTools_script import get_filepath
+        filepath = get_filepath()
+
+    columns = list(columns)
+    if diameters is True and area_column not in columns:
+        columns.append(area_column)
+    dtypes = {column: dtype for column in columns}
+
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension in ('.xlsx', '.xls'):
+        dataset = pd.read_excel(filepath, sheet_name=sheet_name, usecols=columns, dtype=dtypes)
+    else:
+        if sep is None:
+            sep = ',' if extension == '.csv' else '\t'
+        dataset = pd.read_csv(filepath, sep=sep, usecols=columns, dtype=dtypes, engine='c')
+
+    if scale is not None:
+        for column in columns:
+            if column in area_columns or column == area_column:
+                dataset[column] *= scale**2
+            elif column in length_columns:
+                dataset[column] *= scale
+
+    if diameters is True:
+        dataset['diameters'] = area_to_ecd(dataset[area_column].to_numpy())
+
+    return dataset
+
+
+def iter_diameters(filepath, chunksize=2**20, area_column='Area', ecd=True, scale=None,
+                   dtype='float64', sep=None):
+    """ Read a (text) grain table in chunks and yield the diameters of each
+    chunk, so that files larger than the available memory can be processed.
+
+    Parameters
+    ----------
+    filepath : string
+        the file location (.txt or .csv)
+
+    chunksize : positive integer; optional
+        the number of grains (rows) per chunk. Default: 2**20
+
+    area_column : string; optional
+        the column to read. Default: 'Area'
+
+    ecd : bool; optional
+        if True (default) the column contains areas and the equivalent
+        circular diameters are computed. If False, the column already
+        contains diameters
+
+    scale : positive scalar or None; optional
+        the size of the pixel in microns. Default: None
+
+    dtype : string or numpy dtype; optional
+        the data type of the column. Default: 'float64'
+
+    sep : string or None; optional
+        the column separator. If None, tab for .txt files and comma for
+        .csv files
+
+    Yields
+    ------
+    numpy arrays with the diameters of each chunk (missing values removed)
+    """
+
+    import pandas as pd
+
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension in ('.xlsx', '.xls'):
+        raise ValueError('Excel files cannot be read in chunks, use load_grains instead')
+    if sep is None:
+        sep = ',' if extension == '.csv' else '\t'
+
+    reader = pd.read_csv(filepath, sep=sep, usecols=[area_column], dtype={area_column: dtype},
+                         engine='c', chunksize=chunksize)
+    try:
+        for chunk in reader:
+            values = chunk[area_column].to_numpy()
+            values = values[~np.isnan(values)]
+            if ecd is True:
+                area_to_ecd(values, out=values)
+            if scale is not None:
+                values *= scale
+            yield values
+    finally:
+        reader.close()
+
+
+def histogram_from_file(filepath, numbins=10, max_diameter=None, left_edge=0, **reader_options):
+    """ Returns the histogram of the apparent diameters stored in a file
+    accumulating the counts chunk by chunk with fixed class edges. Memory
+    use does not depend on the size of the file. Use it along with
+    stereology.Saltykov_from_counts to apply the Saltykov method to
+    datasets that do not fit in memory.
+
+    Parameters
+    ----------
+    filepath : string
+        the file location (.txt or .csv)
+
+    numbins : positive integer; optional
+        the number of classes. Default: 10
+
+    max_diameter : positive scalar or None; optional
+        the right edge of the histogram. If None (default), the file is
+        read twice, the first time to find the maximum diameter
+
+    left_edge : positive scalar or 'min'; optional
+        the left edge of the histogram. Default: zero
+
+    **reader_options :
+        keyword arguments passed to iter_diameters (e.g. chunksize, scale)
+
+    Call functions
+    --------------
+    - iter_diameters
+
+    Examples
+    --------
+    >>> counts, bin_edges = histogram_from_file('huge_file.txt', numbins=15)
+    >>> counts, bin_edges = histogram_from_file('huge_file.txt', numbins=15, max_diameter=250)
+
+    Returns
+    -------
+    the counts (integer array) and the bin edges
+    """
+
+    if isinstance(numbins, int) is False or numbins <= 0:
+        raise ValueError('Numbins must be a positive integer')
+
+    # cheap first pass to define the range (if needed)
+    if max_diameter is None or left_edge == 'min':
+        low, high = np.inf, -np.inf
+        for chunk in iter_diameters(filepath, **reader_options):
+            if chunk.size > 0:
+                low, high = min(low, chunk.min()), max(high, chunk.max())
+        if max_diameter is None:
+            max_diameter = high
+        if left_edge == 'min':
+            left_edge = low
+
+    counts = accumulate_histogram(iter_diameters(filepath, **reader_options),
+                                  numbins, (left_edge, max_diameter))
+
+    return counts, np.linspace(left_edge, max_diameter, numbins + 1)
+
+
+def accumulate_histogram(chunks, numbins, hist_range):
+    """ Returns the counts of a histogram with fixed (evenly spaced) edges
+    accumulated over an iterable of arrays. The result is identical to the
+    histogram of the concatenated arrays.
+
+    Parameters
+    ----------
+    chunks : iterable of array_like
+        the data
+
+    numbins : positive integer
+        the number of classes
+
+    hist_range : tuple with two values
+        the left and right edges of the histogram
+    """
+
+    counts = np.zeros(numbins, dtype=np.int64)
+    for chunk in chunks:
+        counts += np.histogram(chunk, bins=numbins, range=hist_range)[0]
+
+    return counts
+
+
+def iter_mosaic(filepaths, offsets=None, tolerance=1.0, area_tolerance=0.05, jobs=2,
+                max_pending=None, overlap=None, columns=('Area', 'FeretX', 'FeretY'),
+                x_column='FeretX', y_column='FeretY', area_column='Area', **load_options):
+    """ Load the grain tables of the tiles of a mosaic and yield them one by
+    one without the grains already found in previous tiles (the grains
+    crossing the borders of the tiles appear in several tables). The tiles
+    are read in parallel but at most max_pending are loaded ahead, so memory
+    use does not grow with the number of tiles.
+
+    Two grains of different tiles are the same grain when their positions
+    differ less than tolerance and their areas less than area_tolerance
+    (relative). They are found through a spatial hash: the positions of the
+    grains already accepted are stored by cell of a grid with cells of size
+    tolerance, so each grain is only compared with the grains of its cell
+    and the neighbouring ones. If the width of the overlap between the tiles
+    is known, only the grains near the border of each tile can be
+    duplicated, and only those are compared and stored, so that the memory
+    used is proportional to the seams rather than to the whole section.
+
+    Parameters
+    ----------
+    filepaths : list of strings
+        the grain tables of the tiles (.txt, .csv or .xlsx)
+
+    offsets : list of (x, y) tuples or None; optional
+        the position of each tile in the mosaic, added to the coordinates
+        of its grains. Default None: the coordinates are already global
+
+    tolerance : positive scalar; optional
+        the maximum difference in position of duplicated grains (same units
+        as the coordinates after scaling). Default: 1.0
+
+    area_tolerance : positive scalar; optional
+        the maximum relative difference in area of duplicated grains.
+        Default: 0.05 (5 %)
+
+    jobs : positive integer; optional
+        the number of tiles read at the same time. Default: 2
+
+    max_pending : positive integer or None; optional
+        the maximum number of tiles loaded but not yet yielded. Default: None
+        (2 * jobs)
+
+    overlap : positive scalar or None; optional
+        the maximum width of the overlap between neighbouring tiles. If
+        defined, only the grains within overlap + tolerance of the border of
+        their tile (the bounding box of its grains) are checked. Default:
+        None (all the grains)
+
+    columns : tuple or list of strings; optional
+        the columns to read, they must include the coordinates and the areas
+
+    x_column, y_column, area_column : strings; optional
+        the names of the columns with the coordinates and the areas
+
+    **load_options :
+        keyword arguments passed to load_grains (e.g. scale, dtype, sep)
+
+    Call functions
+    --------------
+    - load_grains
+
+    Yields
+    ------
+    a pandas DataFrame per tile with the grains not seen before, the
+    'diameters' column, and the index of the tile ('tile'). The number of
+    grains removed is stored in dataset.attrs['duplicates']
+    """
+
+    filepaths = list(filepaths)
+    if offsets is not None and len(offsets) != len(filepaths):
+        raise ValueError('There must be one offset per tile')
+    if tolerance <= 0 or area_tolerance < 0:
+        raise ValueError('The tolerances must be positive')
+    if overlap is not None and overlap < 0:
+        raise ValueError('overlap must be positive')
+    columns = list(columns)
+    for column in (x_column, y_column, area_column):
+        if column not in columns:
+            columns.append(column)
+    max_pending = 2 * jobs if max_pending is None else max(max_pending, 1)
+
+    seen = _GrainHash(tolerance, area_tolerance)
+    files = iter(filepaths)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+
+        def submit(filepath):
+            return executor.submit(load_grains, filepath, columns, area_column=area_column,
+                                   **load_options)
+
+        pending = collections.deque(submit(filepath) for filepath in itertools.islice(files, max_pending))
+        tile = 0
+        while pending:
+            dataset = pending.popleft().result()
+            filepath = next(files, None)
+            if filepath is not None:  # keep the queue full
+                pending.append(submit(filepath))
+
+            if offsets is not None:
+                dataset[x_column] += offsets[tile][0]
+                dataset[y_column] += offsets[tile][1]
+            x, y = dataset[x_column].to_numpy(), dataset[y_column].to_numpy()
+            border = None
+            if overlap is not None and len(dataset) > 0:
+                margin = overlap + tolerance
+                border = ((x - x.min() <= margin) | (x.max() - x <= margin) |
+                          (y - y.min() <= margin) | (y.max() - y <= margin))
+            duplicated = seen.add(x, y, dataset[area_column].to_numpy(), border)
+            dataset = dataset[~duplicated].reset_index(drop=True)
+            dataset['tile'] = tile
+            dataset.attrs['duplicates'] = int(np.count_nonzero(duplicated))
+            tile += 1
+            yield dataset
+
+
+def load_mosaic(filepaths, offsets=None, tolerance=1.0, area_tolerance=0.05, jobs=2, **options):
+    """ Load the grain tables of the tiles of a mosaic and merge them into
+    a single table without duplicated grains. See iter_mosaic for the
+    parameters.
+
+    Examples
+    --------
+    >>> dataset = load_mosaic(glob.glob('section_A/tile_*.txt'), tolerance=0.5, jobs=4)
+    >>> dataset = load_mosaic(files, offsets=[(0, 0), (1900, 0), (0, 1400), (1900, 1400)])
+    >>> summarize(GrainPopulation(dataset['diameters']))
+
+    Returns
+    -------
+    A pandas DataFrame with the grains of all the tiles (the column 'tile'
+    stores the index of the tile of each grain). The number of duplicated
+    grains removed is stored in dataset.attrs['duplicates']
+    """
+
+    import pandas as pd
+
+    frames = list(iter_mosaic(filepaths, offsets, tolerance, area_tolerance, jobs, **options))
+    dataset = pd.concat(frames, ignore_index=True)
+    dataset.attrs['duplicates'] = sum(frame.attrs['duplicates'] for frame in frames)
+
+    return dataset
+
+
+class _GrainHash(object):
+    """ The positions and areas of the grains accepted so far stored in a
+    spatial hash (sorted cell keys) to find duplicated grains."""
+
+    def __init__(self, tolerance, area_tolerance):
+        self.tolerance, self.area_tolerance = tolerance, area_tolerance
+        self.keys = np.empty(0, dtype=np.int64)
+        self.values = np.empty((3, 0))  # x, y, area sorted by key
+
+    def _cells(self, x, y):
+        return np.floor(x / self.tolerance).astype(np.int64), np.floor(y / self.tolerance).astype(np.int64)
+
+    def add(self, x, y, area, candidates=None):
+        """ Returns whether each grain was already in the hash, and adds the
+        new ones. If candidates (bool array) is defined, only those grains
+        are looked up and added."""
+        x, y, area = (np.asarray(v, dtype='float64') for v in (x, y, area))
+        duplicated = np.zeros(len(x), dtype=bool)
+        if candidates is not None:
+            index = np.flatnonzero(candidates)
+            duplicated[index] = self.add(x[index], y[index], area[index])
+            return duplicated
+        qx, qy = self._cells(x, y)
+
+        if len(self.keys) > 0:
+            X, Y, A = self.values
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    keys = (qx + dx) * 2**32 + (qy + dy)
+                    lower = np.searchsorted(self.keys, keys, side='left')
+                    upper = np.searchsorted(self.keys, keys, side='right')
+                    for j in range(int((upper - lower).max(initial=0))):
+                        found = np.flatnonzero(upper - lower > j)
+                        k = lower[found] + j
+                        same = ((np.abs(x[found] - X[k]) <= self.tolerance) &
+                                (np.abs(y[found] - Y[k]) <= self.tolerance) &
+                                (np.abs(area[found] - A[k]) <= self.area_tolerance * np.maximum(area[found], A[k])))
+                        duplicated[found[same]] = True
+
+        # merge the new grains (sorted by key) into the sorted arrays, in
+        # linear time instead of sorting again all the grains
+        new = np.flatnonzero(~duplicated)
+        keys = qx[new] * 2**32 + qy[new]
+        order = np.argsort(keys, kind='stable')
+        keys, new = keys[order], new[order]
+        position = np.searchsorted(self.keys, keys, side='right')
+        self.keys = np.insert(self.keys, position, keys)
+        self.values = np.insert(self.values, position, np.vstack((x[new], y[new], area[new])), axis=1)
+
+        return duplicated
+
+
+def area_to_ecd(areas, out=None):
+    """ Returns the equivalent circular diameters 2 * sqrt(area / pi) of the
+    sectional areas without creating intermediate arrays.
+
+    Parameters
+    ----------
+    areas : array_like
+        the sectional areas
+
+    out : numpy array or None; optional
+        an array where to store the result (it can be areas itself to
+        compute the diameters in place)
+    """
+
+    areas = np.asarray(areas)
+    if out is None:
+        out = np.empty_like(areas, dtype=np.result_type(areas, np.float32))
+    np.divide(areas, np.pi, out=out)
+    np.sqrt(out, out=out)
+    out *= 2
+
+    return out
+
+
+if __name__ == '__main__':
+    pass
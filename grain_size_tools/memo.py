@@ -0,0 +1,277 @@
+# ============================================================================ #
+#                                                                              #
+#    This is part of the "GrainSizeTools Script"                               #
+#    A Python script for characterizing grain size from thin sections          #
+#                                                                              #
+#    Copyright (c) 2014-present   Marco A. Lopez-Sanchez                       #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License");           #
+#    you may not use this file except in compliance with the License.          #
+#    You may obtain a copy of the License at                                   #
+#                                                                              #
+#        http://www.apache.org/licenses/LICENSE-2.0                            #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS,         #
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  #
+#    See the License for the specific language governing permissions and       #
+#    limitations under the License.                                            #
+#                                                                              #
+#    Version 3.0rc                                                             #
+#    For details see: http://marcoalopez.github.io/GrainSizeTools/             #
+#    download at https://github.com/marcoalopez/GrainSizeTools/releases        #
+#                                                                              #
+# ============================================================================ #
+
+# ============================================================================ #
+# Opt-in memoization of the expensive computations (the statistics behind      #
+# summarize, the two-step fits of calc_shape, and the Saltykov output), so     #
+# that repeating a call on the same data with the same parameters returns the  #
+# stored result. It is disabled by default and can be enabled either setting   #
+# the environment variable GRAINSIZETOOLS_MEMO=1 or with:                      #
+#                                                                              #
+#   memo.enable(max_entries=256, directory='~/.cache/grain_size_tools/memo')   #
+#                                                                              #
+# Results are keyed by a fingerprint of the arrays (dtype, shape and hash of   #
+# the data) plus the arguments. Functions that use random numbers (e.g. the    #
+# Monte Carlo confidence intervals) are also keyed by the state of the Numpy   #
+# global random generator, so seeding (np.random.seed) before the call gives   #
+# cache hits, and the state after the call is restored on each hit.            #
+# ============================================================================ #
+
+import collections
+import contextlib
+import copy
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+import threading
+
+import numpy as np
+
+try:
+    from . import __version__
+except ImportError:
+    __version__ = None
+
+_enabled = os.environ.get('GRAINSIZETOOLS_MEMO', '').lower() not in ('', '0', 'false', 'no')
+_max_entries = 128
+_directory = None
+_cache = collections.OrderedDict()  # {key: (result, random state after the call)}
+_stats = {'hits': 0, 'misses': 0}
+_lock = threading.Lock()
+_local = threading.local()  # depth of nested memoized calls
+
+
+def enable(max_entries=128, directory=None):
+    """ Start memoizing the results.
+
+    Parameters
+    ----------
+    max_entries : positive integer, optional
+        the maximum number of results kept in memory. When exceeded, the
+        least recently used results are discarded. Default 128
+
+    directory : string or None, optional
+        if defined, the results are also stored in this folder (as pickle
+        files) and reused in later sessions. Default None (memory only)
+    """
+    global _enabled, _max_entries, _directory
+    if isinstance(max_entries, int) is False or max_entries < 1:
+        raise ValueError('max_entries must be a positive integer')
+    _max_entries = max_entries
+    _directory = None if directory is None else os.path.expanduser(directory)
+    if _directory is not None:
+        os.makedirs(_directory, exist_ok=True)
+    _enabled = True
+    _trim()
+
+
+def disable():
+    """ Stop memoizing the results (the stored results are kept)."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+@contextlib.contextmanager
+def disabled():
+    """ Context manager that turns off the memoization within the block and
+    restores the previous state afterwards, e.g. to time the actual
+    computations.
+
+    Examples
+    --------
+    >>> with memo.disabled():
+    ...     summarize(diameters)
+    """
+    global _enabled
+    previous, _enabled = _enabled, False
+    try:
+        yield
+    finally:
+        _enabled = previous
+
+
+def clear(disk=True):
+    """ Remove the results stored in memory and, if disk is True, those
+    stored in the folder defined in enable()."""
+    with _lock:
+        _cache.clear()
+        _stats.update(hits=0, misses=0)
+    if disk and _directory is not None and os.path.isdir(_directory):
+        for name in os.listdir(_directory):
+            if name.endswith('.pkl'):
+                os.remove(os.path.join(_directory, name))
+
+
+def info():
+    """ Returns a dict with the number of 'hits', 'misses' and 'entries'
+    (results kept in memory)."""
+    with _lock:
+        return dict(_stats, entries=len(_cache))
+
+
+def fingerprint(array):
+    """ Returns a fingerprint of an array: its dtype, its shape and a hash
+    of its data."""
+    array = np.ascontiguousarray(array)
+    digest = hashlib.blake2b(array.view(np.uint8).reshape(-1), digest_size=16).hexdigest()
+    return 'array({}, {}, {})' .format(array.dtype.str, array.shape, digest)
+
+
+def _normalize(value):
+    """ Returns a string representation of an argument that is equal for
+    equal values (arrays are replaced by their fingerprint)."""
+    if isinstance(value, np.ndarray) or (hasattr(value, '__array__') and not np.isscalar(value)):
+        return fingerprint(np.asarray(value))
+    if isinstance(value, (tuple, list)):
+        return '({})' .format(', '.join(_normalize(v) for v in value))
+    if isinstance(value, dict):
+        return '{{{}}}' .format(', '.join('{}: {}' .format(_normalize(k), _normalize(v))
+                                          for k, v in sorted(value.items(), key=lambda item: repr(item[0]))))
+    if isinstance(value, np.generic):
+        value = value.item()
+    return repr(value)
+
+
+def _random_state():
+    """ Returns a hash of the state of the Numpy global random generator."""
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    h = hashlib.blake2b(keys.tobytes(), digest_size=16)
+    h.update(repr((name, pos, has_gauss, cached_gaussian)).encode())
+    return h.hexdigest()
+
+
+def memoize(random=False, cacheable=None):
+    """ Decorator that memoizes a function when the memoization is enabled.
+    Memoized functions called from within another memoized function are
+    not memoized themselves (the outer result is).
+
+    Parameters
+    ----------
+    random : bool, optional
+        whether the function uses the Numpy global random generator
+
+    cacheable : callable or None, optional
+        a function that receives the arguments (as a dict, defaults
+        included) and returns False when the call must not be memoized,
+        e.g. when it creates a plot or a file
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _enabled is False or getattr(_local, 'depth', 0) > 0:
+                return func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            if cacheable is not None and not cacheable(bound.arguments):
+                return func(*args, **kwargs)
+
+            key = [__version__, func.__module__, func.__qualname__, _normalize(bound.arguments)]
+            if random:
+                key.append(_random_state())
+            key = hashlib.sha1(repr(key).encode()).hexdigest()
+
+            entry = _get(key)
+            if entry is not None:
+                result, state = entry
+                if state is not None:
+                    np.random.set_state(state)
+                return copy.deepcopy(result)
+
+            _local.depth = 1
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                _local.depth = 0
+            _put(key, (copy.deepcopy(result), np.random.get_state() if random else None))
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def _get(key):
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+            _stats['hits'] += 1
+            return entry
+
+    if _directory is not None:
+        try:
+            with open(os.path.join(_directory, key + '.pkl'), 'rb') as fh:
+                entry = pickle.load(fh)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            entry = None
+        if entry is not None:
+            with _lock:
+                _cache[key] = entry
+                _stats['hits'] += 1
+            _trim()
+            return entry
+
+    with _lock:
+        _stats['misses'] += 1
+    return None
+
+
+def _put(key, entry):
+    with _lock:
+        _cache[key] = entry
+    _trim()
+
+    if _directory is not None:
+        # write and then rename so that readers never find partial files
+        fd, tmp = tempfile.mkstemp(prefix='.tmp-', dir=_directory)
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                pickle.dump(entry, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, os.path.join(_directory, key + '.pkl'))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def _trim():
+    with _lock:
+        while len(_cache) > _max_entries:
+            _cache.popitem(last=False)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,291 @@
+# ============================================================================ #
+#                                                                              #
+#    This is part of the "GrainSizeTools Script"                               #
+#    A Python script for characterizing grain size from thin sections          #
+#                                                                              #
+#    Copyright (c) 2014-present   Marco A. Lopez-Sanchez                       #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License");           #
+#    you may not use this file except in compliance with the License.          #
+#    You may obtain a copy of the License at                                   #
+#                                                                              #
+#        http://www.apache.org/licenses/LICENSE-2.0                            #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS,         #
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  #
+#    See the License for the specific language governing permissions and       #
+#    limitations under the License.                                            #
+#                                                                              #
+#    Version 3.0rc                                                             #
+#    For details see: http://marcoalopez.github.io/GrainSizeTools/             #
+#    download at https://github.com/marcoalopez/GrainSizeTools/releases        #
+#                                                                              #
+# ============================================================================ #
+
+
+# ============================================================================ #
+# Mixtures of lognormal distributions for multimodal grain size populations,   #
+# e.g. partially recrystallized rocks with recrystallized grains and relict    #
+# grains. The mixtures are fitted by expectation-maximization (EM) on the      #
+# logarithm of the diameters:                                                  #
+#                                                                              #
+#   result = fit(dataset['diameters'], k=2)                                    #
+#   best, table = select_components(dataset['diameters'], k_max=4)             #
+#                                                                              #
+# or, to fit the actual (3D) population, on the output of the Saltykov method: #
+#                                                                              #
+#   mid_points, freqs = Saltykov(diameters, numbins=15, return_data=True)      #
+#   counts = freqs * (mid_points[1] - mid_points[0]) * len(diameters)          #
+#   result = fit(mid_points, k=2, weights=counts)                              #
+# ============================================================================ #
+
+import numbers
+
+import numpy as np
+
+try:
+    from .population import GrainPopulation
+except ImportError:
+    from population import GrainPopulation
+
+
+def fit(diameters, k=2, weights=None, n_init=5, max_iter=1000, tol=1e-8,
+        bins='auto', seed=None):
+    """ Fit a mixture of k lognormal distributions by expectation-
+    maximization (EM) on the logarithm of the diameters. All the random
+    starts are run at once as an extra dimension of the arrays, and the
+    start with the largest likelihood is returned.
+
+    Parameters
+    ----------
+    diameters : array_like or GrainPopulation
+        the diameters of the grains (or the mid points of the classes when
+        weights are defined)
+
+    k : positive integer, optional
+        the number of lognormal components. Default 2
+
+    weights : array_like or None, optional
+        the number of grains of each diameter, e.g. the frequencies of the
+        Saltykov method times the bin size and the number of grains.
+        Default None (one per diameter)
+
+    n_init : positive integer, optional
+        the number of starts. The first one spreads the components over
+        the quantiles of the data, the others start from random grains.
+        Default 5
+
+    max_iter : positive integer, optional
+        the maximum number of EM iterations. Default 1000
+
+    tol : positive scalar, optional
+        the EM stops when the relative change of the log-likelihood is
+        below this value. Default 1e-8
+
+    bins : 'auto', positive integer or None, optional
+        if an integer, the log-diameters are binned into this number of
+        classes before fitting, which makes the cost of each iteration
+        independent of the number of grains. 'auto' bins with 4096 classes
+        datasets with more than 16384 grains. None, no binning
+
+    seed : integer or None, optional
+        the seed of the random generator used for the random starts
+
+    Examples
+    --------
+    >>> result = fit(diameters, k=2)
+    >>> result['gmean'], result['msd'], result['weights']
+
+    Returns
+    -------
+    a dict with the proportion ('weights'), geometric mean ('gmean') and
+    multiplicative standard deviation ('msd') of each lognormal, sorted by
+    size; the log-likelihood ('loglik'), the 'aic' and 'bic'; and the
+    convergence diagnostics: number of iterations ('n_iter'), whether the
+    EM converged ('converged'), the log-likelihood at each iteration of the
+    best start ('history') and the final log-likelihood of every start
+    ('start_loglik')
+    """
+    if isinstance(k, int) is False or k < 1:
+        raise ValueError('k must be a positive integer')
+    if isinstance(n_init, int) is False or n_init < 1:
+        raise ValueError('n_init must be a positive integer')
+
+    x, w, log_jacobian = _prepare(diameters, weights, bins)
+    n = np.sum(w)
+    if len(x) < k:
+        raise ValueError('the number of different diameters must be at least k')
+
+    mu, var, pi = _initialize(x, w, k, n_init, np.random.RandomState(seed))
+    loglik, mu, var, pi, history, converged = _em(x, w, mu, var, pi, max_iter, tol)
+
+    best = np.argmax(loglik)
+    order = np.argsort(mu[best])
+    loglik_d = loglik[best] - log_jacobian  # likelihood of the diameters
+    num_params = 3 * k - 1
+
+    return {'k': k,
+            'weights': pi[best][order],
+            'gmean': np.exp(mu[best][order]),
+            'msd': np.exp(np.sqrt(var[best][order])),
+            'loglik': loglik_d,
+            'aic': 2 * num_params - 2 * loglik_d,
+            'bic': num_params * np.log(n) - 2 * loglik_d,
+            'n': n,
+            'n_iter': len(history[best]),
+            'converged': bool(converged[best]),
+            'history': np.array(history[best]) - log_jacobian,
+            'start_loglik': loglik - log_jacobian}
+
+
+def select_components(diameters, k_max=4, criterion='bic', **fit_options):
+    """ Fit mixtures of 1 to k_max lognormal distributions and returns the
+    one with the lowest information criterion.
+
+    Parameters
+    ----------
+    diameters : array_like or GrainPopulation
+        the diameters of the grains
+
+    k_max : positive integer, optional
+        the maximum number of lognormal components. Default 4
+
+    criterion : string, optional
+        'bic' (Bayesian information criterion) or 'aic' (Akaike). Default
+        'bic'
+
+    fit_options :
+        the options of fit (weights, n_init, max_iter, tol, bins, seed)
+
+    Examples
+    --------
+    >>> best, table = select_components(diameters, k_max=3)
+    >>> best['k']
+
+    Returns
+    -------
+    the result of fit for the best number of components and a dict with
+    the criterion for each number of components
+    """
+    if criterion not in ('bic', 'aic'):
+        raise ValueError("criterion must be 'bic' or 'aic'")
+    if isinstance(k_max, int) is False or k_max < 1:
+        raise ValueError('k_max must be a positive integer')
+
+    results = [fit(diameters, k, **fit_options) for k in range(1, k_max + 1)]
+    table = {result['k']: result[criterion] for result in results}
+    best = min(results, key=lambda result: result[criterion])
+
+    return best, table
+
+
+def mixture_pdf(x, weights, gmean, msd):
+    """ Returns the probability density of a mixture of lognormal
+    distributions, e.g. mixture_pdf(x, result['weights'], result['gmean'],
+    result['msd']) with result the output of fit."""
+    x = np.asarray(x, dtype='float64')[..., np.newaxis]
+    mu, sigma = np.log(gmean), np.log(msd)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pdf = np.exp(-0.5 * ((np.log(x) - mu) / sigma)**2) / (x * sigma * np.sqrt(2 * np.pi))
+    return np.sum(np.asarray(weights) * np.where(x > 0, pdf, 0.0), axis=-1)
+
+
+# ============================================================================ #
+# AUXILIARY FUNCTIONS                                                          #
+# ============================================================================ #
+
+
+def _prepare(diameters, weights, bins):
+    """ Returns the log-diameters, their weights and the sum of the weighted
+    log-diameters (the log of the Jacobian from log-diameters to
+    diameters)."""
+    if isinstance(diameters, GrainPopulation) and weights is None:
+        x = diameters.log
+    else:
+        x = np.asarray(diameters, dtype='float64').ravel()
+        valid = np.isfinite(x) & (x > 0)
+        if weights is not None:
+            weights = np.asarray(weights, dtype='float64').ravel()
+            if weights.shape != x.shape or np.any(weights < 0):
+                raise ValueError('weights must be one non-negative value per diameter')
+            valid &= weights > 0
+            weights = weights[valid]
+        x = np.log(x[valid])
+    w = np.ones_like(x) if weights is None else weights
+
+    if x.size == 0:
+        raise ValueError('there are no valid diameters to fit')
+    log_jacobian = np.sum(w * x)
+
+    if bins == 'auto':
+        bins = 4096 if x.size > 16384 else None
+    if bins is not None:
+        if not isinstance(bins, numbers.Integral) or bins < 1:
+            raise ValueError("bins must be 'auto', a positive integer or None")
+        counts, edges = np.histogram(x, bins=bins, weights=w)
+        centres = (edges[:-1] + edges[1:]) / 2
+        x, w = centres[counts > 0], counts[counts > 0]
+
+    return x, w, log_jacobian
+
+
+def _initialize(x, w, k, n_init, rng):
+    """ Returns the initial means, variances and proportions (arrays of
+    shape (n_init, k)) of the log-normal components."""
+    order = np.argsort(x, kind='stable')  # x is in file order unless binned
+    sorted_x = x[order]
+    cdf = np.cumsum(w[order]) / np.sum(w)
+    mean = np.sum(w * x) / np.sum(w)
+    var = np.sum(w * (x - mean)**2) / np.sum(w)
+
+    # first start over the quantiles, the others at random grains
+    q = np.vstack((((np.arange(k) + 0.5) / k)[np.newaxis, :], np.sort(rng.random_sample((n_init - 1, k)), axis=1)))
+    mu = sorted_x[np.minimum(np.searchsorted(cdf, q), len(x) - 1)]
+    var = np.full((n_init, k), max(var, 1e-6) / k**2)
+    pi = np.full((n_init, k), 1 / k)
+
+    return mu, var, pi
+
+
+def _em(x, w, mu, var, pi, max_iter, tol, min_var=1e-6):
+    """ Expectation-maximization of all the starts at once. The arrays are
+    shaped (starts, data, components); starts that converge are no longer
+    updated."""
+    n_init = mu.shape[0]
+    total = np.sum(w)
+    loglik = np.full(n_init, -np.inf)
+    history = [[] for _ in range(n_init)]
+    converged = np.zeros(n_init, dtype=bool)
+    active = np.arange(n_init)
+
+    for _ in range(max_iter):
+        # E-step: log responsibilities with the log-sum-exp trick
+        m, v, p = mu[active, np.newaxis, :], var[active, np.newaxis, :], pi[active, np.newaxis, :]
+        log_p = np.log(p) - 0.5 * np.log(2 * np.pi * v) - 0.5 * (x[:, np.newaxis] - m)**2 / v
+        max_p = np.max(log_p, axis=2, keepdims=True)
+        log_sum = max_p + np.log(np.sum(np.exp(log_p - max_p), axis=2, keepdims=True))
+        resp = np.exp(log_p - log_sum) * w[:, np.newaxis]
+        new_loglik = np.sum(w * log_sum[:, :, 0], axis=1)
+
+        # M-step
+        nk = np.maximum(np.sum(resp, axis=1), 1e-12)
+        mu[active] = np.einsum('sik,i->sk', resp, x) / nk
+        var[active] = np.maximum(np.einsum('sik,sik->sk', resp, (x[:, np.newaxis] - mu[active, np.newaxis, :])**2) / nk,
+                                 min_var)
+        pi[active] = nk / total
+
+        for start, value in zip(active, new_loglik):
+            history[start].append(value)
+        done = np.abs(new_loglik - loglik[active]) <= tol * np.abs(new_loglik)
+        loglik[active] = new_loglik
+        converged[active[done]] = True
+        active = active[~done]
+        if active.size == 0:
+            break
+
+    return loglik, mu, var, pi, history, converged
+
+
+if __name__ == '__main__':
+    pass
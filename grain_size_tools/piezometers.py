@@ -311,5 +311,3 @@ def feldspar(piezometer=None):
 
 if __name__ == '__main__':
     pass
-else:
-    print('module piezometers imported')
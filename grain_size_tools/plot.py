@@ -34,6 +34,13 @@ import matplotlib.pyplot as plt
 import numpy as np
 from scipy.stats import norm, gaussian_kde, shapiro, iqr
 
+try:
+    from . import averages
+    from .population import GrainPopulation, SizeIndex
+except ImportError:
+    import averages
+    from population import GrainPopulation, SizeIndex
+
 
 # plotting funtions
 def distribution(data,
@@ -41,6 +48,9 @@ def distribution(data,
                  avg=('amean', 'gmean', 'median', 'mode'),
                  binsize='auto',
                  bandwidth='silverman',
+                 ax=None,
+                 binned=False,
+                 max_bins=512,
                  **fig_kw):
     """ Return a plot with the ditribution of (apparent or actual) grain sizes
     in a dataset.
@@ -77,6 +87,20 @@ def distribution(data,
         the method to estimate the bandwidth or a scalar directly defining the
         bandwidth. It uses the Silverman plug-in method by default.
 
+    ax : matplotlib axes or None; optional
+        an existing axes to draw on. If None (default) a new figure is created.
+
+    binned : bool; optional
+        large-data mode, recommended above a million grains. If True, the
+        histogram is computed with fixed edges and drawn as a single step
+        patch instead of one patch per class, and the KDE is estimated by
+        linear binning and FFT convolution (see averages.binned_kde) instead
+        of evaluating every kernel. Default: False
+
+    max_bins : positive integer; optional
+        the maximum number of classes of the histogram in large-data mode.
+        Default: 512
+
     **fig_kw :
         additional keyword arguments to control the size (figsize) and
         resolution (dpi) of the plot. Default figsize is (6.4, 4.8).
@@ -85,11 +109,13 @@ def distribution(data,
     Call functions
     --------------
     - gaussian_kde (from Scipy stats)
+    - averages.binned_kde (large-data mode)
 
     Examples
     --------
     >>> distribution(data['diameters'])
     >>> distribution(data['diameters'], figsize=(6.4, 4.8))
+    >>> distribution(big_data['diameters'], binned=True)
 
     Returns
     -------
@@ -97,14 +123,40 @@ def distribution(data,
     the location of the averages defined.
     """
 
-    fig, ax = plt.subplots(**fig_kw)
+    if ax is None:
+        fig, ax = plt.subplots(**fig_kw)
+    else:
+        fig = ax.figure
+
+    data_range = (data.min(), data.max())
+    if isinstance(data, GrainPopulation):
+        pop, data = data, data.values
+    else:
+        pop = None
 
-    if 'hist' in plot:
+    if 'hist' in plot and binned is True:
         if isinstance(binsize, (int, float)):
-            binsize = int(np.ceil((data.max() - data.min()) / binsize))
+            numbins = int(np.ceil((data_range[1] - data_range[0]) / binsize))
+        else:
+            numbins = len(np.histogram_bin_edges(data, bins=binsize, range=data_range)) - 1
+        counts, bins = np.histogram(data, bins=min(numbins, max_bins), range=data_range)
+        y_values = counts / (counts.sum() * np.diff(bins))
+        ax.fill_between(bins, np.append(y_values, y_values[-1]),
+                        step='post',
+                        color='#80419d',
+                        edgecolor='#C59fd7',
+                        alpha=0.7)
+        print('=======================================')
+        print('Number of classes = ', len(bins) - 1)
+        print('binsize = ', round(bins[1] - bins[0], 2))
+        print('=======================================')
+
+    elif 'hist' in plot:
+        if isinstance(binsize, (int, float)):
+            binsize = int(np.ceil((data_range[1] - data_range[0]) / binsize))
         y_values, bins, __ = ax.hist(data,
                                      bins=binsize,
-                                     range=(data.min(), data.max()),
+                                     range=data_range,
                                      density=True,
                                      color='#80419d',
                                      edgecolor='#C59fd7',
@@ -114,20 +166,26 @@ def distribution(data,
         print('binsize = ', round(bins[1] - bins[0], 2))
         print('=======================================')
 
-    if 'kde' in plot:
+    if 'kde' in plot and binned is True:
+        x_values = np.linspace(data_range[0], data_range[1], num=4096)
+        y_values, bandwidth = averages.binned_kde(data if pop is None else pop, x_values, bandwidth)
+
+    elif 'kde' in plot:
         # estimate kde first
+        std = np.std(data, ddof=1) if pop is None else pop.std(ddof=1)
         if isinstance(bandwidth, (int, float)):
-            fixed_bw = bandwidth / np.std(data, ddof=1)
+            fixed_bw = bandwidth / std
             kde = gaussian_kde(data, bw_method=fixed_bw)
         elif isinstance(bandwidth, str):
             kde = gaussian_kde(data, bw_method=bandwidth)
-            bandwidth = round(kde.covariance_factor() * data.std(ddof=1), 2)
+            bandwidth = round(kde.covariance_factor() * std, 2)
         else:
             raise ValueError("bandwidth must be integer, float, or plug-in methods 'silverman' or 'scott'")
 
-        x_values = np.linspace(data.min(), data.max(), num=1000)
+        x_values = np.linspace(data_range[0], data_range[1], num=1000)
         y_values = kde(x_values)
 
+    if 'kde' in plot:
         print('=======================================')
         print('KDE bandwidth = ', round(bandwidth, 2))
         print('=======================================')
@@ -144,7 +202,7 @@ def distribution(data,
 
     # plot the location of the averages
     if 'amean' in avg:
-        amean = np.mean(data)
+        amean = np.mean(data) if pop is None else pop.mean()
         ax.vlines(amean, 0, np.max(y_values),
                   linestyle='solid',
                   color='#2F4858',
@@ -152,14 +210,14 @@ def distribution(data,
                   linewidth=2.5)
 
     if 'gmean' in avg:
-        gmean = np.exp(np.mean(np.log(data)))
+        gmean = np.exp(np.mean(np.log(data)) if pop is None else pop.mean(log=True))
         ax.vlines(gmean, 0, np.max(y_values),
                   linestyle='solid',
                   color='#fec44f',
                   label='geo. mean')
 
     if 'median' in avg:
-        median = np.median(data)
+        median = np.median(data) if pop is None else pop.median()
         ax.vlines(median, 0, np.max(y_values),
                   linestyle='dashed',
                   color='#2F4858',
@@ -184,17 +242,18 @@ def distribution(data,
     return fig, ax
 
 
-def area_weighted(diameters, areas, binsize='auto', **fig_kw):
+def area_weighted(diameters, areas=None, binsize='auto', **fig_kw):
     """ Generate an area-weighted histogram and returns different
     area-weighted statistics.
 
     Parameters
     ----------
-    diameters : array_like
+    diameters : array_like or GrainPopulation
         the size of the grains
 
-    areas : array_like
-        the sectional areas of the grains
+    areas : array_like or None
+        the sectional areas of the grains. It can be None when diameters
+        is a GrainPopulation (the areas are taken from it)
 
     binsize : string or positive scalar, optional
         If 'auto', it defines the plug-in method to calculate the bin size.
@@ -222,6 +281,16 @@ def area_weighted(diameters, areas, binsize='auto', **fig_kw):
     >>> area_weighted(data['diameters'], data['Areas'], binsize='doane', dpi=300)
     """
 
+    if isinstance(diameters, GrainPopulation) and areas is None:
+        index, areas = diameters.index, diameters.areas
+        max_diameter, diameters = diameters.max(), diameters.values
+    elif areas is None:
+        raise ValueError('The areas are required unless diameters is a GrainPopulation')
+    else:
+        diameters = np.asarray(diameters)
+        index = SizeIndex(diameters, areas)
+        max_diameter = index.sorted[-1]
+
     # estimate weighted mean
     area_total = np.sum(areas)
     weighted_areas = areas / area_total
@@ -229,18 +298,14 @@ def area_weighted(diameters, areas, binsize='auto', **fig_kw):
 
     # estimate mode interval
     if type(binsize) is str:
-        histogram, bin_edges = np.histogram(diameters, bins=binsize, range=(0.0, diameters.max()))
+        bin_edges = np.histogram_bin_edges(diameters, bins=binsize, range=(0.0, max_diameter))
         h = bin_edges[1]
     else:
-        bin_edges = np.arange(0.0, diameters.max() + binsize, binsize)
+        bin_edges = np.arange(0.0, max_diameter + binsize, binsize)
         h = binsize
 
     # estimate the cumulative areas of each grain size interval
-    cumulativeAreas = np.zeros(len(bin_edges))
-    for index, values in enumerate(bin_edges):
-        mask = np.logical_and(diameters >= values, diameters < (values + h))
-        area_sum = np.sum(areas[mask])
-        cumulativeAreas[index] = round(area_sum, 1)
+    cumulativeAreas = np.round(index.sums(np.append(bin_edges, bin_edges[-1] + h), weighted=True), 1)
 
     # get the index of the modal interval
     getIndex = np.argmax(cumulativeAreas)
@@ -252,7 +317,7 @@ def area_weighted(diameters, areas, binsize='auto', **fig_kw):
     print('HISTOGRAM FEATURES')
     print('The modal interval is {left:0.2f} - {right:0.2f} microns' .format(left=bin_edges[getIndex],
                                                                              right=bin_edges[getIndex] + h))
-    print('The number of classes are {}' .format(len(histogram)))
+    print('The number of classes are {}' .format(len(bin_edges) - 1))
     if type(binsize) is str:
         print('The bin size is {bin:0.2f} according to the {rule} rule' .format(bin=h, rule=binsize))
     print('=======================================')
@@ -292,7 +357,7 @@ def normalized(data, avg='amean', bandwidth='silverman', **fig_kw):
 
     Parameters
     ----------
-    data : array-like
+    data : array-like or GrainPopulation
         the dataset
 
     avg : str, optional
@@ -308,7 +373,7 @@ def normalized(data, avg='amean', bandwidth='silverman', **fig_kw):
         Default resolution is 100 dpi.
     """
 
-    data = np.log(data)
+    data = data.log if isinstance(data, GrainPopulation) else np.log(data)
     amean = np.mean(data)
     median = np.median(data)
 
@@ -375,6 +440,130 @@ def normalized(data, avg='amean', bandwidth='silverman', **fig_kw):
     return fig, ax
 
 
+def normalized_multi(samples, avg='amean', bandwidth='silverman', layout='overlay',
+                     gridsize=1000, **fig_kw):
+    """Return the log-transformed normalized ditributions of several grain
+    populations in a single figure, either overlaid or as small multiples.
+    The KDEs of all samples are evaluated at once on a shared mesh using a
+    binned estimator (linear binning and FFT convolution).
+
+    Parameters
+    ----------
+    samples : dict or list of array-like or GrainPopulation
+        the datasets. If dict, the keys are used as labels
+
+    avg : str, optional
+        the normalization factor, either 'amean' or 'median'.
+        Default: 'amean'
+
+    bandwidth : str or scalar, optional
+        the bandwidth of the KDEs, by default 'silverman'
+
+    layout : str, optional
+        'overlay' draws all the densities in the same axes, 'grid' draws
+        one small axes per sample. Default: 'overlay'
+
+    gridsize : positive integer, optional
+        the number of points of the shared mesh. Default: 1000
+
+    **fig_kw :
+        additional keyword arguments to control the size (figsize) and
+        resolution (dpi) of the plot.
+
+    Call functions
+    --------------
+    - averages.kde_bandwidth
+    - averages.linear_binning
+    - averages.kde_from_counts
+
+    Examples
+    --------
+    >>> normalized_multi([data1['diameters'], data2['diameters']])
+    >>> fig, axes, (x, densities) = normalized_multi(samples, avg='median', layout='grid')
+
+    Returns
+    -------
+    the figure, the axes, and a tuple with the shared mesh and the matrix
+    of densities (one row per sample)
+    """
+
+    if avg not in ('amean', 'median'):
+        raise ValueError("Normalization factor has to be defined as 'amean' or 'median'")
+    if layout not in ('overlay', 'grid'):
+        raise ValueError("layout has to be defined as 'overlay' or 'grid'")
+
+    if isinstance(samples, dict):
+        labels, samples = list(samples.keys()), list(samples.values())
+    else:
+        labels = ['sample {}' .format(i + 1) for i in range(len(samples))]
+
+    # normalize the data
+    norm_samples, factors = [], []
+    for data in samples:
+        data = data.log if isinstance(data, GrainPopulation) else np.log(np.asarray(data, dtype=float))
+        amean, median = np.mean(data), np.median(data)
+        norm_factor = amean if avg == 'amean' else median
+        norm_samples.append(data / norm_factor)
+        factors.append((amean / norm_factor, median / norm_factor))
+
+    # estimate all the KDEs on the same mesh
+    x_values = np.linspace(min(d.min() for d in norm_samples),
+                           max(d.max() for d in norm_samples), num=gridsize)
+    bws = np.array([averages.kde_bandwidth(d, bandwidth) for d in norm_samples])
+    counts = np.vstack([averages.linear_binning(d, x_values) for d in norm_samples])
+    densities = averages.kde_from_counts(counts, x_values[1] - x_values[0], bws)
+
+    # Provide details
+    print('=======================================')
+    for label, norm_data, bw in zip(labels, norm_samples, bws):
+        if avg == 'amean':
+            print('{}: normalized SD = {:0.3f}, KDE bandwidth = {:0.2f}'
+                  .format(label, np.std(norm_data), bw))
+        else:
+            print('{}: normalized IQR = {:0.3f}, KDE bandwidth = {:0.2f}'
+                  .format(label, iqr(norm_data), bw))
+    print('=======================================')
+
+    if avg == 'amean':
+        xlabel = r'normalized log grain size ($y / \bar{y}$)'
+    else:
+        xlabel = r'normalized log grain size ($y / med_{y}$)'
+
+    # make plot
+    if layout == 'overlay':
+        fig, ax = plt.subplots(**fig_kw)
+        colors = plt.cm.viridis(np.linspace(0, 0.9, len(norm_samples)))
+        for label, y_values, color in zip(labels, densities, colors):
+            ax.plot(x_values, y_values, color=color, label=label, linewidth=1.5)
+        ax.set_ylabel('density', color='#252525')
+        ax.set_xlabel(xlabel, color='#252525')
+        if len(labels) <= 10:
+            ax.legend(loc='best', fontsize=12)
+        axes = ax
+
+    else:
+        ncols = int(np.ceil(np.sqrt(len(norm_samples))))
+        nrows = int(np.ceil(len(norm_samples) / ncols))
+        fig_kw.setdefault('figsize', (2.5 * ncols, 2 * nrows))
+        fig, axes = plt.subplots(nrows, ncols, sharex=True, sharey=True, squeeze=False, **fig_kw)
+        for ax, label, y_values, (amean, median) in zip(axes.flat, labels, densities, factors):
+            ax.plot(x_values, y_values, color='#2F4858', linewidth=1.5)
+            ax.fill_between(x_values, y_values, color='#d1346b', alpha=0.5)
+            ax.vlines(amean, 0, np.max(y_values), linestyle='solid', color='#2F4858', linewidth=1.5)
+            ax.vlines(median, 0, np.max(y_values), linestyle='dashed', color='#2F4858', linewidth=1.5)
+            ax.set_title(label, fontsize=10)
+        for ax in axes.flat[len(norm_samples):]:
+            ax.set_visible(False)
+        for ax in axes[:, 0]:
+            ax.set_ylabel('density', color='#252525')
+        for ax in axes[-1, :]:
+            ax.set_xlabel(xlabel, color='#252525', fontsize=10)
+
+    fig.tight_layout()
+
+    return fig, axes, (x_values, densities)
+
+
 def qq_plot(data, percent=2, **fig_kw):
     """ Test whether the underlying distribution follows a lognormal
     distribution using a quantile–quantile (q-q) plot and a Shapiro-
@@ -382,7 +571,7 @@ def qq_plot(data, percent=2, **fig_kw):
 
     Parameters
     ----------
-    data : array-like
+    data : array-like or GrainPopulation
         the apparent diameters or any other type of data
 
     percent : scalar between 0 and 100
@@ -393,11 +582,16 @@ def qq_plot(data, percent=2, **fig_kw):
     shapiro from scipy's stats
     """
 
-    data = np.sort(np.log(data))
-
-    # estimate percentiles in the actual data
+    # estimate percentiles in the actual data. All of them are computed in a
+    # single partial sort (selection) pass, so no full sort is needed, or
+    # from the sorted values if already available
     percentil = np.arange(1, 100, percent)
-    actual_data = np.percentile(data, percentil)
+    if isinstance(data, GrainPopulation):
+        actual_data = SizeIndex(np.log(data.sorted), presorted=True).size_at(percentil)
+        data = data.log
+    else:
+        data = np.log(data)
+        actual_data = np.percentile(data, percentil)
 
     # estimate percentiles for theoretical data
     mean, std = np.mean(data), np.std(data)
@@ -446,5 +640,3 @@ def qq_plot(data, percent=2, **fig_kw):
 
 if __name__ == '__main__':
     pass
-else:
-    print('module plot imported')
@@ -0,0 +1,514 @@
+# ============================================================================ #
+#                                                                              #
+#    This is part of the "GrainSizeTools Script"                               #
+#    A Python script for characterizing grain size from thin sections          #
+#                                                                              #
+#    Copyright (c) 2014-present   Marco A. Lopez-Sanchez                       #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License");           #
+#    you may not use this file except in compliance with the License.          #
+#    You may obtain a copy of the License at                                   #
+#                                                                              #
+#        http://www.apache.org/licenses/LICENSE-2.0                            #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS,         #
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  #
+#    See the License for the specific language governing permissions and       #
+#    limitations under the License.                                            #
+#                                                                              #
+#    Version 3.0rc                                                             #
+#    For details see: http://marcoalopez.github.io/GrainSizeTools/             #
+#    download at https://github.com/marcoalopez/GrainSizeTools/releases        #
+#                                                                              #
+# ============================================================================ #
+
+# ============================================================================ #
+# A container for a population of grain sizes that cleans the data once and    #
+# caches the arrays and statistics derived from it (logarithms, sorted values, #
+# moments, diameters from areas...), so that they are computed only once no    #
+# matter how many functions use them. The functions of the averages,           #
+# stereology and plot modules accept it in place of an array:                  #
+#                                                                              #
+#   pop = GrainPopulation(dataset['diameters'])                                #
+#   summarize(pop)                                                             #
+#   Saltykov(pop, numbins=12)                                                  #
+#                                                                              #
+# The SizeIndex (pop.index) answers batches of cumulative distribution and     #
+# percentile queries, by number of grains or by area, using binary search.     #
+#                                                                              #
+# The GrainAccumulator keeps only the sums, a histogram with fixed edges, and  #
+# a quantile sketch of the grains added, so that the populations of many       #
+# files or tiles can be summarized in separate processes and merged later.     #
+# ============================================================================ #
+
+import numpy as np
+
+
+class GrainPopulation(object):
+    """ A population of grain sizes (apparent diameters). Missing, infinite,
+    negative and zero values are removed on creation and the data cannot be
+    modified afterwards, so all the derived values are computed on first use
+    and then reused.
+
+    Parameters
+    ----------
+    data : array_like
+        the apparent diameters of the grains or, if areas is True, their
+        sectional areas
+
+    areas : bool; optional
+        if True, data contains areas and the diameters are computed as
+        equivalent circular diameters (ECD) when first needed. Default: False
+
+    dtype : string or numpy dtype; optional
+        the data type used. Default: 'float64'
+
+    Attributes
+    ----------
+    values : the clean diameters (read-only array)
+    areas : the sectional areas (read-only array)
+    log : the natural logarithm of the diameters
+    sorted : the diameters sorted in ascending order
+    index : a SizeIndex (area-weighted) of the diameters
+    min, max : the smallest and largest diameters
+    missing : the number of missing (NaN) or infinite values removed
+    removed : the number of negative or zero values removed
+
+    Examples
+    --------
+    >>> pop = GrainPopulation(dataset['diameters'])
+    >>> pop = GrainPopulation(dataset['Area'], areas=True)
+    >>> amean(pop), gmean(pop), median(pop)
+    >>> pop.mean(), pop.std(log=True), pop.percentile([25, 75])
+    """
+
+    __slots__ = ('_values', '_areas', '_cache', 'missing', 'removed')
+
+    def __init__(self, data, areas=False, dtype='float64'):
+        if isinstance(data, GrainPopulation):
+            self._values, self._areas, self._cache = data._values, data._areas, data._cache
+            self.missing, self.removed = data.missing, data.removed
+            return
+
+        data = np.asarray(data, dtype=dtype)
+        if data.ndim != 1:
+            raise ValueError('The data must be a one-dimensional array')
+
+        valid = np.isfinite(data)
+        finite = np.count_nonzero(valid)
+        np.greater(data, 0, out=valid, where=valid)
+        clean = data[valid]  # always a copy
+        clean.flags.writeable = False
+        if clean.size == 0:
+            raise ValueError('There are no positive finite values in the data')
+
+        self.missing, self.removed = data.size - finite, finite - clean.size
+        self._values, self._areas = (None, clean) if areas else (clean, None)
+        self._cache = {}
+
+    def __len__(self):
+        return len(self._areas if self._values is None else self._values)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.values
+        if dtype is not None and values.dtype != dtype:
+            return values.astype(dtype)
+        return values.copy() if copy else values
+
+    def __repr__(self):
+        return 'GrainPopulation(n={}, missing={}, removed={})' .format(len(self), self.missing, self.removed)
+
+    @property
+    def values(self):
+        if self._values is None:
+            try:
+                from .loader import area_to_ecd
+            except ImportError:
+                from loader import area_to_ecd
+            values = area_to_ecd(self._areas)
+            values.flags.writeable = False
+            self._values = values
+        return self._values
+
+    @property
+    def areas(self):
+        if self._areas is None:
+            areas = np.pi * (self._values / 2)**2
+            areas.flags.writeable = False
+            self._areas = areas
+        return self._areas
+
+    @property
+    def log(self):
+        return self._cached('log', lambda: np.log(self.values))
+
+    @property
+    def sorted(self):
+        return self._cached('sorted', lambda: np.sort(self.values))
+
+    @property
+    def index(self):
+        return self._cached('index', lambda: SizeIndex(self.sorted, np.pi * (self.sorted / 2)**2,
+                                                       presorted=True))
+
+    def min(self):
+        """ Returns the smallest diameter."""
+        return self._cached('min', lambda: self._cache['sorted'][0] if 'sorted' in self._cache
+                            else self.values.min())
+
+    def max(self):
+        """ Returns the largest diameter."""
+        return self._cached('max', lambda: self._cache['sorted'][-1] if 'sorted' in self._cache
+                            else self.values.max())
+
+    def mean(self, log=False):
+        """ Returns the arithmetic mean of the diameters (or of their
+        logarithms if log is True)."""
+        return self._moments(log)[0]
+
+    def var(self, ddof=1, log=False):
+        """ Returns the variance of the diameters (or of their logarithms),
+        Bessel corrected (ddof=1) by default."""
+        return self._moments(log)[1] / (len(self) - ddof)
+
+    def std(self, ddof=1, log=False):
+        """ Returns the standard deviation of the diameters (or of their
+        logarithms), Bessel corrected (ddof=1) by default."""
+        return np.sqrt(self.var(ddof, log))
+
+    def median(self):
+        """ Returns the median of the diameters."""
+        return self._cached('median', self._median)
+
+    def _median(self):
+        if 'sorted' not in self._cache:
+            return np.median(self.values)  # selection, cheaper than sorting
+        s, n = self._cache['sorted'], len(self)
+        if n % 2 == 1:
+            return s[n // 2]
+        return np.mean(s[n // 2 - 1:n // 2 + 1])
+
+    def percentile(self, q):
+        """ Returns the percentile(s) q (between 0 and 100) of the diameters
+        using linear interpolation, as np.percentile."""
+        s = self.sorted
+        position = np.asarray(q, dtype='float64') / 100 * (len(s) - 1)
+        lower = np.clip(np.floor(position).astype(int), 0, len(s) - 1)
+        upper = np.minimum(lower + 1, len(s) - 1)
+        return s[lower] + (position - lower) * (s[upper] - s[lower])
+
+    def _moments(self, log):
+        """ Returns the mean and the sum of squared deviations from it."""
+        name = 'log_moments' if log else 'moments'
+        if name not in self._cache:
+            data = self.log if log else self.values
+            mean = np.mean(data)
+            self._cache[name] = (mean, np.sum(np.square(data - mean)))
+        return self._cache[name]
+
+    def _cached(self, name, func):
+        if name not in self._cache:
+            value = func()
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+            self._cache[name] = value
+        return self._cache[name]
+
+
+class SizeIndex(object):
+    """ An index of grain sizes (sorted diameters plus, optionally, the
+    cumulative sums of a weight such as the sectional areas) to answer
+    batches of "fraction of grains (or area) below x" and "size at
+    percentile q" queries by binary search, without sorting or masking the
+    data for each query.
+
+    Parameters
+    ----------
+    diameters : array_like
+        the apparent diameters
+
+    weights : array_like or None; optional
+        the weight of each grain (e.g. the sectional areas) for the weighted
+        queries. Default: None (only queries by number of grains)
+
+    presorted : bool; optional
+        whether the diameters are already sorted in ascending order (the
+        weights are assumed to be in the same order). Default: False
+
+    Examples
+    --------
+    >>> index = SizeIndex(dataset['diameters'], dataset['Area'])
+    >>> index = GrainPopulation(dataset['diameters']).index
+    >>> index.fraction_below([10, 20, 50], weighted=True)
+    >>> index.size_at([10, 50, 90])
+    """
+
+    __slots__ = ('sorted', '_cumulative')
+
+    def __init__(self, diameters, weights=None, presorted=False):
+        diameters = np.asarray(diameters, dtype='float64')
+        if presorted is False:
+            order = np.argsort(diameters, kind='stable')
+            diameters = diameters[order]
+            if weights is not None:
+                weights = np.asarray(weights)[order]
+        self.sorted = diameters
+
+        if weights is None:
+            self._cumulative = None
+        else:
+            cumulative = np.zeros(len(diameters) + 1)
+            np.cumsum(weights, out=cumulative[1:])
+            self._cumulative = cumulative
+
+    def __len__(self):
+        return len(self.sorted)
+
+    def fraction_below(self, x, weighted=False):
+        """ Returns the fraction (between 0 and 1) of the grains, or of the
+        total weight if weighted is True, with diameters smaller than or
+        equal to x (scalar or array)."""
+        position = np.searchsorted(self.sorted, x, side='right')
+        if weighted:
+            cumulative = self._weights()
+            return cumulative[position] / cumulative[-1]
+        return position / len(self.sorted)
+
+    def size_at(self, q, weighted=False):
+        """ Returns the diameter(s) at the percentile(s) q (between 0 and 100)
+        interpolating linearly between grains. By number of grains the result
+        is the same as np.percentile; weighted, each grain is placed at the
+        middle of its share of the cumulative weight."""
+        q = np.asarray(q, dtype='float64') / 100
+        if weighted:
+            cumulative = self._weights()
+            midpoints = (cumulative[:-1] + cumulative[1:]) / (2 * cumulative[-1])
+            return np.interp(q, midpoints, self.sorted)
+        n = len(self.sorted)
+        return np.interp(q * (n - 1), np.arange(n), self.sorted)
+
+    def sums(self, bin_edges, weighted=False):
+        """ Returns the number of grains (or their total weight) within each
+        interval [bin_edges[i], bin_edges[i + 1])."""
+        position = np.searchsorted(self.sorted, bin_edges, side='left')
+        if weighted:
+            return np.diff(self._weights()[position])
+        return np.diff(position)
+
+    def _weights(self):
+        if self._cumulative is None:
+            raise ValueError('The index has no weights, create it with weights for weighted queries')
+        return self._cumulative
+
+
+class GrainAccumulator(object):
+    """ A mergeable summary of a population of grain sizes that can be
+    updated chunk by chunk and combined with others (in any order) without
+    keeping the grains: the number of grains, the means and the sums of
+    squared deviations from the mean of d and log d (combined with the
+    parallel algorithm of Chan et al., which avoids the loss of precision of
+    sum(d**2) - n * mean**2), the counts of a histogram with fixed edges, and a
+    quantile sketch with bounded relative error (buckets evenly spaced in
+    log scale, as in DDSketch). It can be converted to and from a dict of
+    plain Python types (e.g. to store it as JSON).
+
+    Parameters
+    ----------
+    bin_edges : array_like or None; optional
+        the (evenly spaced) edges of the histogram used for the Saltykov
+        method. All the accumulators merged must use the same edges.
+        Default: None (no histogram)
+
+    accuracy : scalar between 0 and 1; optional
+        the maximum relative error of the percentiles. Default: 0.01
+
+    Examples
+    --------
+    >>> acc = GrainAccumulator(bin_edges=np.linspace(0, 200, 21))
+    >>> for chunk in loader.iter_diameters('huge_file.txt'):
+    ...     acc.add(chunk)
+    >>> total = GrainAccumulator.from_dict(json.load(fh)).merge(acc)
+    >>> total.amean(), total.gmean(), total.percentile([25, 50, 75])
+    >>> total.Saltykov(return_data=True)
+    """
+
+    _moments = ('n', 'm1', 'm2', 'm1_log', 'm2_log')  # m1: mean, m2: sum of squared deviations
+
+    def __init__(self, bin_edges=None, accuracy=0.01):
+        if not 0 < accuracy < 1:
+            raise ValueError('accuracy must be between 0 and 1')
+        self.accuracy = float(accuracy)
+        self._log_gamma = np.log((1 + self.accuracy) / (1 - self.accuracy))
+        self.n, self.m1, self.m2, self.m1_log, self.m2_log = 0, 0.0, 0.0, 0.0, 0.0
+        self.removed, self.outside = 0, 0
+        self.sketch = {}  # {bucket: count}
+        if bin_edges is None:
+            self.bin_edges, self.counts = None, None
+        else:
+            self.bin_edges = np.asarray(bin_edges, dtype='float64')
+            self.counts = np.zeros(len(self.bin_edges) - 1, dtype=np.int64)
+
+    def __len__(self):
+        return self.n
+
+    def __repr__(self):
+        return 'GrainAccumulator(n={}, buckets={})' .format(self.n, len(self.sketch))
+
+    def add(self, diameters):
+        """ Add the diameters (array_like or GrainPopulation). Missing,
+        infinite, negative and zero values are ignored. Returns self."""
+        if isinstance(diameters, GrainPopulation):
+            self.removed += diameters.missing + diameters.removed
+            d, log_d = diameters.values, diameters.log
+        else:
+            d = np.asarray(diameters, dtype='float64').ravel()
+            valid = np.isfinite(d) & (d > 0)
+            self.removed += len(d) - np.count_nonzero(valid)
+            d = d[valid]
+            log_d = np.log(d)
+
+        if len(d) > 0:
+            mean, mean_log = float(np.mean(d)), float(np.mean(log_d))
+            self._combine(len(d), mean, float(np.sum((d - mean)**2)),
+                          mean_log, float(np.sum((log_d - mean_log)**2)))
+
+        if self.counts is not None:
+            counts = np.histogram(d, bins=len(self.counts), range=(self.bin_edges[0], self.bin_edges[-1]))[0]
+            self.counts += counts
+            self.outside += len(d) - int(counts.sum())
+
+        buckets, counts = np.unique(np.ceil(log_d / self._log_gamma).astype(np.int64), return_counts=True)
+        for bucket, count in zip(buckets.tolist(), counts.tolist()):
+            self.sketch[bucket] = self.sketch.get(bucket, 0) + count
+
+        return self
+
+    def merge(self, other):
+        """ Add the grains summarized in other (another GrainAccumulator with
+        the same bin edges and accuracy). Returns self."""
+        if other.accuracy != self.accuracy:
+            raise ValueError('Cannot merge accumulators with different accuracy')
+        if (self.bin_edges is None) != (other.bin_edges is None) or \
+                (self.bin_edges is not None and not np.array_equal(self.bin_edges, other.bin_edges)):
+            raise ValueError('Cannot merge accumulators with different bin edges')
+
+        self._combine(other.n, other.m1, other.m2, other.m1_log, other.m2_log)
+        self.removed += other.removed
+        self.outside += other.outside
+        if self.counts is not None:
+            self.counts += other.counts
+        for bucket, count in other.sketch.items():
+            self.sketch[bucket] = self.sketch.get(bucket, 0) + count
+
+        return self
+
+    def _combine(self, n, m1, m2, m1_log, m2_log):
+        """ Add the moments of other n grains (Chan et al. 1979)."""
+        if n == 0:
+            return
+        total = self.n + n
+        delta, delta_log = m1 - self.m1, m1_log - self.m1_log
+        self.m2 += m2 + delta**2 * self.n * n / total
+        self.m2_log += m2_log + delta_log**2 * self.n * n / total
+        self.m1 += delta * n / total
+        self.m1_log += delta_log * n / total
+        self.n = total
+
+    def to_dict(self):
+        """ Returns the state as a dict of plain Python types."""
+        state = {name: getattr(self, name) for name in self._moments}
+        state.update(removed=int(self.removed), outside=int(self.outside), accuracy=self.accuracy,
+                     sketch=[[bucket, count] for bucket, count in sorted(self.sketch.items())])
+        if self.counts is not None:
+            state.update(bin_edges=self.bin_edges.tolist(), counts=self.counts.tolist())
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        """ Create an accumulator from a dict returned by to_dict."""
+        acc = cls(state.get('bin_edges'), state['accuracy'])
+        for name in cls._moments:
+            setattr(acc, name, state[name])
+        acc.removed, acc.outside = state['removed'], state['outside']
+        acc.sketch = {int(bucket): int(count) for bucket, count in state['sketch']}
+        if acc.counts is not None:
+            acc.counts = np.asarray(state['counts'], dtype=np.int64)
+        return acc
+
+    def mean(self, log=False):
+        """ Returns the arithmetic mean of the diameters (or of their
+        logarithms if log is True)."""
+        if self.n == 0:
+            raise ValueError('The accumulator is empty')
+        return self.m1_log if log else self.m1
+
+    def std(self, ddof=1, log=False):
+        """ Returns the standard deviation of the diameters (or of their
+        logarithms), Bessel corrected (ddof=1) by default."""
+        return np.sqrt((self.m2_log if log else self.m2) / (self.n - ddof))
+
+    def amean(self, ci=0.95, method='ASTM'):
+        """ Returns the arithmetic mean, the Bessel corrected SD, and the
+        confidence interval (tuple) and its length as averages.amean. Only
+        the 'ASTM' and 'mCox' methods are available."""
+        try:
+            from . import averages
+        except ImportError:
+            import averages
+        mean, std = self.mean(), self.std()
+        if method == 'ASTM':
+            conf_int, length = averages.CLT_ci(mean, std, self.n, ci)
+        elif method == 'mCox':
+            conf_int, length = averages.mCox_equation(self.mean(log=True), self.std(log=True), self.n, ci)
+        else:
+            raise ValueError("ci methods must be 'ASTM' or 'mCox'")
+        return mean, std, conf_int, length
+
+    def gmean(self, ci=0.95):
+        """ Returns the geometric mean, the multiplicative SD, and the
+        confidence interval (tuple) and its length using the CLT method,
+        as averages.gmean."""
+        try:
+            from . import averages
+        except ImportError:
+            import averages
+        mean_log, std_log = self.mean(log=True), self.std(log=True)
+        conf_int, length = averages.CLT2_ci(mean_log, std_log, self.n, ci)
+        return np.exp(mean_log), np.exp(std_log), conf_int, length
+
+    def percentile(self, q):
+        """ Returns the approximate percentile(s) q (between 0 and 100) of
+        the diameters, with a relative error below the accuracy."""
+        if self.n == 0:
+            raise ValueError('The accumulator is empty')
+        buckets = np.array(sorted(self.sketch))
+        cumulative = np.cumsum([self.sketch[bucket] for bucket in buckets])
+        rank = np.asarray(q, dtype='float64') / 100 * (self.n - 1)
+        bucket = buckets[np.searchsorted(cumulative, rank, side='right')]
+        return 2 * np.exp(bucket * self._log_gamma) / (1 + np.exp(self._log_gamma))
+
+    def median(self):
+        """ Returns the approximate median of the diameters."""
+        return self.percentile(50)
+
+    def iqr(self):
+        """ Returns the approximate interquartile range of the diameters."""
+        q1, q3 = self.percentile([25, 75])
+        return q3 - q1
+
+    def Saltykov(self, **kwargs):
+        """ Apply the Saltykov method to the histogram (see
+        stereology.Saltykov_from_counts for the keyword arguments). The
+        grains outside the bin edges are not considered."""
+        if self.counts is None:
+            raise ValueError('The accumulator has no histogram, create it with bin_edges')
+        try:
+            from .stereology import Saltykov_from_counts
+        except ImportError:
+            from stereology import Saltykov_from_counts
+        return Saltykov_from_counts(self.counts, self.bin_edges, **kwargs)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,237 @@
+# ============================================================================ #
+#                                                                              #
+#    This is part of the "GrainSizeTools Script"                               #
+#    A Python script for characterizing grain size from thin sections          #
+#                                                                              #
+#    Copyright (c) 2014-present   Marco A. Lopez-Sanchez                       #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License");           #
+#    you may not use this file except in compliance with the License.          #
+#    You may obtain a copy of the License at                                   #
+#                                                                              #
+#        http://www.apache.org/licenses/LICENSE-2.0                            #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS,         #
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  #
+#    See the License for the specific language governing permissions and       #
+#    limitations under the License.                                            #
+#                                                                              #
+#    Version 3.0rc                                                             #
+#    For details see: http://marcoalopez.github.io/GrainSizeTools/             #
+#    download at https://github.com/marcoalopez/GrainSizeTools/releases        #
+#                                                                              #
+# ============================================================================ #
+
+# ============================================================================ #
+# Batch rendering of the GrainSizeTools figures to image files. Figures are    #
+# drawn with the non-interactive Agg backend, optionally in several worker     #
+# processes, and each worker reuses the same figure for all its samples.       #
+# ============================================================================ #
+
+import contextlib
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# figure layout of each kind of plot
+_figsizes = {'distribution': (6.4, 4.8),
+             'Saltykov': (10, 4),
+             'twostep': (6.4, 4.8)}
+
+_manifest_name = 'render_manifest.json'
+
+# figures reused by the current process, {(kind, figsize): (fig, axes)}
+_templates = {}
+
+
+def render_batch(samples, kinds=('distribution',), outdir='.', fmt='png',
+                 dpi=150, jobs=1, skip_unchanged=True, options=None):
+    """ Render the distribution, Saltykov and/or two-step method figures of
+    many samples to image files.
+
+    Parameters
+    ----------
+    samples : dict or iterable of (name, array_like) pairs
+        the apparent diameters of each sample. The name is used to build the
+        output file name as '<name>_<kind>.<fmt>'
+
+    kinds : string, tuple or list; optional
+        the figures to render, any of 'distribution' (plot.distribution),
+        'Saltykov' (stereology.Saltykov) and 'twostep' (stereology.calc_shape).
+        Default: 'distribution'
+
+    outdir : string; optional
+        the output directory, created if it does not exist
+
+    fmt : string {'png' or 'svg'}; optional
+        the file format. Default: 'png'
+
+    dpi : positive integer; optional
+        the resolution of the figures. Default: 150
+
+    jobs : positive integer; optional
+        the number of worker processes. Each worker is pinned to the Agg
+        backend. If 1 (default) the figures are rendered in this process.
+
+    skip_unchanged : bool; optional
+        if True (default), figures whose data and options have not changed
+        since the previous run, and whose file still exists, are not rendered
+        again. The record is kept in a 'render_manifest.json' file stored in
+        outdir.
+
+    options : dict or None; optional
+        keyword arguments for each kind of figure, e.g.
+        {'distribution': {'plot': 'kde'}, 'Saltykov': {'numbins': 15},
+        'twostep': {'class_range': (12, 18)}}
+
+    Examples
+    --------
+    >>> render_batch({'sample1': d1, 'sample2': d2}, outdir='figures')
+    >>> render_batch(samples, kinds=('Saltykov', 'twostep'), fmt='svg', jobs=8)
+
+    Returns
+    -------
+    A dict with the path of each figure and whether it was 'rendered' or
+    'skipped'
+    """
+
+    if isinstance(kinds, str):
+        kinds = (kinds,)
+    for kind in kinds:
+        if kind not in _figsizes:
+            raise ValueError("kinds must be 'distribution', 'Saltykov' or 'twostep'")
+    if fmt not in ('png', 'svg'):
+        raise ValueError("fmt must be 'png' or 'svg'")
+    if isinstance(jobs, int) is False or jobs < 1:
+        raise ValueError('jobs must be a positive integer')
+    if options is None:
+        options = {}
+    if isinstance(samples, dict):
+        samples = samples.items()
+
+    os.makedirs(outdir, exist_ok=True)
+    manifest_path = os.path.join(outdir, _manifest_name)
+    manifest = _read_manifest(manifest_path) if skip_unchanged else {}
+
+    # build the list of tasks, leaving out the figures that did not change
+    tasks, status, digests = [], {}, {}
+    for name, data in samples:
+        data = np.asarray(data, dtype=float)
+        for kind in kinds:
+            path = os.path.join(outdir, '{}_{}.{}' .format(name, kind, fmt))
+            digest = _digest(data, kind, options.get(kind, {}), dpi)
+            if skip_unchanged and manifest.get(path) == digest and os.path.exists(path):
+                status[path] = 'skipped'
+                continue
+            tasks.append((data, kind, options.get(kind, {}), path, fmt, dpi))
+            digests[path] = digest
+
+    if jobs == 1 or len(tasks) <= 1:
+        for path in map(_render_task, tasks):
+            status[path] = 'rendered'
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+            for path in pool.map(_render_task, tasks, chunksize=max(1, len(tasks) // (4 * jobs))):
+                status[path] = 'rendered'
+
+    if skip_unchanged:
+        manifest.update(digests)
+        _write_manifest(manifest_path, manifest)
+
+    return status
+
+
+# ============================================================================ #
+# AUXILIARY FUNCTIONS                                                          #
+# ============================================================================ #
+
+
+def _init_worker():
+    """ Pin the worker process to the non-interactive Agg backend."""
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+
+
+def _get_template(kind):
+    """ Returns the figure and axes reused by the current process for a kind
+    of plot, with all the artists of previous samples removed. Figures are
+    created without pyplot so that they do not depend on the active backend.
+    """
+    figsize = _figsizes[kind]
+    if (kind, figsize) not in _templates:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        axes = fig.subplots(nrows=1, ncols=2) if kind == 'Saltykov' else fig.subplots()
+        _templates[(kind, figsize)] = (fig, axes)
+
+    fig, axes = _templates[(kind, figsize)]
+    for ax in np.atleast_1d(axes):
+        ax.cla()
+
+    return fig, axes
+
+
+def _render_task(task):
+    """ Draw and save a single figure. Returns the path of the file."""
+    try:
+        from . import plot, stereology
+    except ImportError:
+        import plot
+        import stereology
+
+    data, kind, kwargs, path, fmt, dpi = task
+    fig, axes = _get_template(kind)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if kind == 'distribution':
+            plot.distribution(data, ax=axes, **kwargs)
+
+        elif kind == 'Saltykov':
+            mid_points, freq3D = stereology.Saltykov(data, return_data=True, **kwargs)
+            binsize = mid_points[1] - mid_points[0]
+            cdf_norm = stereology.volume_cdf(mid_points, freq3D, binsize)
+            stereology.Saltykov_plot(mid_points - binsize / 2, freq3D, binsize,
+                                     mid_points, cdf_norm, axes=axes)
+
+        else:
+            __, params, sigma_err, mid_points, frequencies = stereology.twostep_fit(data, **kwargs)
+            xgrid, best_fit, fit_error = stereology.twostep_curves(data.max(), params, sigma_err)
+            stereology.twostep_plot(xgrid, mid_points, frequencies, best_fit, fit_error, ax=axes)
+
+    fig.savefig(path, format=fmt, dpi=dpi)
+
+    return path
+
+
+def _digest(data, kind, kwargs, dpi):
+    """ Returns a hash of the data and the options used to render a figure."""
+    h = hashlib.sha1(np.ascontiguousarray(data).tobytes())
+    h.update(repr((kind, sorted(kwargs.items()), dpi)).encode())
+    return h.hexdigest()
+
+
+def _read_manifest(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(path, manifest):
+    """ Write the manifest atomically so that an interrupted run never leaves
+    a truncated file behind."""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as fh:
+        json.dump(manifest, fh, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+if __name__ == '__main__':
+    pass
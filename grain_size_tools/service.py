@@ -0,0 +1,419 @@
+# ============================================================================ #
+#                                                                              #
+#    This is part of the "GrainSizeTools Script"                               #
+#    A Python script for characterizing grain size from thin sections          #
+#                                                                              #
+#    Copyright (c) 2014-present   Marco A. Lopez-Sanchez                       #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License");           #
+#    you may not use this file except in compliance with the License.          #
+#    You may obtain a copy of the License at                                   #
+#                                                                              #
+#        http://www.apache.org/licenses/LICENSE-2.0                            #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS,         #
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  #
+#    See the License for the specific language governing permissions and       #
+#    limitations under the License.                                            #
+#                                                                              #
+#    Version 3.0rc                                                             #
+#    For details see: http://marcoalopez.github.io/GrainSizeTools/             #
+#    download at https://github.com/marcoalopez/GrainSizeTools/releases        #
+#                                                                              #
+# ============================================================================ #
+
+# ============================================================================ #
+# Long-lived local service that keeps the modules (numpy, scipy...) imported   #
+# in a pool of worker processes, so that other applications can request the    #
+# analyses without paying the start-up time of Python on every call. It        #
+# speaks plain HTTP with JSON bodies on localhost or on a Unix socket:         #
+#                                                                              #
+#   python -m grain_size_tools.service --port 8765 --jobs 2                    #
+#   python -m grain_size_tools.service --socket /tmp/grainsizetools.sock       #
+#                                                                              #
+#   POST /summarize        {"diameters": [...], "params": {"ci_level": 0.99}}  #
+#   POST /Saltykov         {"diameters": [...], "params": {"numbins": 12}}     #
+#   POST /calc_shape       {"diameters": [...]}                                #
+#   POST /calc_diffstress  {"grain_size": 35.2, "params": {"phase": "quartz",  #
+#                           "piezometer": "Stipp_Tullis"}}                     #
+#   GET  /health                                                               #
+#                                                                              #
+# From Python, use service.call(), e.g. call('summarize', diameters)           #
+# ============================================================================ #
+
+import argparse
+import http.client
+import http.server
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+import numpy as np
+
+try:
+    from . import __version__
+except ImportError:
+    __version__ = None
+
+functions = ('summarize', 'Saltykov', 'calc_shape', 'calc_diffstress')
+max_body = 2**28  # maximum request size in bytes (256 MB)
+_random_lock = threading.Lock()  # the Monte Carlo methods use the global Numpy generator
+
+
+# ============================================================================ #
+# WORKERS                                                                      #
+# ============================================================================ #
+
+
+def _modules():
+    try:
+        from . import GrainSizeTools_script, stereology
+    except ImportError:
+        import GrainSizeTools_script
+        import stereology
+    return GrainSizeTools_script, stereology
+
+
+def _init_worker():
+    """ Import the modules and run a small analysis so that the first
+    request does not pay the import time."""
+    gst, stereology = _modules()
+    diameters = np.random.RandomState(0).lognormal(3.5, 0.5, 300)
+    dict(gst.describe(diameters))
+    stereology.twostep_fit(diameters, class_range=(10, 11))
+
+
+def handle(function, payload):
+    """ Run a request and returns the results as a dict.
+
+    Parameters
+    ----------
+    function : string
+        'summarize', 'Saltykov', 'calc_shape' or 'calc_diffstress'
+
+    payload : dict
+        the request, with the data ('diameters', or 'grain_size' for
+        calc_diffstress) and optionally a dict of 'params' (keyword
+        arguments of the function and/or a 'seed' for the Monte Carlo
+        based methods)
+
+    The requests run one at a time within a process, because the seed is
+    applied to the global Numpy random generator, shared by the threads of
+    the server when it runs without worker processes (jobs=0).
+
+    Call functions
+    --------------
+    - describe and estimate_stress (from GrainSizeTools_script)
+    - Saltykov and twostep_fit (from stereology)
+    """
+
+    with _random_lock:
+        return _handle(function, payload)
+
+
+def _handle(function, payload):
+    gst, stereology = _modules()
+    params = dict(payload.get('params') or {})
+    seed = params.pop('seed', None)
+    if seed is not None:
+        np.random.seed(seed)
+
+    if function == 'calc_diffstress':
+        grain_size = np.asarray(payload['grain_size'], dtype='float64')
+        if grain_size.ndim == 0:
+            grain_size = float(grain_size)
+        stress, notes, linear_intercepts = gst.estimate_stress(grain_size, **params)
+        return {'stress': stress, 'notes': notes, 'linear_intercepts': linear_intercepts}
+
+    diameters = np.asarray(payload['diameters'], dtype='float64')
+    if diameters.ndim != 1 or diameters.size == 0:
+        raise ValueError('diameters must be a non-empty list of numbers')
+
+    if function == 'summarize':
+        return dict(gst.describe(diameters, **params))
+
+    elif function == 'Saltykov':
+        mid_points, frequencies = stereology.Saltykov(diameters, return_data=True, **params)
+        return {'mid_points': mid_points, 'frequencies': frequencies}
+
+    elif function == 'calc_shape':
+        num_classes, optimal_params, sigma_err, mid_points, frequencies = \
+            stereology.twostep_fit(diameters, **params)
+        return {'num_classes': num_classes,
+                'msd': optimal_params[0], 'msd_err': 3 * sigma_err[0],
+                'gmean': optimal_params[1], 'gmean_err': 3 * sigma_err[1],
+                'mid_points': mid_points, 'frequencies': frequencies}
+
+    raise ValueError('Unknown function {!r}. Choose between {}' .format(function, functions))
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('{} is not JSON serializable' .format(type(value).__name__))
+
+
+# ============================================================================ #
+# SERVER                                                                       #
+# ============================================================================ #
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    server_version = 'GrainSizeTools/{}' .format(__version__)
+    protocol_version = 'HTTP/1.1'  # keep-alive connections
+
+    def do_GET(self):
+        if self.path.rstrip('/') not in ('', '/health'):
+            return self._reply(404, {'error': 'Not found'})
+        self._reply(200, {'status': 'ok', 'version': __version__, 'functions': functions,
+                          'jobs': self.server.jobs, 'pending': self.server.pending})
+
+    def do_POST(self):
+        function = self.path.strip('/')
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > max_body:
+            self.close_connection = True
+            return self._reply(413, {'error': 'Request too large'})
+        body = self.rfile.read(length)
+
+        if function not in functions:
+            return self._reply(404, {'error': 'Unknown function {!r}. Choose between {}' .format(function, functions)})
+        try:
+            payload = json.loads(body.decode('utf-8'))
+        except ValueError:
+            return self._reply(400, {'error': 'The request body is not valid JSON'})
+
+        if not self.server.slots.acquire(blocking=False):
+            return self._reply(503, {'error': 'Too many pending requests'})
+        try:
+            with self.server.lock:
+                self.server.pending += 1
+            if self.server.executor is None:
+                result = handle(function, payload)
+            else:
+                result = self.server.executor.submit(handle, function, payload).result()
+        except (ValueError, TypeError, KeyError) as error:
+            return self._reply(400, {'error': '{}: {}' .format(type(error).__name__, error)})
+        except Exception as error:
+            return self._reply(500, {'error': '{}: {}' .format(type(error).__name__, error)})
+        finally:
+            with self.server.lock:
+                self.server.pending -= 1
+            self.server.slots.release()
+
+        self._reply(200, result)
+
+    def _reply(self, status, content):
+        body = json.dumps(content, default=_to_json).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix-socket'
+
+    def log_message(self, format, *args):
+        if self.server.quiet is False:
+            super().log_message(format, *args)
+
+
+class _ServiceMixin(socketserver.ThreadingMixIn):
+    daemon_threads = True
+
+    def setup_service(self, jobs, max_queue, quiet):
+        self.jobs, self.quiet = jobs, quiet
+        self.slots = threading.BoundedSemaphore(jobs + max_queue if jobs > 0 else max_queue)
+        self.lock = threading.Lock()
+        self.pending = 0
+        if jobs > 0:
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker)
+            # start the workers now instead of on the first request
+            for future in [self.executor.submit(int) for __ in range(jobs)]:
+                future.result()
+        else:
+            _init_worker()
+            self.executor = None
+
+    def server_close(self):
+        super().server_close()
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+class _TCPServer(_ServiceMixin, http.server.HTTPServer):
+    pass
+
+
+class _UnixServer(_ServiceMixin, socketserver.UnixStreamServer if hasattr(socket, 'AF_UNIX') else object):
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)  # stale socket of a previous run
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = 'localhost', 0
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def make_server(address=('127.0.0.1', 8765), jobs=2, max_queue=32, quiet=True):
+    """ Create (but do not start) the service. Call serve_forever() on the
+    returned server to start it, and shutdown() and server_close() to stop it.
+
+    Parameters
+    ----------
+    address : tuple (host, port) or string; optional
+        the host and port to listen on (use port 0 for a free port), or the
+        path of a Unix socket. Default: ('127.0.0.1', 8765)
+
+    jobs : integer; optional
+        the number of worker processes. If 0, requests are run in the
+        server threads. Default: 2
+
+    max_queue : positive integer; optional
+        the number of requests that can wait for a free worker. Additional
+        requests are rejected with a 503 status. Default: 32
+
+    quiet : bool; optional
+        if False, log each request in stderr. Default: True
+
+    Examples
+    --------
+    >>> server = make_server(('127.0.0.1', 0), jobs=1)
+    >>> threading.Thread(target=server.serve_forever, daemon=True).start()
+    >>> call('summarize', diameters, address=server.server_address)
+    """
+
+    if isinstance(address, str):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise ValueError('Unix sockets are not available on this platform')
+        server = _UnixServer(address, _Handler)
+    else:
+        server = _TCPServer(tuple(address), _Handler)
+    try:
+        server.setup_service(jobs, max_queue, quiet)
+    except BaseException:
+        server.socket.close()
+        raise
+
+    return server
+
+
+# ============================================================================ #
+# CLIENT                                                                       #
+# ============================================================================ #
+
+
+class _UnixConnection(http.client.HTTPConnection):
+
+    def __init__(self, path, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def call(function, data=None, address=('127.0.0.1', 8765), timeout=600, **params):
+    """ Send a request to a running service and returns the results.
+
+    Parameters
+    ----------
+    function : string
+        'summarize', 'Saltykov', 'calc_shape', 'calc_diffstress' or 'health'
+
+    data : array_like or scalar
+        the apparent diameters, or the grain size for calc_diffstress
+
+    address : tuple (host, port) or string; optional
+        the address of the service or the path of its Unix socket
+
+    timeout : positive scalar; optional
+        seconds to wait for the results. Default: 600
+
+    **params :
+        keyword arguments of the function (and/or seed)
+
+    Examples
+    --------
+    >>> results = call('summarize', diameters, ci_level=0.99, seed=42)
+    >>> results = call('calc_diffstress', 35.2, phase='quartz', piezometer='Stipp_Tullis')
+    >>> results = call('Saltykov', diameters, numbins=12, address='/tmp/grainsizetools.sock')
+
+    Returns
+    -------
+    A dict with the results (see handle)
+    """
+
+    if isinstance(address, str):
+        connection = _UnixConnection(address, timeout)
+    else:
+        connection = http.client.HTTPConnection(address[0], address[1], timeout=timeout)
+
+    try:
+        if function == 'health':
+            connection.request('GET', '/health')
+        else:
+            key = 'grain_size' if function == 'calc_diffstress' else 'diameters'
+            body = json.dumps({key: data, 'params': params}, default=_to_json)
+            connection.request('POST', '/' + function, body=body,
+                               headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        content = json.loads(response.read().decode('utf-8'))
+    finally:
+        connection.close()
+
+    if response.status != 200:
+        raise ValueError('The service returned {} ({})' .format(response.status, content.get('error')))
+
+    return content
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m grain_size_tools.service',
+                                     description='Serve the GrainSizeTools analyses over HTTP on localhost '
+                                                 'or a Unix socket.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on (default: 8765)')
+    parser.add_argument('--socket', help='listen on this Unix socket instead of a TCP port')
+    parser.add_argument('-j', '--jobs', type=int, default=2, help='number of worker processes (default: 2)')
+    parser.add_argument('--max-queue', type=int, default=32,
+                        help='requests waiting for a worker before rejecting new ones (default: 32)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not log the requests')
+    args = parser.parse_args(argv)
+
+    if args.jobs < 0 or args.max_queue < 1:
+        parser.error('--jobs must be zero or positive and --max-queue positive')
+
+    address = args.socket if args.socket else (args.host, args.port)
+    server = make_server(address, args.jobs, args.max_queue, args.quiet)
+    print('GrainSizeTools service listening on {} ({} workers)'
+          .format(args.socket or 'http://{}:{}' .format(*server.server_address[:2]), args.jobs))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+# ============================================================================ #
+#                                                                              #
+#    This is part of the "GrainSizeTools Script"                               #
+#    A Python script for characterizing grain size from thin sections          #
+#                                                                              #
+#    Copyright (c) 2014-present   Marco A. Lopez-Sanchez                       #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License");           #
+#    you may not use this file except in compliance with the License.          #
+#    You may obtain a copy of the License at                                   #
+#                                                                              #
+#        http://www.apache.org/licenses/LICENSE-2.0                            #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS,         #
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  #
+#    See the License for the specific language governing permissions and       #
+#    limitations under the License.                                            #
+#                                                                              #
+#    Version 3.0rc                                                             #
+#    For details see: http://marcoalopez.github.io/GrainSizeTools/             #
+#    download at https://github.com/marcoalopez/GrainSizeTools/releases        #
+#                                                                              #
+# ============================================================================ #
+
+
+# ============================================================================ #
+# Synthetic thin sections: populations of spheres with known sizes (lognormal, #
+# mixtures of lognormals or user-supplied diameters) cut by random planes.     #
+# The apparent diameters can be passed to Saltykov, calc_shape or summarize    #
+# to test the accuracy of the stereological methods against the ground truth:  #
+#                                                                              #
+#   d = section_diameters(10**6, shape=1.5, scale=40, seed=42)                 #
+#   truth = ground_truth(shape=1.5, scale=40)                                  #
+#                                                                              #
+# or, for datasets that do not fit in memory, chunk by chunk:                  #
+#                                                                              #
+#   for d in iter_sections(10**9, shape=1.5, scale=40, seed=42): ...           #
+# ============================================================================ #
+
+import numpy as np
+
+
+def sphere_diameters(n, shape=1.6, scale=35.0, weights=None, seed=None):
+    """ Returns the actual (3D) diameters of n spheres drawn from a
+    lognormal distribution or from a mixture of lognormal distributions.
+
+    Parameters
+    ----------
+    n : positive integer
+        the number of spheres
+
+    shape : positive scalar or array_like
+        the shape of the lognormal(s) (multiplicative standard deviation,
+        MSD). Default 1.6
+
+    scale : positive scalar or array_like
+        the scale of the lognormal(s) (geometric mean). Default 35.0
+
+    weights : array_like or None, optional
+        the proportion of spheres of each lognormal in a mixture. Default
+        None, equal proportions
+
+    seed : integer, RandomState or None, optional
+        the seed of the random generator
+
+    Examples
+    --------
+    >>> D = sphere_diameters(1000, shape=(1.4, 1.3), scale=(20, 80), weights=(0.6, 0.4))
+    """
+    rng = _random_state(seed)
+    mu, sigma, weights = _components(shape, scale, weights)
+    return _draw_lognormal(rng, n, mu, sigma, weights)
+
+
+def iter_sections(n, shape=1.6, scale=35.0, weights=None, spheres=None,
+                  chunksize=2**20, seed=None):
+    """ Generator that yields, in chunks, the apparent (2D) diameters of n
+    grains from a random section through a population of spheres.
+
+    A random plane cuts the spheres with a probability proportional to their
+    diameter D, and at a distance from their centre uniformly distributed
+    between 0 and D/2, so that the apparent diameter is D * sqrt(1 - u**2)
+    with u uniform between 0 and 1 (Wicksell, 1925). For lognormal
+    populations the diameters of the sectioned spheres are drawn directly
+    from the size-weighted lognormal, which is also lognormal with the
+    log mean shifted by sigma**2.
+
+    Parameters
+    ----------
+    n : positive integer
+        the number of apparent diameters
+
+    shape, scale, weights :
+        the lognormal population of spheres (see sphere_diameters)
+
+    spheres : array_like or None, optional
+        user-supplied diameters of the spheres. If defined, the grains are
+        sectioned from this population (with replacement) and shape, scale
+        and weights are ignored. Default None
+
+    chunksize : positive integer, optional
+        the maximum number of grains per chunk. Default 2**20
+
+    seed : integer, RandomState or None, optional
+        the seed of the random generator. The same seed and chunksize yield
+        the same dataset
+
+    Examples
+    --------
+    >>> for d in iter_sections(10**8, shape=1.5, scale=40, seed=42):
+    ...     accumulator.add(d)
+
+    Returns
+    -------
+    numpy arrays with the apparent diameters
+    """
+    if isinstance(chunksize, int) is False or chunksize < 1:
+        raise ValueError('chunksize must be a positive integer')
+
+    rng = _random_state(seed)
+
+    if spheres is not None:
+        spheres = np.asarray(spheres, dtype='float64').ravel()
+        if spheres.size == 0 or np.any(~np.isfinite(spheres) | (spheres <= 0)):
+            raise ValueError('spheres must be a non-empty array of positive diameters')
+        cumulative = np.cumsum(spheres)
+    else:
+        mu, sigma, weights = _components(shape, scale, weights)
+        # size-weighted population: each lognormal shifted by sigma**2 and
+        # the proportions weighted by their mean diameter
+        weights = weights * np.exp(mu + sigma**2 / 2)
+        mu, weights = mu + sigma**2, weights / weights.sum()
+
+    for start in range(0, n, chunksize):
+        size = min(chunksize, n - start)
+        if spheres is not None:
+            idx = np.searchsorted(cumulative, rng.random_sample(size) * cumulative[-1], side='right')
+            D = spheres[np.minimum(idx, spheres.size - 1)]
+        else:
+            D = _draw_lognormal(rng, size, mu, sigma, weights)
+        u = rng.random_sample(size)
+        D *= np.sqrt(1 - u * u)
+        yield D
+
+
+def section_diameters(n, shape=1.6, scale=35.0, weights=None, spheres=None,
+                      chunksize=2**20, seed=None):
+    """ Returns the apparent (2D) diameters of n grains from a random
+    section through a population of spheres. See iter_sections for details.
+
+    Examples
+    --------
+    >>> d = section_diameters(5000, shape=1.5, scale=40, seed=42)
+    >>> summarize(d)
+    >>> calc_shape(d)
+    """
+    chunks = iter_sections(n, shape, scale, weights, spheres, chunksize, seed)
+    return np.concatenate(list(chunks)) if n > 0 else np.empty(0)
+
+
+def ground_truth(shape=1.6, scale=35.0, weights=None, spheres=None):
+    """ Returns a dict with the actual statistics of a population of spheres
+    and the expected arithmetic mean of the apparent diameters:
+
+    - 'amean', 'gmean', 'msd': arithmetic and geometric mean and MSD of the
+      sphere diameters
+    - 'shape', 'scale', 'weights': the lognormal parameters (None for
+      user-supplied spheres)
+    - 'apparent_amean': the expected mean apparent diameter,
+      pi / 4 * E[D**2] / E[D]
+
+    Parameters
+    ----------
+    shape, scale, weights, spheres :
+        the population of spheres (see iter_sections)
+    """
+    if spheres is not None:
+        D = np.asarray(spheres, dtype='float64').ravel()
+        log_D = np.log(D)
+        return {'amean': np.mean(D), 'gmean': np.exp(np.mean(log_D)),
+                'msd': np.exp(np.std(log_D)), 'shape': None, 'scale': None, 'weights': None,
+                'apparent_amean': np.pi / 4 * np.mean(D**2) / np.mean(D)}
+
+    mu, sigma, weights = _components(shape, scale, weights)
+    mean_log = np.sum(weights * mu)
+    var_log = np.sum(weights * (sigma**2 + mu**2)) - mean_log**2
+    amean = np.sum(weights * np.exp(mu + sigma**2 / 2))
+    mean_sq = np.sum(weights * np.exp(2 * mu + 2 * sigma**2))
+
+    return {'amean': amean, 'gmean': np.exp(mean_log), 'msd': np.exp(np.sqrt(var_log)),
+            'shape': np.exp(sigma), 'scale': np.exp(mu), 'weights': weights,
+            'apparent_amean': np.pi / 4 * mean_sq / amean}
+
+
+# ============================================================================ #
+# AUXILIARY FUNCTIONS                                                          #
+# ============================================================================ #
+
+
+def _random_state(seed):
+    if isinstance(seed, np.random.RandomState):
+        return seed
+    return np.random.RandomState(seed)
+
+
+def _components(shape, scale, weights):
+    """ Returns the log mean, log standard deviation and proportion of each
+    lognormal in the population."""
+    shape, scale = np.broadcast_arrays(np.atleast_1d(np.asarray(shape, dtype='float64')),
+                                       np.atleast_1d(np.asarray(scale, dtype='float64')))
+    if np.any(shape < 1) or np.any(scale <= 0):
+        raise ValueError('shape must be >= 1 and scale must be positive')
+
+    if weights is None:
+        weights = np.full(shape.size, 1 / shape.size)
+    else:
+        weights = np.atleast_1d(np.asarray(weights, dtype='float64'))
+        if weights.size != shape.size or np.any(weights < 0) or weights.sum() <= 0:
+            raise ValueError('weights must be one non-negative value per lognormal')
+        weights = weights / weights.sum()
+
+    return np.log(scale), np.log(shape), weights
+
+
+def _draw_lognormal(rng, n, mu, sigma, weights):
+    """ Returns n values drawn from a mixture of lognormals."""
+    if mu.size == 1:
+        return rng.lognormal(mu[0], sigma[0], size=n)
+    component = np.searchsorted(np.cumsum(weights), rng.random_sample(n), side='right')
+    component = np.minimum(component, mu.size - 1)
+    return np.exp(mu[component] + sigma[component] * rng.standard_normal(n))
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,352 @@
+# ============================================================================ #
+#                                                                              #
+#    This is part of the "GrainSizeTools Script"                               #
+#    A Python script for characterizing grain size from thin sections          #
+#                                                                              #
+#    Copyright (c) 2014-present   Marco A. Lopez-Sanchez                       #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License");           #
+#    you may not use this file except in compliance with the License.          #
+#    You may obtain a copy of the License at                                   #
+#                                                                              #
+#        http://www.apache.org/licenses/LICENSE-2.0                            #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS,         #
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  #
+#    See the License for the specific language governing permissions and       #
+#    limitations under the License.                                            #
+#                                                                              #
+#    Version 3.0rc                                                             #
+#    For details see: http://marcoalopez.github.io/GrainSizeTools/             #
+#    download at https://github.com/marcoalopez/GrainSizeTools/releases        #
+#                                                                              #
+# ============================================================================ #
+
+# ============================================================================ #
+# Functions to map the grain size (and the piezometric stress) across a thin   #
+# section using the position of the grains, e.g. the FeretX and FeretY         #
+# columns of the ImageJ tables:                                                #
+#                                                                              #
+#   maps = grid_map(dataset['FeretX'], dataset['FeretY'],                      #
+#                   dataset['diameters'], cell_size=250)                       #
+#   plt.imshow(maps['gmean'], origin='lower', extent=maps['extent'])           #
+#                                                                              #
+# or the statistics of the neighbourhood of each grain (moving window):        #
+#                                                                              #
+#   local = local_stats(dataset['FeretX'], dataset['FeretY'],                  #
+#                       dataset['diameters'], radius=200)                      #
+# ============================================================================ #
+
+import itertools
+
+import numpy as np
+
+
+def grid_map(x, y, diameters, cell_size, extent=None, min_grains=1, phase=None,
+             piezometer=None, average='amean', correction=False, temperature=None):
+    """ Bin the grains onto a regular 2D grid and returns, for each cell, the
+    number of grains, the arithmetic and geometric means, the multiplicative
+    standard deviation (MSD), the root mean square (RMS) and, optionally, the
+    differential stress. All the cells are computed at once by accumulating
+    the sums of each cell with np.bincount, so that millions of grains are
+    mapped in a few seconds.
+
+    Parameters
+    ----------
+    x, y : array_like
+        the position of the grains, e.g. the FeretX and FeretY columns
+
+    diameters : array_like
+        the apparent diameters of the grains
+
+    cell_size : positive scalar or tuple of two positive scalars
+        the size of the cells (same units as x and y), or their width and
+        height
+
+    extent : tuple (xmin, xmax, ymin, ymax) or None, optional
+        the region mapped. Grains outside it are ignored. Default None, i.e.
+        the region covered by the grains
+
+    min_grains : positive integer, optional
+        cells with fewer grains are set to NaN (except the counts). Default 1.
+        Note that the MSD requires at least two grains
+
+    phase, piezometer : string or None, optional
+        the mineral phase and the piezometer (see calc_diffstress). If
+        defined, the stress is estimated for each cell
+
+    average : string {'amean', 'gmean', 'rms'}, optional
+        the average grain size used to estimate the stress. Check the notes
+        of the piezometer. Default 'amean'
+
+    correction : bool, optional
+        correct the stress values for plane stress (see calc_diffstress)
+
+    temperature : scalar or None, optional
+        the temperature in degrees C (only for the Shimizu piezometer)
+
+    Call functions
+    --------------
+    - estimate_stress (from GrainSizeTools_script)
+
+    Examples
+    --------
+    >>> maps = grid_map(dataset['FeretX'], dataset['FeretY'], dataset['diameters'], cell_size=250)
+    >>> maps = grid_map(x, y, diameters, 250, min_grains=20, phase='quartz',
+    ...                 piezometer='Stipp_Tullis', average='rms')
+    >>> plt.imshow(maps['stress'], origin='lower', extent=maps['extent'])
+
+    Returns
+    -------
+    A dict with the 2D arrays (rows along y, columns along x) 'count',
+    'amean', 'gmean', 'msd', 'rms' and, if a piezometer is defined, 'stress',
+    plus the cell edges 'x_edges' and 'y_edges' and the 'extent' of the grid
+    """
+
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    diameters = np.asarray(diameters, dtype='float64')
+    if not x.shape == y.shape == diameters.shape:
+        raise ValueError('x, y and diameters must have the same length')
+    if average not in ('amean', 'gmean', 'rms'):
+        raise ValueError("average must be 'amean', 'gmean' or 'rms'")
+
+    valid = np.isfinite(x) & np.isfinite(y) & np.isfinite(diameters) & (diameters > 0)
+    if extent is not None:
+        # the grains outside the requested extent, not the (rounded up) grid
+        xmin, xmax, ymin, ymax = (float(v) for v in extent)
+        valid &= (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+    x_edges, y_edges = _grid_edges(x[valid], y[valid], cell_size, extent)
+    xmin, xmax, ymin, ymax = x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]
+    x, y, diameters = x[valid], y[valid], diameters[valid]
+
+    # flat index of the cell of each grain
+    nx, ny = len(x_edges) - 1, len(y_edges) - 1
+    width, height = x_edges[1] - x_edges[0], y_edges[1] - y_edges[0]
+    col = np.minimum(((x - xmin) / width).astype(np.intp), nx - 1)
+    row = np.minimum(((y - ymin) / height).astype(np.intp), ny - 1)
+    cell = row * nx + col
+
+    # accumulate the sums of each cell
+    size = nx * ny
+    log_d = np.log(diameters)
+    count = np.bincount(cell, minlength=size)
+    sum_d = np.bincount(cell, weights=diameters, minlength=size)
+    sum_d2 = np.bincount(cell, weights=diameters**2, minlength=size)
+    sum_log = np.bincount(cell, weights=log_d, minlength=size)
+    sum_log2 = np.bincount(cell, weights=log_d**2, minlength=size)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_log = sum_log / count
+        var_log = np.maximum(sum_log2 - count * mean_log**2, 0) / (count - 1)
+        maps = {'count': count,
+                'amean': sum_d / count,
+                'gmean': np.exp(mean_log),
+                'msd': np.exp(np.sqrt(var_log)),
+                'rms': np.sqrt(sum_d2 / count)}
+
+    maps['msd'][count < 2] = np.nan
+    empty = count < max(min_grains, 1)
+    for key in ('amean', 'gmean', 'msd', 'rms'):
+        maps[key][empty] = np.nan
+
+    if piezometer is not None:
+        if phase is None:
+            raise ValueError('The phase is required to estimate the stress')
+        try:
+            from .GrainSizeTools_script import estimate_stress
+        except ImportError:
+            from GrainSizeTools_script import estimate_stress
+        maps['stress'], __, __ = estimate_stress(maps[average], phase, piezometer,
+                                                 correction, temperature)
+
+    maps = {key: value.reshape(ny, nx) for key, value in maps.items()}
+    maps.update(x_edges=x_edges, y_edges=y_edges, extent=(xmin, xmax, ymin, ymax))
+
+    return maps
+
+
+def local_stats(x, y, diameters, radius=None, k=None, points=None, min_grains=1,
+                workers=-1, chunksize=2**16):
+    """ Returns the arithmetic and geometric means and the median of the
+    grains around each grain (or each query point), either within a radius
+    or the k nearest ones. The neighbours are found with a KD-tree built
+    once over the grain positions and queried in parallel, and the averages
+    of all the neighbourhoods are computed at once (no loop over points).
+
+    Parameters
+    ----------
+    x, y : array_like
+        the position of the grains, e.g. the FeretX and FeretY columns
+
+    diameters : array_like
+        the apparent diameters of the grains
+
+    radius : positive scalar or None
+        the radius of the neighbourhood (same units as x and y)
+
+    k : positive integer or None
+        the number of nearest grains. Use either radius or k
+
+    points : array_like of shape (m, 2) or None, optional
+        the positions where the statistics are estimated. Default None, i.e.
+        at each grain (the grain itself is included)
+
+    min_grains : positive integer, optional
+        neighbourhoods with fewer grains are set to NaN. Default 1
+
+    workers : integer, optional
+        the number of parallel processes of the KD-tree queries, -1 (default)
+        means all the CPUs available
+
+    chunksize : positive integer, optional
+        the number of points processed at once, which limits the memory used
+
+    Call functions
+    --------------
+    - cKDTree from scipy.spatial
+
+    Examples
+    --------
+    >>> local = local_stats(dataset['FeretX'], dataset['FeretY'], dataset['diameters'], radius=200)
+    >>> local = local_stats(x, y, diameters, k=50)
+    >>> plt.scatter(x, y, c=local['gmean'])
+
+    Returns
+    -------
+    A dict with the arrays (one value per point) 'count', 'amean', 'gmean',
+    and 'median' and, if k is used, 'radius' (the distance to the farthest
+    neighbour). Grains with invalid (NaN or non-positive) positions or sizes
+    are not used as neighbours and get a count of zero and NaN values
+    """
+
+    from scipy.spatial import cKDTree
+
+    if (radius is None) == (k is None):
+        raise ValueError('Define either radius or k')
+    if k is not None and (int(k) != k or k < 1):
+        raise ValueError('k must be a positive integer')
+    if radius is not None and radius <= 0:
+        raise ValueError('radius must be positive')
+
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    diameters = np.asarray(diameters, dtype='float64')
+    if not x.shape == y.shape == diameters.shape:
+        raise ValueError('x, y and diameters must have the same length')
+
+    valid = np.isfinite(x) & np.isfinite(y) & np.isfinite(diameters) & (diameters > 0)
+    if np.count_nonzero(valid) == 0:
+        raise ValueError('There are no grains with valid positions and sizes')
+
+    # sort the grains by size, so that sorting the indices of the
+    # neighbours (integers, fast) sorts their diameters for the median
+    order = np.argsort(diameters[valid], kind='stable')
+    diameters = diameters[valid][order]
+    positions = np.column_stack((x[valid][order], y[valid][order]))
+    if points is None:
+        points = positions
+    else:
+        points = np.asarray(points, dtype='float64').reshape(-1, 2)
+    if k is not None:
+        k = min(int(k), len(diameters))
+
+    tree = cKDTree(positions)
+    log_d = np.log(diameters)
+    m = len(points)
+    results = {'count': np.zeros(m, dtype=np.intp), 'amean': np.empty(m),
+               'gmean': np.empty(m), 'median': np.empty(m)}
+    if k is not None:
+        results['radius'] = np.empty(m)
+
+    # query the grains in the order of the tree leaves (spatially close
+    # points one after another), which is about twice as fast
+    targets = tree.indices if points is positions else np.arange(m)
+    for start in range(0, m, chunksize):
+        chunk = targets[start:start + chunksize]
+        if k is not None:
+            distances, neighbours = tree.query(points[chunk], k=[k] if k == 1 else k, workers=workers)
+            values = diameters[np.sort(neighbours, axis=1)]
+            results['count'][chunk] = k
+            results['amean'][chunk] = values.mean(axis=1)
+            results['gmean'][chunk] = np.exp(log_d[neighbours].mean(axis=1))
+            results['median'][chunk] = (values[:, (k - 1) // 2] + values[:, k // 2]) / 2
+            results['radius'][chunk] = distances[:, -1]
+        else:
+            neighbours = tree.query_ball_point(points[chunk], radius, workers=workers,
+                                               return_sorted=False)
+            _reduce_neighbours(neighbours, diameters, log_d, results, chunk)
+
+    if points is positions:
+        # back to the original order of the grains, with no neighbours
+        # (NaN) for those with invalid positions or sizes
+        index = np.flatnonzero(valid)[order]
+        for key, value in results.items():
+            full = np.zeros(len(valid), dtype=np.intp) if key == 'count' else np.full(len(valid), np.nan)
+            full[index] = value
+            results[key] = full
+
+    empty = results['count'] < max(min_grains, 1)
+    for key in ('amean', 'gmean', 'median'):
+        results[key][empty] = np.nan
+
+    return results
+
+
+def _reduce_neighbours(neighbours, diameters, log_d, results, chunk):
+    """ Compute the averages of neighbourhoods of variable size (lists of
+    indices of the grains, sorted by size) flattening them into a single
+    array."""
+
+    counts = np.fromiter(map(len, neighbours), dtype=np.intp, count=len(neighbours))
+    index = np.fromiter(itertools.chain.from_iterable(neighbours), dtype=np.intp,
+                        count=counts.sum())
+    group = np.repeat(np.arange(len(counts)), counts)
+    starts = np.cumsum(counts) - counts
+    filled = counts > 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        amean = np.bincount(group, weights=diameters[index], minlength=len(counts)) / counts
+        gmean = np.exp(np.bincount(group, weights=log_d[index], minlength=len(counts)) / counts)
+
+    # median: sort the indices (i.e. the sizes) within each neighbourhood
+    # sorting all of them at once with the neighbourhood as the major key
+    offset = group.astype(np.int64) * len(diameters)
+    key = offset + index
+    key.sort()
+    values = diameters[key - offset]
+    median = np.full(len(counts), np.nan)
+    lower = starts[filled] + (counts[filled] - 1) // 2
+    upper = starts[filled] + counts[filled] // 2
+    median[filled] = (values[lower] + values[upper]) / 2
+
+    results['count'][chunk] = counts
+    results['amean'][chunk] = amean
+    results['gmean'][chunk] = gmean
+    results['median'][chunk] = median
+
+
+def _grid_edges(x, y, cell_size, extent=None):
+    """ Returns the edges of the cells along x and y."""
+
+    width, height = np.broadcast_to(np.asarray(cell_size, dtype='float64'), (2,))
+    if width <= 0 or height <= 0:
+        raise ValueError('cell_size must be positive')
+
+    if extent is None:
+        if len(x) == 0:
+            raise ValueError('There are no grains with valid positions and sizes')
+        extent = (x.min(), x.max(), y.min(), y.max())
+    xmin, xmax, ymin, ymax = (float(v) for v in extent)
+    if xmax < xmin or ymax < ymin:
+        raise ValueError('extent must be (xmin, xmax, ymin, ymax)')
+
+    nx = max(int(np.ceil((xmax - xmin) / width)), 1)
+    ny = max(int(np.ceil((ymax - ymin) / height)), 1)
+
+    return xmin + width * np.arange(nx + 1), ymin + height * np.arange(ny + 1)
+
+
+if __name__ == '__main__':
+    pass
@@ -23,11 +23,30 @@
 #                                                                              #
 # ============================================================================ #
 
+import functools
+import numbers
+
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
+
+try:
+    from . import memo, timings
+    from .population import GrainPopulation
+except ImportError:
+    import memo
+    import timings
+    from population import GrainPopulation
+
+# matplotlib and scipy.optimize are imported within the functions that use
+# them so that the numerical routines can be used without loading them
+
+
+def _returns_data(arguments):
+    """ Saltykov calls can be memoized only when they just return data."""
+    return (arguments['return_data'] is True and arguments['calc_vol'] is None
+            and arguments['text_file'] is None)
 
 
+@memo.memoize(cacheable=_returns_data)
 def Saltykov(diameters, numbins=10, calc_vol=None, text_file=None,
              return_data=False, left_edge=0):
     """ Estimate the actual (3D) distribution of grain size from the population
@@ -40,7 +59,7 @@ def Saltykov(diameters, numbins=10, calc_vol=None, text_file=None,
 
     Parameters
     ----------
-    diameters : array_like
+    diameters : array_like or GrainPopulation
         the apparent diameters of the grains.
 
     numbins : positive integer, optional
@@ -64,8 +83,7 @@ def Saltykov(diameters, numbins=10, calc_vol=None, text_file=None,
 
     Call functions
     --------------
-    - unfold_population
-    - Saltykov_plot
+    - Saltykov_from_counts
 
     Examples
     --------
@@ -92,17 +110,62 @@ def Saltykov(diameters, numbins=10, calc_vol=None, text_file=None,
         if left_edge < 0:
             raise ValueError("left_edge must be a positive scalar or 'min'")
 
+    low, high = diameters.min(), diameters.max()
+    if isinstance(diameters, GrainPopulation):
+        diameters = diameters.values
+
     # compute the histogram
-    if left_edge == 'min':
-        freq, bin_edges = np.histogram(diameters,
-                                       bins=numbins,
-                                       range=(diameters.min(), diameters.max()),
-                                       density=True)
-    else:
-        freq, bin_edges = np.histogram(diameters,
-                                       bins=numbins,
-                                       range=(left_edge, diameters.max()),
-                                       density=True)
+    with timings.stage('Saltykov.histogram', len(diameters)):
+        if left_edge == 'min':
+            counts, bin_edges = np.histogram(diameters,
+                                             bins=numbins,
+                                             range=(low, high))
+        else:
+            counts, bin_edges = np.histogram(diameters,
+                                             bins=numbins,
+                                             range=(left_edge, high))
+
+    return Saltykov_from_counts(counts, bin_edges, calc_vol, text_file, return_data)
+
+
+def Saltykov_from_counts(counts, bin_edges, calc_vol=None, text_file=None,
+                         return_data=False):
+    """ Apply the Saltykov method to a histogram of apparent diameters that
+    has already been computed (e.g. accumulated chunk by chunk from a file
+    too large to fit in memory, see loader.histogram_from_file). The method
+    only needs the class counts, so the diameters are not required.
+
+    Parameters
+    ----------
+    counts : array_like
+        the number of grains in each class
+
+    bin_edges : array_like
+        the edges of the classes (len(counts) + 1 evenly spaced values)
+
+    calc_vol, text_file, return_data :
+        see Saltykov
+
+    Call functions
+    --------------
+    - unfold_population
+    - volume_cdf
+    - Saltykov_plot
+
+    Examples
+    --------
+    >>> counts, bin_edges = loader.histogram_from_file('huge_file.txt', numbins=15)
+    >>> mid_points, frequencies = Saltykov_from_counts(counts, bin_edges, return_data=True)
+
+    Return
+    ------
+    Statistical descriptors, a plot, and/or a file with the data (optional)
+    """
+
+    # normalize the counts such that the integral over the range is one
+    counts, bin_edges = np.asarray(counts), np.asarray(bin_edges, dtype=float)
+    numbins = len(counts)
+    freq = counts / np.diff(bin_edges) / counts.sum()
 
     binsize = bin_edges[1] - bin_edges[0]
 
@@ -111,14 +174,12 @@ def Saltykov(diameters, numbins=10, calc_vol=None, text_file=None,
     mid_points = left_edges + binsize / 2
 
     # Unfold the population of apparent diameters using the Saltykov method
-    freq3D = unfold_population(freq, bin_edges, binsize, mid_points)
+    with timings.stage('Saltykov.unfold', numbins):
+        freq3D = unfold_population(freq, bin_edges, binsize, mid_points)
 
     # Calculate the volume-weighted cumulative frequency distribution
-    # TODO -> better an own function
-    x_vol = binsize * (4 / 3.) * np.pi * (mid_points**3)
-    freq_vol = x_vol * freq3D
-    cdf = np.cumsum(freq_vol)
-    cdf_norm = 100 * (cdf / cdf[-1])
+    with timings.stage('Saltykov.cdf', numbins):
+        cdf_norm = volume_cdf(mid_points, freq3D, binsize)
 
     # Estimate the volume of a particular grain size fraction (if proceed)
     if calc_vol is not None:
@@ -141,16 +202,17 @@ def Saltykov(diameters, numbins=10, calc_vol=None, text_file=None,
         from pandas import DataFrame
         if isinstance(text_file, str) is False:
             print('text_file must be None or string type')
-        df = DataFrame({'mid_points': np.around(mid_points, 3),
-                        'freqs': np.around(freq3D, 4),
-                        'freqs2one': np.around(freq3D * binsize, 3),
-                        'cum_vol': np.around(cdf_norm, 2)})
-        if text_file.endswith('.txt'):
-            df.to_csv(text_file, sep='\t')
-        elif text_file.endswith('.csv'):
-            df.to_csv(text_file, sep=';')
-        else:
-            raise ValueError('text file must be specified as .csv or .txt')
+        with timings.stage('Saltykov.export', numbins):
+            df = DataFrame({'mid_points': np.around(mid_points, 3),
+                            'freqs': np.around(freq3D, 4),
+                            'freqs2one': np.around(freq3D * binsize, 3),
+                            'cum_vol': np.around(cdf_norm, 2)})
+            if text_file.endswith('.txt'):
+                df.to_csv(text_file, sep='\t')
+            elif text_file.endswith('.csv'):
+                df.to_csv(text_file, sep=';')
+            else:
+                raise ValueError('text file must be specified as .csv or .txt')
         print('=======================================')
         print('The file {} was created' .format(text_file))
         print('=======================================')
@@ -184,7 +246,7 @@ def calc_shape(diameters, class_range=(10, 20)):
 
     Parameters
     ----------
-    diameters : array_like
+    diameters : array_like or GrainPopulation
         the apparent diameters of the grains
 
     class_range : tupe or list with two values, optional
@@ -194,10 +256,8 @@ def calc_shape(diameters, class_range=(10, 20)):
 
     Call functions
     --------------
-    - Saltykov,
-    - fit_log,
-    - log_function
-    - gen_xgrid
+    - twostep_fit
+    - twostep_curves
     - twostep_plot
 
     Examples
@@ -218,17 +278,69 @@ def calc_shape(diameters, class_range=(10, 20)):
     several statistical parameters
     """
 
+    optimal_num_classes, optimal_params, sigma_err, mid_points, frequencies = \
+        twostep_fit(diameters, class_range)
+
+    print('=======================================')
+    print('PREDICTED OPTIMAL VALUES')
+    print('Number of classes: {}' .format(optimal_num_classes))
+    print('MSD (lognormal shape) = {msd:0.2f} ± {err:0.2f}'
+          .format(msd=optimal_params[0], err=3 * sigma_err[0]))
+    print('Geometric mean (scale) = {gmean:0.2f} ± {err:0.2f}'
+          .format(gmean=optimal_params[1], err=3 * sigma_err[1]))
+    print('=======================================')
+    # print(' Covariance matrix:\n', covm)
+
+    # prepare data for the plot
+    max_diameter = diameters.max()
+    xgrid, best_fit, fit_error = twostep_curves(max_diameter, optimal_params, sigma_err)
+
+    return twostep_plot(xgrid, mid_points, frequencies, best_fit, fit_error)
+
+
+@memo.memoize()
+def twostep_fit(diameters, class_range=(10, 20)):
+    """ Find the number of classes within the range defined that produces the
+    best lognormal fit of the Saltykov output and returns the fitted parameters.
+    This is the numerical part of the two-step method (see calc_shape).
+
+    Parameters
+    ----------
+    diameters : array_like or GrainPopulation
+        the apparent diameters of the grains
+
+    class_range : tupe or list with two values, optional
+        the range of classes considered. Default = (10, 20)
+
+    Call functions
+    --------------
+    - Saltykov
+    - fit_log
+
+    Returns
+    -------
+    the optimal number of classes,
+    the optimal params (MSD, geometric mean),
+    the standard error of the params,
+    the midpoints and the frequencies of the optimal Saltykov histogram
+    """
+
     # estimate the prior shape and scale based on the apparent distribution
-    shape = np.exp(np.std(np.log(diameters), ddof=1))
-    scale = np.median(diameters)
+    if isinstance(diameters, GrainPopulation):
+        shape = np.exp(diameters.std(ddof=1, log=True))
+        scale = diameters.median()
+    else:
+        shape = np.exp(np.std(np.log(diameters), ddof=1))
+        scale = np.median(diameters)
 
     # estimate the number of classes that produces the best fit within the range defined
     class_list = list(range(class_range[0], class_range[1] + 1))
     stds = np.zeros(len(class_list))
 
     for index, item in enumerate(class_list):
-        mid_points, frequencies = Saltykov(diameters, numbins=item, return_data=True)
-        optimal_params, sigma_error = fit_log(mid_points, frequencies, initial_guess=(shape, scale))
+        with timings.stage('calc_shape.fit.{:02d}_classes' .format(item), len(diameters)):
+            mid_points, frequencies = Saltykov(diameters, numbins=item, return_data=True)
+            optimal_params, sigma_error = fit_log(mid_points, frequencies, initial_guess=(shape, scale))
         stds[index] = sigma_error[0]
 
     # get the optimal number of clases and estimate the best fit parameters
@@ -236,18 +348,239 @@ def calc_shape(diameters, class_range=(10, 20)):
     mid_points, frequencies = Saltykov(diameters, numbins=optimal_num_classes, return_data=True)
     optimal_params, sigma_err = fit_log(mid_points, frequencies, (shape, scale))
 
-    print('=======================================')
-    print('PREDICTED OPTIMAL VALUES')
-    print('Number of classes: {}' .format(optimal_num_classes))
-    print('MSD (lognormal shape) = {msd:0.2f} ± {err:0.2f}'
-          .format(msd=optimal_params[0], err=3 * sigma_err[0]))
-    print('Geometric mean (scale) = {gmean:0.2f} ± {err:0.2f}'
-          .format(gmean=optimal_params[1], err=3 * sigma_err[1]))
-    print('=======================================')
-    # print(' Covariance matrix:\n', covm)
+    return optimal_num_classes, optimal_params, sigma_err, mid_points, frequencies
 
-    # prepare data for the plot
-    xgrid = np.linspace(0.1, diameters.max(), 1000)
+
+@memo.memoize()
+def mle_fit(diameters, initial_guess=None, nodes=64, bins='auto'):
+    """ Fit a lognormal distribution of actual (3D) grain sizes directly to
+    the apparent diameters by maximum likelihood. The likelihood of each
+    apparent diameter is the Wicksell transform of the lognormal (see
+    wicksell_lognormal), so that, unlike the two-step method, no histogram
+    (nor choice of the number of classes) is involved and a single
+    optimization is needed.
+
+    Parameters
+    ----------
+    diameters : array_like or GrainPopulation
+        the apparent diameters of the grains
+
+    initial_guess : tuple with two values or None, optional
+        the starting shape (MSD) and scale (geometric mean). Default None,
+        estimated from the apparent diameters
+
+    nodes : positive integer, optional
+        the number of quadrature nodes of the Wicksell integral. Default 64
+
+    bins : 'auto', positive integer or None, optional
+        if an integer, the log-diameters are binned into this number of
+        classes and the likelihood is evaluated once per class (weighted by
+        its number of grains), so that the cost of the fit is independent
+        of the number of grains. 'auto' bins with 1024 classes datasets
+        with more than 16384 grains. None, no binning
+
+    Assumptions
+    -----------
+    - spherical grains with a lognormal distribution of diameters
+    - a random section through the aggregate, all the sections measured
+
+    Call functions
+    --------------
+    - wicksell_lognormal
+    - minimize (L-BFGS-B, from Scipy)
+
+    Examples
+    --------
+    >>> optimal_params, sigma_err = mle_fit(diameters)
+    >>> msd, gmean = optimal_params
+
+    Returns
+    -------
+    the optimal params (MSD, geometric mean) and their standard errors
+    estimated from the curvature of the log-likelihood (observed Fisher
+    information). Raises ValueError if the optimization does not converge
+    or the curvature is not defined
+    """
+
+    from scipy.optimize import minimize
+
+    if isinstance(diameters, GrainPopulation):
+        log_d, mean_log, std_log = diameters.log, diameters.mean(log=True), diameters.std(log=True)
+    else:
+        diameters = np.asarray(diameters, dtype='float64')
+        log_d = np.log(diameters[np.isfinite(diameters) & (diameters > 0)])
+        mean_log, std_log = np.mean(log_d), np.std(log_d, ddof=1)
+
+    # the apparent distribution is wider and shifted towards smaller sizes
+    if initial_guess is None:
+        initial_guess = (np.exp(0.8 * std_log), np.exp(mean_log + 0.2 * std_log))
+    start = np.array([np.log(np.log(initial_guess[0])), np.log(initial_guess[1])])
+
+    # weighted log-diameters (the centres of the classes when binned)
+    if bins == 'auto':
+        bins = 1024 if log_d.size > 16384 else None
+    if bins is None:
+        x, counts = log_d, np.ones_like(log_d)
+    elif isinstance(bins, numbers.Integral) and bins > 0:
+        counts, edges = np.histogram(log_d, bins=bins)
+        centres = (edges[:-1] + edges[1:]) / 2
+        x, counts = centres[counts > 0], counts[counts > 0].astype('float64')
+    else:
+        raise ValueError("bins must be 'auto', a positive integer or None")
+
+    def neg_loglik(params):  # params: sigma, mu
+        return -np.sum(counts * _wicksell_logpdf(x, params[1], params[0], nodes))
+
+    # the optimization runs on log(sigma) (always positive) and the mean
+    # log-likelihood per grain, so that the tolerance does not depend on n
+    def objective(params):
+        return neg_loglik((np.exp(params[0]), params[1])) / log_d.size
+
+    with timings.stage('mle_fit.optimize', len(log_d)):
+        result = minimize(objective, start, method='L-BFGS-B',
+                          jac=lambda p: _gradient(objective, p),
+                          options={'gtol': 1e-9, 'ftol': 1e-14, 'maxiter': 500})
+    if not result.success:
+        raise ValueError('The maximum likelihood fit did not converge: {}' .format(result.message))
+    log_sigma, mu = result.x
+    sigma = np.exp(log_sigma)
+
+    # standard errors of (sigma, mu) from the Hessian of -log L, which must
+    # be positive definite at a well-defined maximum
+    with timings.stage('mle_fit.errors', len(log_d)):
+        hessian = _hessian(neg_loglik, np.array([sigma, mu]))
+    if not np.all(np.isfinite(hessian)) or np.min(np.linalg.eigvalsh(hessian)) <= 0:
+        raise ValueError('The log-likelihood is flat or not concave at the optimum '
+                         '(too few grains?), the standard errors cannot be estimated')
+    errors = np.sqrt(np.diag(np.linalg.inv(hessian)))
+
+    # back-transform to MSD = exp(sigma) and geometric mean = exp(mu)
+    optimal_params = np.array([np.exp(sigma), np.exp(mu)])
+
+    return optimal_params, optimal_params * errors
+
+
+def wicksell_lognormal(d, shape, scale, nodes=64):
+    """ Returns the probability density of the apparent (2D) diameters in a
+    random section through spheres whose diameters follow a lognormal
+    distribution (Wicksell, 1925):
+
+    g(d) = d / E[D] * integral from d to inf of f(D) / sqrt(D**2 - d**2) dD
+
+    where f is the lognormal density of the sphere diameters. The integral
+    is evaluated for all the diameters at once using Gauss-Legendre
+    quadrature on a fixed (cached) mesh after a change of variable that
+    removes the singularity at D = d.
+
+    Parameters
+    ----------
+    d : array_like
+        the apparent diameters
+
+    shape : positive scalar
+        the shape of the 3D lognormal (multiplicative SD, MSD)
+
+    scale : positive scalar
+        the scale of the 3D lognormal (geometric mean)
+
+    nodes : positive integer, optional
+        the number of quadrature nodes. Default 64
+
+    Reference
+    ---------
+    Wicksell (1925) doi:10.2307/2332027
+    """
+
+    d = np.asarray(d, dtype='float64')
+    return np.exp(_wicksell_logpdf(np.log(d), np.log(scale), np.log(shape), nodes))
+
+
+def _wicksell_logpdf(log_d, mu, sigma, nodes=64, chunksize=2**14):
+    """ Returns the log-density of the apparent diameters (see
+    wicksell_lognormal) with mu and sigma the mean and standard deviation
+    of the logarithm of the sphere diameters.
+
+    With z = (log D - mu) / sigma, z0 the value of z at D = d, and the
+    change of variable z = a + L * u**2 (u from 0 to 1):
+
+    g(d) = 1 / E[D] * integral of phi(z) * 2 L u / sqrt(expm1(2 sigma (z - z0))) du
+
+    which is finite at u = 0 when a = z0. The integral spans from a =
+    max(z0, -8) to max(z0, 0) + 8, i.e. the tails of the lognormal beyond 8
+    standard deviations are neglected.
+    """
+
+    u, log_w = _gauss_legendre(nodes)
+    log_d = np.asarray(log_d, dtype='float64')
+    log_mean = mu + sigma**2 / 2  # log E[D]
+    result = np.empty(log_d.shape)
+
+    for start in range(0, log_d.size, chunksize):
+        z0 = ((log_d.flat[start:start + chunksize] - mu) / sigma)[:, np.newaxis]
+        a = np.maximum(z0, -8)
+        L = np.maximum(z0, 0) + 8 - a
+        z = a + L * u**2
+        terms = (-0.5 * z**2 - 0.5 * np.log(2 * np.pi) + np.log(2 * L * u)
+                 - 0.5 * np.log(np.expm1(2 * sigma * (z - z0))) + log_w)
+        max_terms = np.max(terms, axis=1)
+        result.flat[start:start + chunksize] = (max_terms - log_mean
+                                                + np.log(np.sum(np.exp(terms - max_terms[:, np.newaxis]), axis=1)))
+
+    return result
+
+
+@functools.lru_cache(maxsize=8)
+def _gauss_legendre(nodes):
+    """ Returns the Gauss-Legendre nodes in (0, 1) and the log of their
+    weights."""
+    x, w = np.polynomial.legendre.leggauss(nodes)
+    return (x + 1) / 2, np.log(w / 2)
+
+
+def _gradient(func, x, rel_step=1e-6):
+    """ Returns the gradient of a scalar function by central finite
+    differences."""
+    h = rel_step * np.maximum(np.abs(x), 1)
+    return np.array([(func(x + step) - func(x - step)) / (2 * h[i])
+                     for i, step in enumerate(np.diag(h))])
+
+
+def _hessian(func, x, rel_step=1e-4):
+    """ Returns the Hessian matrix of a scalar function by central finite
+    differences."""
+    k = len(x)
+    h = rel_step * np.maximum(np.abs(x), 1)
+    hessian = np.empty((k, k))
+    for i in range(k):
+        for j in range(i, k):
+            ei, ej = np.eye(k)[i] * h[i], np.eye(k)[j] * h[j]
+            hessian[i, j] = hessian[j, i] = (func(x + ei + ej) - func(x + ei - ej)
+                                             - func(x - ei + ej) + func(x - ei - ej)) / (4 * h[i] * h[j])
+    return hessian
+
+
+def twostep_curves(max_diameter, optimal_params, sigma_err):
+    """ Returns the best fitting lognormal curve of the two-step method and its
+    uncertainty evaluated over a mesh of 1000 points between 0.1 and the
+    maximum diameter.
+
+    Parameters
+    ----------
+    max_diameter : positive scalar
+        the maximum apparent diameter
+
+    optimal_params : tuple with two values
+        the shape (MSD) and scale (geometric mean) of the lognormal
+
+    sigma_err : tuple with two values
+        the standard error of the shape and the scale
+
+    Returns
+    -------
+    the mesh, the best fit and the fit error (arrays)
+    """
+
+    xgrid = np.linspace(0.1, max_diameter, 1000)
     best_fit = log_function(xgrid, optimal_params[0], optimal_params[1])
 
     # Estimate all the combinatorial posibilities for fit curves taking into account the uncertainties
@@ -259,7 +592,7 @@ def calc_shape(diameters, class_range=(10, 20)):
     # Estimate the standard deviation of the all values obtained
     fit_error = np.std(values, axis=0)
 
-    return twostep_plot(xgrid, mid_points, frequencies, best_fit, fit_error)
+    return xgrid, best_fit, fit_error
 
 
 def unfold_population(freq, bin_edges, binsize, mid_points, normalize=True):
@@ -337,6 +670,29 @@ def unfold_population(freq, bin_edges, binsize, mid_points, normalize=True):
         return freq
 
 
+def volume_cdf(mid_points, freq3D, binsize):
+    """ Returns the volume-weighted cumulative frequency distribution (in
+    percent) of an unfolded (3D) population of grain sizes.
+
+    Parameters
+    ----------
+    mid_points : array_like
+        the midpoints of the classes
+
+    freq3D : array_like
+        the (normalized) frequencies of the unfolded population
+
+    binsize : positive scalar
+        the size of the classes
+    """
+
+    x_vol = binsize * (4 / 3.) * np.pi * (mid_points**3)
+    freq_vol = x_vol * freq3D
+    cdf = np.cumsum(freq_vol)
+
+    return 100 * (cdf / cdf[-1])
+
+
 def wicksell_solution(D, d1, d2):
     """ Estimate the cross-section size probability for a discretized population
     of spheres based on the Wicksell (1925) and later on Scheil (1931),
@@ -415,6 +771,8 @@ def fit_log(x, y, initial_guess):
     -------
     The optimal params and the error of the fit
     """
+    from scipy.optimize import curve_fit
+
     # fit a log normal function (it assumes that shape is within the 1-10 range
     # and location is positive)
     optimal_params, cov_matrix = curve_fit(log_function, x, y, initial_guess,
@@ -474,14 +832,22 @@ def gen_xgrid(start, stop, precision):
     return np.linspace(start, stop, num=n)
 
 
-def Saltykov_plot(left_edges, freq3D, binsize, mid_points, cdf_norm):
+def Saltykov_plot(left_edges, freq3D, binsize, mid_points, cdf_norm, axes=None):
     """ Generate two plots once the Saltykov method is applied:
 
     i)  a bar plot (ax1)
     ii) a volume-weighted cumulative frequency plot (ax2)
+
+    If a pair of existing matplotlib axes is passed through axes, the plots
+    are drawn on them instead of on a new figure.
     """
 
-    fig, (ax1, ax2) = plt.subplots(nrows=1, ncols=2, figsize=(10, 4))
+    if axes is None:
+        import matplotlib.pyplot as plt
+        fig, (ax1, ax2) = plt.subplots(nrows=1, ncols=2, figsize=(10, 4))
+    else:
+        ax1, ax2 = axes
+        fig = ax1.figure
 
     # frequency vs grain size plot
     ax1.bar(left_edges, freq3D,
@@ -519,11 +885,17 @@ def Saltykov_plot(left_edges, freq3D, binsize, mid_points, cdf_norm):
     return fig, (ax1, ax2)
 
 
-def twostep_plot(xgrid, mid_points, frequencies, best_fit, fit_error):
-    """ Generate a plot with the best fitting lognormal distribution (two-step method)"""
+def twostep_plot(xgrid, mid_points, frequencies, best_fit, fit_error, ax=None):
+    """ Generate a plot with the best fitting lognormal distribution (two-step
+    method). If an existing matplotlib axes is passed through ax, the plot is
+    drawn on it instead of on a new figure."""
 
     # matplotlib stuff
-    fig, ax = plt.subplots()
+    if ax is None:
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots()
+    else:
+        fig = ax.figure
 
     # bar plot from Saltykov method
     ax.bar(mid_points, frequencies,
@@ -568,5 +940,3 @@ def twostep_plot(xgrid, mid_points, frequencies, best_fit, fit_error):
 
 if __name__ == '__main__':
     pass
-else:
-    print('module stereology imported')
@@ -23,53 +23,67 @@
 #                                                                              #
 # ============================================================================ #
 
-import matplotlib as mpl
+# ============================================================================ #
+# The plot style used by the GrainSizeTools script. Importing this module has  #
+# no side effects; call set_style() to apply it (the script does it for you   #
+# when run interactively) or use it temporarily via                          #
+# matplotlib.pyplot.style.context(template.style)                            #
+# ============================================================================ #
+
 from cycler import cycler
 
-# Set the plot style
-mpl.rcParams['font.family'] = 'Helvetica Neue'  # set your own font family
-mpl.rcParams['font.size'] = 14.0
-mpl.rcParams['svg.fonttype'] = 'path'
-mpl.rcParams['lines.linewidth'] = 3.0
-mpl.rcParams['lines.markersize'] = 12.0
-mpl.rcParams['lines.solid_capstyle'] = 'butt'
-mpl.rcParams['legend.fancybox'] = True
+style = {
+    'font.family': 'Helvetica Neue',  # set your own font family
+    'font.size': 14.0,
+    'svg.fonttype': 'path',
+    'lines.linewidth': 3.0,
+    'lines.markersize': 12.0,
+    'lines.solid_capstyle': 'butt',
+    'legend.fancybox': True,
+
+    'axes.prop_cycle': cycler(color=['#008fd5', '#fc4f30', '#e5ae38', '#6d904f', '#8b8b8b', '#810f7c']),
+    'axes.facecolor': 'ffffff',
+    'axes.labelsize': 'large',
+    'axes.axisbelow': True,
+    'axes.grid': True,
+    'axes.edgecolor': 'ffffff',
+    'axes.linewidth': 2.0,
+    'axes.titlesize': 'x-large',
+
+    'patch.edgecolor': 'f0f0f0',
+    'patch.linewidth': 0.5,
+
+    'grid.linestyle': '-',
+    'grid.linewidth': 1.0,
+    'grid.color': 'cbcbcb',
+
+    'xtick.major.size': 0,
+    'xtick.minor.size': 0,
+    'ytick.major.size': 0,
+    'ytick.minor.size': 0,
+    'xtick.labelsize': 16,
+    'ytick.labelsize': 16,
+    'xtick.color': '#252525',
+    'ytick.color': '#252525',
 
-mpl.rcParams['axes.prop_cycle'] = cycler(color=['#008fd5', '#fc4f30', '#e5ae38', '#6d904f', '#8b8b8b', '#810f7c'])
-mpl.rcParams['axes.facecolor'] = 'ffffff'
-mpl.rcParams['axes.labelsize'] = 'large'
-mpl.rcParams['axes.axisbelow'] = True
-mpl.rcParams['axes.grid'] = True
-mpl.rcParams['axes.edgecolor'] = 'ffffff'
-mpl.rcParams['axes.linewidth'] = 2.0
-mpl.rcParams['axes.titlesize'] = 'x-large'
+    'savefig.edgecolor': 'ffffff',
+    'savefig.facecolor': 'ffffff',
 
-mpl.rcParams['patch.edgecolor'] = 'f0f0f0'
-mpl.rcParams['patch.linewidth'] = 0.5
+    'figure.subplot.left': 0.125,
+    'figure.subplot.right': 0.9,
+    'figure.subplot.bottom': 0.11,
+    'figure.subplot.top': 0.88,
+    'figure.facecolor': 'ffffff',
+}
 
-mpl.rcParams['grid.linestyle'] = '-'
-mpl.rcParams['grid.linewidth'] = 1.0
-mpl.rcParams['grid.color'] = 'cbcbcb'
 
-mpl.rcParams['xtick.major.size'] = 0
-mpl.rcParams['xtick.minor.size'] = 0
-mpl.rcParams['ytick.major.size'] = 0
-mpl.rcParams['ytick.minor.size'] = 0
-mpl.rcParams['xtick.labelsize'] = 16
-mpl.rcParams['ytick.labelsize'] = 16
-mpl.rcParams['xtick.color'] = '#252525'
-mpl.rcParams['ytick.color'] = '#252525'
+def set_style():
+    """ Set the GrainSizeTools plot style in the matplotlib rcParams."""
+    import matplotlib as mpl
+    mpl.rcParams.update(style)
 
-mpl.rcParams['savefig.edgecolor'] = 'ffffff'
-mpl.rcParams['savefig.facecolor'] = 'ffffff'
+    return None
 
-mpl.rcParams['figure.subplot.left'] = 0.125
-mpl.rcParams['figure.subplot.right'] = 0.9
-mpl.rcParams['figure.subplot.bottom'] = 0.11
-mpl.rcParams['figure.subplot.top'] = 0.88
-mpl.rcParams['figure.facecolor'] = 'ffffff'
 
 if __name__ == '__main__':
     pass
-else:
-    print('module template imported')
@@ -0,0 +1,194 @@
+# ============================================================================ #
+#                                                                              #
+#    This is part of the "GrainSizeTools Script"                               #
+#    A Python script for characterizing grain size from thin sections          #
+#                                                                              #
+#    Copyright (c) 2014-present   Marco A. Lopez-Sanchez                       #
+#                                                                              #
+#    Licensed under the Apache License, Version 2.0 (the "License");           #
+#    you may not use this file except in compliance with the License.          #
+#    You may obtain a copy of the License at                                   #
+#                                                                              #
+#        http://www.apache.org/licenses/LICENSE-2.0                            #
+#                                                                              #
+#    Unless required by applicable law or agreed to in writing, software       #
+#    distributed under the License is distributed on an "AS IS" BASIS,         #
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  #
+#    See the License for the specific language governing permissions and       #
+#    limitations under the License.                                            #
+#                                                                              #
+#    Version 3.0rc                                                             #
+#    For details see: http://marcoalopez.github.io/GrainSizeTools/             #
+#    download at https://github.com/marcoalopez/GrainSizeTools/releases        #
+#                                                                              #
+# ============================================================================ #
+
+# ============================================================================ #
+# Opt-in timing of the different stages of the main functions (summarize,      #
+# Saltykov, calc_shape...). It records the wall time, the number of calls and  #
+# the size of the arrays processed by each stage. It is disabled by default    #
+# and can be enabled either setting the environment variable                   #
+# GRAINSIZETOOLS_TIMINGS=1 or within a block of code:                          #
+#                                                                              #
+#   with timings.record():                                                     #
+#       summarize(dataset['diameters'])                                        #
+#   timings.stats()                                                            #
+#                                                                              #
+# When disabled, stage() returns a shared do-nothing context manager so the    #
+# overhead is a function call and a flag check.                                #
+# ============================================================================ #
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+_enabled = os.environ.get('GRAINSIZETOOLS_TIMINGS', '').lower() not in ('', '0', 'false', 'no')
+_stats = {}  # {stage name: [calls, total time, max time, total size, max size]}
+_lock = threading.Lock()
+
+
+class _NullStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Stage(object):
+    __slots__ = ('name', 'size', 'start')
+
+    def __init__(self, name, size):
+        self.name, self.size = name, size
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        size = 0 if self.size is None else int(self.size)
+        with _lock:
+            entry = _stats.get(self.name)
+            if entry is None:
+                _stats[self.name] = [1, elapsed, elapsed, size, size]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] = max(entry[2], elapsed)
+                entry[3] += size
+                entry[4] = max(entry[4], size)
+        return False
+
+
+_null_stage = _NullStage()
+
+
+def stage(name, size=None):
+    """ Returns a context manager that times the enclosed block of code
+    under the given stage name when timings are enabled.
+
+    Parameters
+    ----------
+    name : string
+        the name of the stage, e.g. 'summarize.shapiro'
+
+    size : integer or None, optional
+        the size of the array processed by the stage
+
+    Examples
+    --------
+    >>> with stage('Saltykov.unfold', size=numbins):
+    ...     freq3D = unfold_population(freq, bin_edges, binsize, mid_points)
+    """
+    if _enabled is False:
+        return _null_stage
+    return _Stage(name, size)
+
+
+def enable():
+    """ Start recording the timings."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """ Stop recording the timings (the stats recorded are kept)."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """ Remove all the stats recorded."""
+    with _lock:
+        _stats.clear()
+
+
+@contextlib.contextmanager
+def record(clear=True):
+    """ Enable the timings within a block of code.
+
+    Parameters
+    ----------
+    clear : bool, optional
+        remove the stats recorded previously. Default True
+    """
+    previous = _enabled
+    if clear:
+        reset()
+    enable()
+    try:
+        yield
+    finally:
+        if previous is False:
+            disable()
+
+
+def stats():
+    """ Returns the stats recorded as a dict {stage: {'calls', 'total',
+    'mean', 'max', 'size', 'max_size'}}, with times in seconds and sizes
+    as the total and maximum number of array elements processed."""
+    with _lock:
+        return {name: {'calls': calls,
+                       'total': total,
+                       'mean': total / calls,
+                       'max': max_time,
+                       'size': size,
+                       'max_size': max_size}
+                for name, (calls, total, max_time, size, max_size) in sorted(_stats.items())}
+
+
+def to_json(filepath=None):
+    """ Returns the stats recorded as a JSON string and, if a file path
+    is defined, store them in that file."""
+    text = json.dumps(stats(), indent=1)
+    if filepath is not None:
+        with open(filepath, 'w') as fh:
+            fh.write(text)
+    return text
+
+
+def report():
+    """ Print a table with the stats recorded, slowest stages first."""
+    table = sorted(stats().items(), key=lambda item: -item[1]['total'])
+    print('=======================================================================')
+    print('{:<30} {:>7} {:>10} {:>10} {:>10}' .format('stage', 'calls', 'total (s)', 'max (s)', 'max size'))
+    print('=======================================================================')
+    for name, entry in table:
+        print('{:<30} {:>7} {:>10.4f} {:>10.4f} {:>10}'
+              .format(name, entry['calls'], entry['total'], entry['max'], entry['max_size']))
+    print('=======================================================================')
+
+    return None
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,108 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import numpy as np
+
+from grain_size_tools import averages
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class test_package_import(unittest.TestCase):
+
+    def test_lazy_import(self):
+        # importing the statistics modules must not load the heavy dependencies
+        code = ("import sys\n"
+                "import grain_size_tools\n"
+                "from grain_size_tools import averages, GrainSizeTools_script\n"
+                "heavy = ('matplotlib', 'pandas', 'scipy.stats', 'scipy.optimize')\n"
+                "print(','.join(m for m in heavy if m in sys.modules))\n")
+        out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, stdout=subprocess.PIPE,
+                             universal_newlines=True, check=True).stdout
+        self.assertEqual(out.strip(), '')
+
+    def test_lazy_submodule_access(self):
+        import grain_size_tools
+        self.assertIs(grain_size_tools.piezometers,
+                      sys.modules['grain_size_tools.piezometers'])
+        self.assertRaises(AttributeError, getattr, grain_size_tools, 'foo')
+
+
+class test_binned_kde(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.random.RandomState(1).lognormal(3.0, 0.5, 5000)
+
+    def test_matches_gaussian_kde(self):
+        from scipy.stats import gaussian_kde
+        xgrid = np.linspace(self.data.min(), self.data.max(), 1000)
+        for method in ('silverman', 'scott', 2.5):
+            densities, bw = averages.binned_kde(self.data, xgrid, method)
+            if isinstance(method, str):
+                kde = gaussian_kde(self.data, bw_method=method)
+            else:
+                kde = gaussian_kde(self.data, bw_method=method / self.data.std(ddof=1))
+            expected = kde(xgrid)
+            self.assertAlmostEqual(bw, np.sqrt(kde.covariance[0, 0]))
+            self.assertLess(np.abs(densities - expected).max(), 1e-3 * expected.max())
+
+    def test_linear_binning(self):
+        xgrid = np.linspace(0, 10, 11)
+        counts = averages.linear_binning(np.array([0.0, 2.25, 10.0, 12.0]), xgrid, chunksize=3)
+        np.testing.assert_allclose(counts, [1, 0, 0.75, 0.25, 0, 0, 0, 0, 0, 0, 2])
+
+    def test_several_samples(self):
+        xgrid = np.linspace(self.data.min(), self.data.max(), 512)
+        counts = averages.linear_binning(self.data, xgrid)
+        densities = averages.kde_from_counts(np.vstack([counts, counts]), xgrid[1] - xgrid[0], [1.0, 3.0])
+        self.assertEqual(densities.shape, (2, 512))
+        np.testing.assert_allclose(densities[0], averages.kde_from_counts(counts, xgrid[1] - xgrid[0], 1.0))
+
+    def test_wrong_bandwidth(self):
+        self.assertRaises(ValueError, averages.kde_bandwidth, self.data, 'foo')
+
+
+class test_cutoff_sweep(unittest.TestCase):
+
+    def test_matches_filtering(self):
+        data = np.random.RandomState(2).lognormal(3.0, 0.5, 2001)
+        cutoffs = [0, 12.5, 30, 60, 1e6]
+        sweep = averages.cutoff_sweep(data, cutoffs)
+        for i, cutoff in enumerate(cutoffs[:-1]):
+            subset = data[data >= cutoff]
+            mean, sd, (low, high), __ = averages.amean(subset)
+            gmean, msd, (glow, ghigh), __ = averages.gmean(subset)
+            expected = [len(subset), mean, sd, low, high, averages.mCox_ci(subset)[0][1],
+                        gmean, msd, glow, ghigh, np.median(subset)]
+            actual = [sweep[key][i] for key in ('n', 'amean', 'sd', 'amean_ASTM_low', 'amean_ASTM_high',
+                                                'amean_mCox_high', 'gmean', 'msd', 'gmean_low',
+                                                'gmean_high', 'median')]
+            np.testing.assert_allclose(actual, expected, rtol=1e-10)
+        self.assertEqual(sweep['n'][-1], 0)
+        self.assertTrue(np.isnan(sweep['amean'][-1]))
+
+
+class test_area_weighted(unittest.TestCase):
+
+    def test_statistics(self):
+        diameters = np.random.RandomState(3).lognormal(3.0, 0.5, 3000)
+        areas = np.pi * (diameters / 2)**2
+        results = averages.area_weighted(np.append(areas, [0, np.nan]), percentiles=(0, 50, 100))
+        self.assertEqual(results['n'], 3000)
+        self.assertAlmostEqual(results['amean'], np.average(diameters, weights=areas))
+        self.assertAlmostEqual(results['gmean'], np.exp(np.average(np.log(diameters), weights=areas)))
+        low, high = results['amean_ci']
+        self.assertTrue(low < results['amean'] < high)
+        self.assertEqual(results['median'], results['percentiles'][1])
+        np.testing.assert_allclose(results['percentiles'][[0, 2]], [diameters.min(), diameters.max()])
+        self.assertLess(results['n_eff'], results['n'])
+        self.assertTrue(diameters.min() < results['mode'] < results['median'])
+
+        from grain_size_tools.population import GrainPopulation
+        self.assertAlmostEqual(averages.area_weighted(GrainPopulation(diameters))['amean'], results['amean'])
+
+
+if __name__ == "__main__":
+    unittest.main()
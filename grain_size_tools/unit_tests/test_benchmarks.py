@@ -0,0 +1,47 @@
+import unittest
+
+import numpy as np
+
+from grain_size_tools import benchmarks, memo
+
+
+class test_benchmarks(unittest.TestCase):
+
+    def test_datasets(self):
+        for kind, func in benchmarks.datasets.items():
+            data = func(1000, seed=1)
+            self.assertEqual(data.shape, (1000,))
+            self.assertTrue(np.all(data > 0))
+            np.testing.assert_array_equal(data, func(1000, seed=1))
+
+    def test_run_and_compare(self):
+        results = benchmarks.run(sizes=(500,), cases=('Saltykov', 'calc_diffstress'),
+                                 kinds=('lognormal',), repeat=1, verbose=False)
+        self.assertEqual(sorted(results['results']),
+                         ['Saltykov/lognormal/500', 'calc_diffstress/lognormal/500'])
+        self.assertEqual(benchmarks.compare(results, results), [])
+
+        slower = {key: {'time': 2 * value['time'], 'peak_mb': value['peak_mb']}
+                  for key, value in results['results'].items()}
+        regressions = benchmarks.compare(slower, results)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(metric == 'time' for __, metric, __, __, __ in regressions))
+
+    def test_memo_disabled(self):
+        memo.clear(disk=False)
+        memo.enable()
+        try:
+            benchmarks.run(sizes=(500,), cases=('Saltykov',), kinds=('lognormal',), repeat=2, verbose=False)
+            self.assertEqual(memo.info()['hits'], 0)
+            self.assertEqual(memo.info()['entries'], 0)
+            self.assertTrue(memo.is_enabled())
+        finally:
+            memo.disable()
+            memo.clear(disk=False)
+
+    def test_unknown_case(self):
+        self.assertRaises(ValueError, benchmarks.run, sizes=(100,), cases=('foo',))
+
+
+if __name__ == "__main__":
+    unittest.main()
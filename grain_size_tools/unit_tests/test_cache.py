@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from grain_size_tools import cache, loader
+
+filepath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'DATA', 'data_set.txt')
+
+
+class test_dataset_cache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.calls = 0
+        self._load_grains = loader.load_grains
+
+        def counted(*args, **kwargs):
+            self.calls += 1
+            return self._load_grains(*args, **kwargs)
+        loader.load_grains = counted
+
+    def tearDown(self):
+        loader.load_grains = self._load_grains
+        shutil.rmtree(self.tmp)
+
+    def test_load_once(self):
+        store = cache.DatasetCache(os.path.join(self.tmp, 'cache'))
+        first = store.load(filepath, columns=('Area', 'FeretX'))
+        second = store.load(filepath, columns=('Area', 'FeretX'))
+        self.assertEqual(self.calls, 1)
+        self.assertIsInstance(second['diameters'], np.memmap)
+        self.assertEqual(sorted(second), ['Area', 'FeretX', 'diameters'])
+        np.testing.assert_array_equal(first['diameters'], self._load_grains(filepath)['diameters'])
+
+        # different options or modified file content -> new entry
+        store.load(filepath, columns=('Area', 'FeretX'), scale=0.5)
+        copy = os.path.join(self.tmp, 'copy.txt')
+        shutil.copy(filepath, copy)
+        store.load(copy, columns=('Area', 'FeretX'))
+        self.assertEqual(self.calls, 2)
+        with open(copy, 'a') as fh:
+            fh.write('2662\t100.0\t0.5\t10.0\t1.0\t1.0\t10.0\t9.0\t1.1\t0.9\t0.9\n')
+        self.assertEqual(len(store.load(copy, columns=('Area', 'FeretX'))['Area']), 2662)
+        self.assertEqual(self.calls, 3)
+
+    def test_version_upgrade(self):
+        store = cache.DatasetCache(os.path.join(self.tmp, 'cache'))
+        store.load(filepath, columns=('Area',))
+        with mock.patch.object(cache, '__version__', '0.0'):
+            store.load(filepath, columns=('Area',))
+        store.load(filepath, columns=('Area',))
+        self.assertEqual(self.calls, 2)
+
+    def test_lru_eviction(self):
+        store = cache.DatasetCache(os.path.join(self.tmp, 'cache'))
+        store.load(filepath)
+        entry_size = store.size()
+
+        store.max_bytes = int(2.5 * entry_size)
+        for scale in (1.0, 2.0, 3.0):
+            store.load(filepath, scale=scale)
+            time.sleep(0.01)
+        store.load(filepath, scale=1.0)  # most recently used
+        time.sleep(0.01)
+        store.load(filepath, scale=4.0)
+
+        self.assertLessEqual(store.size(), store.max_bytes)
+        self.assertIn(store.key(filepath, scale=1.0), store)
+        self.assertIn(store.key(filepath, scale=4.0), store)
+        self.assertNotIn(store.key(filepath, scale=2.0), store)
+
+
+if __name__ == "__main__":
+    unittest.main()
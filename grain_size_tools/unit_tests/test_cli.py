@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from grain_size_tools import cli
+
+filepath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'DATA', 'data_set.txt')
+
+
+class test_cli(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name in ('a.txt', 'b.txt'):
+            shutil.copy(filepath, os.path.join(self.tmpdir, name))
+        with open(os.path.join(self.tmpdir, 'c.txt'), 'w') as fh:
+            fh.write('no grains here\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_process_file(self):
+        row = cli.process_file(filepath, tasks=cli.available_tasks, options={'seed': 0})
+        self.assertEqual(row['n'], 2661)
+        self.assertAlmostEqual(row['amean'], 34.79, places=2)
+        self.assertEqual(row['bandwidth'], 4.01)
+        self.assertEqual(len([key for key in row if key.startswith('saltykov_freq')]), 10)
+        self.assertTrue(1.5 < row['shape_msd'] < 1.8)
+        self.assertAlmostEqual(row['stress'], 669.0 * row['stress_grain_size']**-0.79)
+
+    def test_batch_to_csv_and_npz(self):
+        import pandas as pd
+
+        pattern = os.path.join(self.tmpdir, '*.txt')
+        for output, jobs in (('results.csv', 1), ('results.npz', 2)):
+            output = os.path.join(self.tmpdir, output)
+            status = cli.main([pattern, '-t', 'summarize', 'stress', '-j', str(jobs), '-q', '-o', output])
+            self.assertEqual(status, 1)  # c.txt cannot be read
+
+            if output.endswith('.csv'):
+                table = pd.read_csv(output, keep_default_na=False, na_values=[''])
+                table = {name: table[name].to_numpy() for name in table.columns}
+            else:
+                table = np.load(output)
+            self.assertEqual([os.path.basename(path) for path in table['filepath']], ['a.txt', 'b.txt', 'c.txt'])
+            np.testing.assert_allclose(table['stress'][:2], table['stress'][0])
+            self.assertTrue(np.isnan(table['stress'][2]))
+            self.assertTrue(str(table['error'][2]).startswith('ValueError'))
+
+    def test_shimizu_requires_temperature(self):
+        with self.assertRaises(SystemExit):
+            cli.main([filepath, '-t', 'stress', '--piezometer', 'Shimizu', '-q'])
+        row = cli.process_file(filepath, tasks=('stress',),
+                               options={'piezometer': 'Shimizu', 'temperature': 450, 'average': 'median'})
+        self.assertGreater(row['stress'], 0)
+
+    def test_manifest_skips_unchanged_files(self):
+        filepaths = cli.expand_paths([os.path.join(self.tmpdir, '*.txt')])
+        manifest = os.path.join(self.tmpdir, 'manifest.json')
+        process = cli._process_task
+
+        # interrupted run: the checkpoint keeps the files already processed
+        def interrupt(filepath, tasks, options):
+            if filepath.endswith('b.txt'):
+                raise KeyboardInterrupt
+            return process(filepath, tasks, options)
+
+        with mock.patch.object(cli, '_process_task', side_effect=interrupt):
+            self.assertRaises(KeyboardInterrupt, cli.run_batch, filepaths, manifest=manifest, checkpoint=1)
+        self.assertEqual([os.path.basename(path) for path in cli.read_manifest(manifest)], ['a.txt'])
+
+        # resume, then only modified files (or new parameters) are processed
+        calls = []
+
+        def count(filepath, tasks, options):
+            calls.append(os.path.basename(filepath))
+            return process(filepath, tasks, options)
+
+        with mock.patch.object(cli, '_process_task', side_effect=count):
+            rows = cli.run_batch(filepaths, manifest=manifest)
+            self.assertEqual(calls, ['b.txt', 'c.txt'])  # c.txt failed and is not recorded
+            self.assertEqual(rows[0]['amean'], rows[1]['amean'])
+
+            with open(os.path.join(self.tmpdir, 'b.txt'), 'a') as fh:
+                fh.write('9999\t314.16\n')
+            del calls[:]
+            rows = cli.run_batch(filepaths, manifest=manifest)
+            self.assertEqual(calls, ['b.txt', 'c.txt'])
+            self.assertEqual(rows[1]['n'], rows[0]['n'] + 1)
+
+            del calls[:]
+            cli.run_batch(filepaths, options={'ci_level': 0.99}, manifest=manifest)
+            self.assertEqual(calls, ['a.txt', 'b.txt', 'c.txt'])
+
+    def test_manifest_with_missing_keys(self):
+        filepaths = cli.expand_paths([os.path.join(self.tmpdir, '[ab].txt')])
+        manifest = os.path.join(self.tmpdir, 'manifest.json')
+        cli.run_batch(filepaths, manifest=manifest, quiet=True)
+
+        # e.g. a manifest written by an older version
+        entries = cli.read_manifest(manifest)
+        del entries[os.path.abspath(filepaths[0])]['hash']
+        del entries[os.path.abspath(filepaths[1])]['params']
+        cli.write_manifest(manifest, entries)
+
+        calls = []
+        process = cli._process_task
+
+        def count(filepath, tasks, options):
+            calls.append(os.path.basename(filepath))
+            return process(filepath, tasks, options)
+
+        with mock.patch.object(cli, '_process_task', side_effect=count):
+            rows = cli.run_batch(filepaths, manifest=manifest, quiet=True)
+        self.assertEqual(calls, ['a.txt', 'b.txt'])
+        self.assertEqual(rows[0]['amean'], rows[1]['amean'])
+        self.assertIn('hash', cli.read_manifest(manifest)[os.path.abspath(filepaths[0])])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from grain_size_tools import loader
+
+filepath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'DATA', 'data_set.txt')
+
+
+class test_load_grains(unittest.TestCase):
+
+    def test_defaults(self):
+        dataset = loader.load_grains(filepath)
+        self.assertEqual(list(dataset.columns), ['Area', 'diameters'])
+        self.assertEqual(len(dataset), 2661)
+        np.testing.assert_allclose(dataset['diameters'], 2 * np.sqrt(dataset['Area'] / np.pi))
+
+    def test_scale_and_dtype(self):
+        raw = loader.load_grains(filepath, columns=('Area', 'FeretX', 'Circ.'))
+        scaled = loader.load_grains(filepath, columns=('Area', 'FeretX', 'Circ.'), scale=0.5, dtype='float32')
+        self.assertTrue(all(dtype == np.float32 for dtype in scaled.dtypes))
+        np.testing.assert_allclose(scaled['Area'], raw['Area'] * 0.25, rtol=1e-6)
+        np.testing.assert_allclose(scaled['FeretX'], raw['FeretX'] * 0.5, rtol=1e-6)
+        np.testing.assert_allclose(scaled['Circ.'], raw['Circ.'], rtol=1e-6)
+        np.testing.assert_allclose(scaled['diameters'], raw['diameters'] * 0.5, rtol=1e-6)
+
+    def test_csv(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'grains.csv')
+            with open(path, 'w') as fh:
+                fh.write('id,Area,AR\n1,3.14159265,1.2\n2,12.5663706,1.5\n')
+            dataset = loader.load_grains(path, diameters=True, columns=())
+            np.testing.assert_allclose(dataset['diameters'], [2.0, 4.0])
+
+    def test_area_to_ecd_in_place(self):
+        areas = np.array([np.pi, 4 * np.pi])
+        out = loader.area_to_ecd(areas, out=areas)
+        self.assertIs(out, areas)
+        np.testing.assert_allclose(areas, [2.0, 4.0])
+
+
+class test_mosaic(unittest.TestCase):
+
+    def test_overlapping_tiles(self):
+        import pandas as pd
+        grains = pd.read_csv(filepath, sep='\t', usecols=['Area', 'FeretX', 'FeretY'])
+        with tempfile.TemporaryDirectory() as tmp:
+            # 2 x 2 tiles overlapping 200 (x) and 300 (y) microns, with local coordinates
+            filepaths, offsets = [], []
+            for x0 in (0, 1400):
+                for y0 in (0, 700):
+                    inside = grains['FeretX'].between(x0, x0 + 1600) & grains['FeretY'].between(y0, y0 + 1000)
+                    tile = grains[inside] - [0, x0, y0]
+                    filepaths.append(os.path.join(tmp, 'tile_{}_{}.txt' .format(x0, y0)))
+                    tile.to_csv(filepaths[-1], sep='\t', index=False)
+                    offsets.append((x0, y0))
+
+            dataset = loader.load_mosaic(filepaths, offsets, tolerance=0.5, jobs=2, max_pending=1)
+            self.assertEqual(len(dataset), len(grains))
+            self.assertGreater(dataset.attrs['duplicates'], 0)
+            np.testing.assert_allclose(np.sort(dataset['Area']), np.sort(grains['Area']))
+            self.assertEqual(sorted(dataset['tile'].unique()), [0, 1, 2, 3])
+
+            # only the grains near the seams are stored in the spatial hash
+            stored = []
+            add = loader._GrainHash.add
+
+            def spy(hash_, x, y, area, candidates=None):
+                result = add(hash_, x, y, area, candidates)
+                stored.append(len(hash_.keys))
+                return result
+
+            with mock.patch.object(loader._GrainHash, 'add', spy):
+                seams = loader.load_mosaic(filepaths, offsets, tolerance=0.5, overlap=300)
+            self.assertEqual(len(seams), len(grains))
+            self.assertEqual(seams.attrs['duplicates'], dataset.attrs['duplicates'])
+            self.assertLess(stored[-1], 0.75 * len(grains))
+
+    def test_grain_hash(self):
+        rng = np.random.RandomState(0)
+        x, y, area = rng.uniform(0, 100, (3, 1000))
+        seen = loader._GrainHash(tolerance=0.1, area_tolerance=0.01)
+        self.assertFalse(seen.add(x[:600], y[:600], area[:600]).any())
+        duplicated = seen.add(x[400:], y[400:], area[400:])
+        np.testing.assert_array_equal(duplicated, np.arange(400, 1000) < 600)
+        self.assertTrue(np.all(np.diff(seen.keys) >= 0))
+        self.assertEqual(len(seen.keys), 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
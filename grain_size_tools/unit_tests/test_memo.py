@@ -0,0 +1,60 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from grain_size_tools import memo, stereology
+from grain_size_tools.GrainSizeTools_script import describe
+
+
+class test_memo(unittest.TestCase):
+
+    def setUp(self):
+        self.diameters = np.random.RandomState(42).lognormal(3.5, 0.5, 300)
+        memo.enable(max_entries=4)
+        memo.clear()
+
+    def tearDown(self):
+        memo.clear()
+        memo.disable()
+
+    def test_keyed_by_data_arguments_and_seed(self):
+        np.random.seed(1)
+        first = describe(self.diameters)['amean_ci']  # the normality tests and the CI
+        state = np.random.get_state()[1].copy()
+
+        np.random.seed(1)
+        second = describe(self.diameters.copy(), ('amean', 'median'))
+        self.assertEqual(second['amean_ci'], first)
+        self.assertEqual(memo.info(), {'hits': 2, 'misses': 2, 'entries': 2})
+        np.testing.assert_array_equal(np.random.get_state()[1], state)
+
+        np.random.seed(2)
+        describe(self.diameters)['shapiro']
+        describe(self.diameters, ci_level=0.99)['median_ci']
+        describe(self.diameters.astype('float32'))['mode']
+        self.assertEqual(memo.info(), {'hits': 2, 'misses': 5, 'entries': 4})
+
+        # least recently used results are discarded
+        np.random.seed(1)
+        describe(self.diameters)['shapiro']
+        self.assertEqual(memo.info()['misses'], 6)
+
+    def test_saltykov_and_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            memo.enable(directory=directory)
+            expected = stereology.Saltykov(self.diameters, numbins=12, return_data=True)
+            memo.clear(disk=False)
+            mid_points, frequencies = stereology.Saltykov(self.diameters, numbins=12, return_data=True)
+            self.assertEqual(memo.info()['hits'], 1)
+            np.testing.assert_array_equal(frequencies, expected[1])
+
+        # the nested Saltykov calls of twostep_fit are not memoized
+        memo.enable()
+        memo.clear()
+        stereology.twostep_fit(self.diameters)
+        self.assertEqual(memo.info(), {'hits': 0, 'misses': 1, 'entries': 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
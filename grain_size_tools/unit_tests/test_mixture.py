@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+
+from grain_size_tools import mixture, simulate
+
+
+class test_mixture(unittest.TestCase):
+
+    def setUp(self):
+        self.d = simulate.sphere_diameters(20000, shape=(1.4, 1.3), scale=(20, 80), weights=(0.6, 0.4), seed=1)
+
+    def test_recovers_components(self):
+        result = mixture.fit(self.d, k=2, seed=0)
+        self.assertTrue(result['converged'])
+        np.testing.assert_allclose(result['gmean'], [20, 80], rtol=0.02)
+        np.testing.assert_allclose(result['msd'], [1.4, 1.3], rtol=0.02)
+        np.testing.assert_allclose(result['weights'], [0.6, 0.4], atol=0.02)
+        # EM never decreases the likelihood
+        self.assertTrue(np.all(np.diff(result['history']) > -1e-6))
+        self.assertAlmostEqual(result['loglik'], np.max(result['start_loglik']))
+
+    def test_quantile_start(self):
+        # the deterministic start must not depend on the order of the grains
+        d = self.d[:2000].copy()
+        np.random.RandomState(3).shuffle(d)
+        result = mixture.fit(d, k=2, n_init=1, bins=None)
+        self.assertTrue(result['converged'])
+        np.testing.assert_allclose(result['gmean'], [20, 80], rtol=0.05)
+
+        x = np.log(d)
+        mu, __, __ = mixture._initialize(x, np.ones_like(x), 2, 1, np.random.RandomState(0))
+        np.testing.assert_allclose(mu[0], np.percentile(x, [25, 75]), atol=0.01)
+
+    def test_numpy_integer_bins(self):
+        result = mixture.fit(self.d, k=2, bins=np.int64(512), seed=0)
+        np.testing.assert_allclose(result['gmean'], [20, 80], rtol=0.02)
+
+    def test_single_lognormal(self):
+        # with one component EM gives the log mean and log standard deviation
+        result = mixture.fit(self.d, k=1, bins=None)
+        self.assertAlmostEqual(result['gmean'][0], np.exp(np.mean(np.log(self.d))))
+        self.assertAlmostEqual(result['msd'][0], np.exp(np.std(np.log(self.d))))
+
+    def test_binned_and_weights(self):
+        exact = mixture.fit(self.d, k=2, bins=None, seed=0)
+        binned = mixture.fit(self.d, k=2, bins=4096, seed=0)
+        np.testing.assert_allclose(exact['gmean'], binned['gmean'], rtol=1e-3)
+
+        values, counts = np.unique(np.round(self.d), return_counts=True)
+        weighted = mixture.fit(values, k=2, weights=counts, seed=0)
+        np.testing.assert_allclose(weighted['gmean'], exact['gmean'], rtol=0.02)
+
+    def test_select_components(self):
+        best, table = mixture.select_components(self.d, k_max=3, seed=0)
+        self.assertEqual(best['k'], 2)
+        self.assertEqual(sorted(table), [1, 2, 3])
+        self.assertRaises(ValueError, mixture.select_components, self.d, criterion='r2')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import contextlib
+import io
+import unittest
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.collections import PolyCollection
+from scipy.stats import gaussian_kde
+
+from grain_size_tools import plot
+
+
+class test_distribution(unittest.TestCase):
+
+    def setUp(self):
+        self.d = np.random.RandomState(1).lognormal(np.log(35), np.log(1.6), 100000)
+
+    def tearDown(self):
+        plt.close('all')
+
+    def test_binned(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            fig, ax = plot.distribution(self.d, binned=True, binsize=0.01, max_bins=100)
+
+        # a single step patch instead of one patch per class
+        self.assertEqual(len(ax.patches), 0)
+        self.assertEqual(sum(isinstance(c, PolyCollection) for c in ax.collections), 1)
+        self.assertIn('Number of classes =  100', output.getvalue())
+
+        # the binned KDE matches the exact one
+        x_values, y_values = ax.lines[0].get_data()
+        index = np.linspace(0, len(x_values) - 1, 40).astype(int)
+        exact = gaussian_kde(self.d, bw_method='silverman')(x_values[index])
+        np.testing.assert_allclose(y_values[index], exact, atol=1e-3 * exact.max())
+
+    def test_existing_axes(self):
+        fig, ax = plt.subplots()
+        num_figures = len(plt.get_fignums())
+        with contextlib.redirect_stdout(io.StringIO()):
+            fig2, ax2 = plot.distribution(self.d, binned=True, ax=ax)
+        self.assertIs(ax2, ax)
+        self.assertIs(fig2, fig)
+        self.assertEqual(len(plt.get_fignums()), num_figures)
+
+
+class test_normalized_multi(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(2)
+        self.samples = {'fine': rng.lognormal(np.log(20), 0.4, 5000),
+                        'medium': rng.lognormal(np.log(40), 0.3, 3000),
+                        'coarse': rng.lognormal(np.log(80), 0.5, 4000),
+                        'mixed': rng.lognormal(np.log(50), 0.6, 2000),
+                        'narrow': rng.lognormal(np.log(30), 0.2, 6000)}
+
+    def tearDown(self):
+        plt.close('all')
+
+    def normalized_multi(self, *args, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return plot.normalized_multi(*args, **kwargs)
+
+    def test_densities(self):
+        fig, ax, (x, densities) = self.normalized_multi(list(self.samples.values()), gridsize=500)
+        self.assertEqual(densities.shape, (5, 500))
+        self.assertEqual(len(x), 500)
+        np.testing.assert_allclose(densities.sum(axis=1) * (x[1] - x[0]), 1, atol=0.02)
+
+    def test_layouts(self):
+        fig, ax, __ = self.normalized_multi(self.samples, layout='overlay')
+        self.assertEqual(len(fig.axes), 1)
+        labels = [text.get_text() for text in ax.get_legend().get_texts()]
+        self.assertEqual(labels, list(self.samples))
+
+        fig, axes, (x, densities) = self.normalized_multi(self.samples, avg='median', layout='grid',
+                                                          gridsize=200)
+        self.assertEqual(axes.shape, (2, 3))
+        self.assertEqual(sum(ax.get_visible() for ax in axes.flat), 5)
+        self.assertEqual([ax.get_title() for ax in axes.flat[:5]], list(self.samples))
+        self.assertEqual(densities.shape, (5, 200))
+
+    def test_wrong_options(self):
+        self.assertRaises(ValueError, plot.normalized_multi, self.samples, avg='mode')
+        self.assertRaises(ValueError, plot.normalized_multi, self.samples, layout='stack')
+
+
+if __name__ == "__main__":
+    unittest.main()
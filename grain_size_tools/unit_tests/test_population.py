@@ -0,0 +1,108 @@
+import unittest
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+from grain_size_tools import averages, plot, stereology
+from grain_size_tools.population import GrainAccumulator, GrainPopulation, SizeIndex
+
+
+class test_population(unittest.TestCase):
+
+    def setUp(self):
+        self.diameters = np.random.RandomState(42).lognormal(3.5, 0.5, 301)
+        self.pop = GrainPopulation(self.diameters)
+
+    def test_cleaning(self):
+        pop = GrainPopulation([np.nan, 2.0, -1.0, 0.0, np.inf, 4.0])
+        self.assertEqual((len(pop), pop.missing, pop.removed), (2, 2, 2))
+        self.assertFalse(pop.values.flags.writeable)
+        with self.assertRaises(ValueError):
+            GrainPopulation([np.nan, 0.0])
+        with self.assertRaises(ValueError):
+            GrainPopulation(np.ones((2, 2)))
+
+    def test_statistics(self):
+        d, pop = self.diameters, self.pop
+        self.assertAlmostEqual(pop.mean(), np.mean(d))
+        self.assertAlmostEqual(pop.std(), np.std(d, ddof=1))
+        self.assertAlmostEqual(pop.var(ddof=0, log=True), np.var(np.log(d)))
+        self.assertEqual(pop.median(), np.median(d))
+        np.testing.assert_allclose(pop.percentile([0, 25, 50, 99.5]), np.percentile(d, [0, 25, 50, 99.5]))
+        self.assertEqual(pop.median(), np.median(d))  # from the sorted values
+        self.assertEqual((pop.min(), pop.max()), (d.min(), d.max()))
+
+    def test_areas(self):
+        pop = GrainPopulation(self.pop.areas, areas=True)
+        np.testing.assert_allclose(pop.values, self.diameters)
+        np.testing.assert_allclose(np.asarray(pop), self.diameters)
+
+    def test_accepted_in_place_of_arrays(self):
+        d, pop = self.diameters, self.pop
+        self.assertAlmostEqual(averages.gmean(pop), averages.gmean(d))
+        np.random.seed(1)
+        ci_pop = averages.GCI_ci(pop)[0]
+        np.random.seed(1)
+        np.testing.assert_allclose(ci_pop, averages.GCI_ci(d)[0])
+        np.testing.assert_allclose(averages.median_ci(pop, len(d))[0], averages.median_ci(np.sort(d), len(d))[0])
+        np.testing.assert_allclose(averages.freq_peak(pop)[1:], averages.freq_peak(d)[1:])
+        np.testing.assert_allclose(stereology.twostep_fit(pop)[1], stereology.twostep_fit(d)[1])
+        np.testing.assert_allclose(stereology.Saltykov(pop, numbins=12, return_data=True)[1],
+                                   stereology.Saltykov(d, numbins=12, return_data=True)[1])
+        for fig, ax in (plot.distribution(pop), plot.area_weighted(pop), plot.qq_plot(pop)):
+            plt.close(fig)
+
+    def test_size_index(self):
+        d, areas = self.diameters, self.pop.areas
+        index = SizeIndex(d, areas)
+        x = [0, 20, 33.3, 1000]
+        np.testing.assert_allclose(index.fraction_below(x), [np.mean(d <= v) for v in x])
+        np.testing.assert_allclose(index.fraction_below(x, weighted=True),
+                                   [areas[d <= v].sum() / areas.sum() for v in x])
+        np.testing.assert_allclose(index.size_at([0, 10, 50, 97.5]), np.percentile(d, [0, 10, 50, 97.5]))
+        self.assertGreater(index.size_at(50, weighted=True), np.median(d))
+        edges = np.arange(0, 200, 10)
+        np.testing.assert_array_equal(index.sums(edges), np.histogram(d, edges)[0])
+        np.testing.assert_allclose(self.pop.index.sums(edges, weighted=True),
+                                   np.histogram(d, edges, weights=areas)[0])
+        self.assertRaises(ValueError, SizeIndex(d).fraction_below, 10, True)
+        fig, ax = plot.area_weighted(d, areas, binsize=5)
+        plt.close(fig)
+
+
+class test_accumulator(unittest.TestCase):
+
+    def test_merge(self):
+        import json
+        d = np.random.RandomState(6).lognormal(3.0, 0.5, 10001)
+        edges = np.linspace(0, d.max(), 13)
+        parts = [GrainAccumulator(edges).add(part) for part in np.array_split(d, 5)]
+        total = GrainAccumulator.from_dict(json.loads(json.dumps(parts[2].to_dict())))
+        for part in parts[:2] + parts[3:]:
+            total.merge(part)
+        total.merge(GrainAccumulator(edges).add([np.nan, -1.0]))
+
+        self.assertEqual((len(total), total.removed, total.outside), (len(d), 2, 0))
+        for method in ('ASTM', 'mCox'):
+            np.testing.assert_allclose(total.amean(method=method)[2], averages.amean(d, method=method)[2])
+        np.testing.assert_allclose(total.gmean()[:2], averages.gmean(d)[:2])
+        np.testing.assert_allclose(total.percentile([10, 50, 90]), np.percentile(d, [10, 50, 90]), rtol=0.01)
+        np.testing.assert_allclose(total.Saltykov(return_data=True)[1],
+                                   stereology.Saltykov(d, numbins=12, return_data=True)[1])
+        self.assertRaises(ValueError, total.merge, GrainAccumulator())
+
+    def test_accumulator_precision(self):
+        # large offset and small spread: sum(d**2) - n * mean**2 cancels out
+        d = 1e4 + np.random.RandomState(3).normal(0, 0.01, 100000)
+        total = GrainAccumulator()
+        for part in np.array_split(d, 7):
+            total.merge(GrainAccumulator().add(part))
+        self.assertAlmostEqual(total.mean(), np.mean(d))
+        self.assertAlmostEqual(total.std() / np.std(d, ddof=1), 1, places=8)
+        self.assertAlmostEqual(total.std(log=True) / np.std(np.log(d), ddof=1), 1, places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from grain_size_tools import render
+
+
+class test_render_batch(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(42)
+        self.samples = {'a': rng.lognormal(3.0, 0.5, 500),
+                        'b': rng.lognormal(3.5, 0.4, 500)}
+
+    def test_render_and_skip(self):
+        with tempfile.TemporaryDirectory() as outdir:
+            kinds = ('distribution', 'Saltykov', 'twostep')
+            status = render.render_batch(self.samples, kinds=kinds, outdir=outdir)
+            self.assertEqual(len(status), 6)
+            self.assertTrue(all(v == 'rendered' for v in status.values()))
+            self.assertTrue(all(os.path.getsize(path) > 0 for path in status))
+
+            # nothing changed, nothing to render
+            status = render.render_batch(self.samples, kinds=kinds, outdir=outdir)
+            self.assertTrue(all(v == 'skipped' for v in status.values()))
+
+            # only the modified sample is rendered again
+            self.samples['b'] = self.samples['b'] * 2
+            status = render.render_batch(self.samples, kinds=kinds, outdir=outdir)
+            self.assertEqual(sorted(set(os.path.basename(p)[0] for p, v in status.items()
+                                        if v == 'rendered')), ['b'])
+
+    def test_parallel_svg(self):
+        with tempfile.TemporaryDirectory() as outdir:
+            status = render.render_batch(self.samples, outdir=outdir, fmt='svg',
+                                         jobs=2, skip_unchanged=False)
+            self.assertEqual(len(status), 2)
+            self.assertFalse(os.path.exists(os.path.join(outdir, 'render_manifest.json')))
+
+    def test_wrong_kind(self):
+        self.assertRaises(ValueError, render.render_batch, self.samples, kinds='foo')
+
+
+if __name__ == "__main__":
+    unittest.main()
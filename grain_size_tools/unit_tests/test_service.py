@@ -0,0 +1,97 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from grain_size_tools import GrainSizeTools_script, service
+from grain_size_tools.GrainSizeTools_script import describe
+
+
+class test_service(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = service.make_server(('127.0.0.1', 0), jobs=1)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.address = cls.server.server_address
+        cls.diameters = np.random.RandomState(42).lognormal(3.5, 0.5, 500)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_requests(self):
+        self.assertEqual(service.call('health', address=self.address)['status'], 'ok')
+
+        results = service.call('summarize', self.diameters, address=self.address, seed=1)
+        np.random.seed(1)
+        expected = describe(self.diameters)
+        self.assertAlmostEqual(results['amean'], expected['amean'])
+        self.assertEqual(results['amean_method'], expected['amean_method'])
+        self.assertAlmostEqual(results['mode'], expected['mode'])
+
+        results = service.call('Saltykov', self.diameters, address=self.address, numbins=12)
+        self.assertEqual(len(results['frequencies']), 12)
+
+        results = service.call('calc_diffstress', [10.0, 100.0], address=self.address,
+                               phase='quartz', piezometer='Stipp_Tullis')
+        np.testing.assert_allclose(results['stress'], [108.5, 17.6], atol=0.01)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, service.call, 'summarize', [], address=self.address)
+        self.assertRaises(ValueError, service.call, 'calc_diffstress', 10.0, address=self.address,
+                          phase='quartz', piezometer='Shimizu')
+        self.assertRaises(ValueError, service.call, 'foo', [1.0], address=self.address)
+
+    def test_concurrent_seeds(self):
+        # threads of the same process share the global random generator
+        server = service.make_server(('127.0.0.1', 0), jobs=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            expected = {seed: service.call('summarize', self.diameters, address=server.server_address,
+                                           seed=seed) for seed in (1, 2)}
+            results = [None] * 8
+
+            def request(i):
+                results[i] = service.call('summarize', self.diameters, address=server.server_address,
+                                          seed=1 + i % 2)
+
+            def slow_describe(*args, **kwargs):
+                time.sleep(0.05)  # let the other threads run between seeding and sampling
+                return describe(*args, **kwargs)
+
+            with mock.patch.object(GrainSizeTools_script, 'describe', side_effect=slow_describe):
+                threads = [threading.Thread(target=request, args=(i,)) for i in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            for i, result in enumerate(results):
+                self.assertEqual(result, expected[1 + i % 2])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    @unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'requires Unix sockets')
+    def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'service.sock')
+            server = service.make_server(path, jobs=0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                results = service.call('calc_shape', self.diameters, address=path)
+                self.assertTrue(1.3 < results['msd'] < 1.8)
+            finally:
+                server.shutdown()
+                server.server_close()
+            self.assertFalse(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+import numpy as np
+
+from grain_size_tools import simulate, stereology
+
+
+class test_sections(unittest.TestCase):
+
+    def test_seed_and_chunks(self):
+        d = simulate.section_diameters(1000, seed=5, chunksize=300)
+        np.testing.assert_array_equal(d, simulate.section_diameters(1000, seed=5, chunksize=300))
+        chunks = list(simulate.iter_sections(1000, seed=5, chunksize=300))
+        self.assertEqual([len(chunk) for chunk in chunks], [300, 300, 300, 100])
+        np.testing.assert_array_equal(np.concatenate(chunks), d)
+
+    def test_ground_truth(self):
+        # equal spheres: the mean apparent diameter is pi / 4 * D
+        d = simulate.section_diameters(10**5, spheres=[10.0], seed=1)
+        self.assertTrue(np.all(d <= 10))
+        self.assertAlmostEqual(d.mean(), simulate.ground_truth(spheres=[10.0])['apparent_amean'], places=1)
+
+        d = simulate.section_diameters(10**5, shape=(1.4, 1.3), scale=(20, 80), weights=(0.6, 0.4), seed=2)
+        truth = simulate.ground_truth(shape=(1.4, 1.3), scale=(20, 80), weights=(0.6, 0.4))
+        self.assertAlmostEqual(d.mean() / truth['apparent_amean'], 1, places=2)
+
+    def test_stereology(self):
+        d = simulate.section_diameters(3000, shape=1.5, scale=40, seed=3)
+        (msd, gmean), (msd_err, gmean_err) = stereology.mle_fit(d)
+        self.assertLess(abs(msd - 1.5), 3 * msd_err)
+        self.assertLess(abs(gmean - 40), 3 * gmean_err)
+
+    def test_wrong_parameters(self):
+        self.assertRaises(ValueError, simulate.sphere_diameters, 10, shape=0.5)
+        self.assertRaises(ValueError, simulate.sphere_diameters, 10, shape=(1.4, 1.3), weights=(1,))
+        self.assertRaises(ValueError, simulate.section_diameters, 10, spheres=[-1.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
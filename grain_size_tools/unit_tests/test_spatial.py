@@ -0,0 +1,94 @@
+import unittest
+
+import numpy as np
+
+from grain_size_tools import spatial
+from grain_size_tools.GrainSizeTools_script import estimate_stress
+
+
+class test_grid_map(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(4)
+        self.x, self.y = rng.uniform(0, 1000, 5000), rng.uniform(0, 500, 5000)
+        self.d = rng.lognormal(3.0, 0.5, 5000)
+
+    def test_cells(self):
+        maps = spatial.grid_map(self.x, self.y, self.d, cell_size=100, min_grains=2)
+        self.assertEqual(maps['count'].shape, (5, 10))
+        self.assertEqual(maps['count'].sum(), 5000)
+
+        # the cell in the third row and fourth column
+        mask = (self.x >= 300) & (self.x < 400) & (self.y >= 200) & (self.y < 300)
+        d = self.d[mask]
+        self.assertEqual(maps['count'][2, 3], len(d))
+        self.assertAlmostEqual(maps['amean'][2, 3], np.mean(d))
+        self.assertAlmostEqual(maps['gmean'][2, 3], np.exp(np.mean(np.log(d))))
+        self.assertAlmostEqual(maps['msd'][2, 3], np.exp(np.std(np.log(d), ddof=1)))
+        self.assertAlmostEqual(maps['rms'][2, 3], np.sqrt(np.mean(d**2)))
+
+    def test_extent_and_stress(self):
+        x, y, d = np.array([1, 2, 15, 50]), np.array([1, 2, 5, 5]), np.array([10., 20., 30., 40.])
+        maps = spatial.grid_map(x, y, d, cell_size=10, extent=(0, 20, 0, 10), min_grains=2,
+                                phase='quartz', piezometer='Stipp_Tullis', average='rms')
+        np.testing.assert_array_equal(maps['count'], [[2, 1]])
+        self.assertTrue(np.isnan(maps['amean'][0, 1]))
+        self.assertAlmostEqual(maps['stress'][0, 0],
+                               estimate_stress(np.sqrt(250), 'quartz', 'Stipp_Tullis')[0])
+        self.assertRaises(ValueError, spatial.grid_map, x, y, d, 10, average='median')
+
+        # grains beyond the requested extent but within the last (rounded up) cell
+        maps = spatial.grid_map([1, 12, 17], [1, 1, 1], [10., 20., 30.], cell_size=10, extent=(0, 15, 0, 10))
+        np.testing.assert_array_equal(maps['count'], [[1, 1]])
+        self.assertAlmostEqual(maps['amean'][0, 1], 20)
+
+
+class test_local_stats(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(5)
+        self.x, self.y = rng.uniform(0, 100, 400), rng.uniform(0, 100, 400)
+        self.d = rng.lognormal(3.0, 0.5, 400)
+
+    def brute_force(self, px, py, radius=None, k=None):
+        distance = np.hypot(self.x - px, self.y - py)
+        d = self.d[distance <= radius] if k is None else self.d[np.argsort(distance)[:k]]
+        return len(d), np.mean(d), np.exp(np.mean(np.log(d))), np.median(d)
+
+    def test_radius(self):
+        local = spatial.local_stats(self.x, self.y, self.d, radius=12, workers=1, chunksize=50)
+        for i in (0, 17, 399):
+            expected = self.brute_force(self.x[i], self.y[i], radius=12)
+            actual = [local[key][i] for key in ('count', 'amean', 'gmean', 'median')]
+            np.testing.assert_allclose(actual, expected)
+
+        local = spatial.local_stats(self.x, self.y, self.d, radius=10, points=[[50, 50], [-50, -50]],
+                                    min_grains=2)
+        np.testing.assert_allclose(local['amean'][0], self.brute_force(50, 50, radius=10)[1])
+        self.assertEqual(local['count'][1], 0)
+        self.assertTrue(np.isnan(local['median'][1]))
+
+    def test_nearest(self):
+        local = spatial.local_stats(self.x, self.y, self.d, k=10)
+        for i in (3, 250):
+            expected = self.brute_force(self.x[i], self.y[i], k=10)
+            actual = [local[key][i] for key in ('count', 'amean', 'gmean', 'median')]
+            np.testing.assert_allclose(actual, expected)
+        self.assertRaises(ValueError, spatial.local_stats, self.x, self.y, self.d, radius=5, k=3)
+
+    def test_invalid_grains(self):
+        d = self.d.copy()
+        d[10], d[20] = np.nan, 0
+        local = spatial.local_stats(self.x, self.y, d, radius=12)
+        self.assertEqual(len(local['count']), len(d))
+        self.assertEqual(local['count'][10], 0)
+        self.assertTrue(np.isnan(local['amean'][20]))
+
+        valid = np.isfinite(d) & (d > 0)
+        for key in ('count', 'amean', 'gmean', 'median'):
+            expected = spatial.local_stats(self.x[valid], self.y[valid], d[valid], radius=12)[key]
+            np.testing.assert_allclose(local[key][valid], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from grain_size_tools import loader, simulate, stereology
+
+filepath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'DATA', 'data_set.txt')
+
+
+class test_saltykov(unittest.TestCase):
+
+    def setUp(self):
+        self.d = loader.load_grains(filepath)['diameters'].to_numpy()
+
+    def test_from_counts(self):
+        counts, bin_edges = np.histogram(self.d, bins=14, range=(0, self.d.max()))
+        mid_points, freqs = stereology.Saltykov(self.d, numbins=14, return_data=True)
+        mid_points2, freqs2 = stereology.Saltykov_from_counts(counts, bin_edges, return_data=True)
+        np.testing.assert_allclose(mid_points, mid_points2)
+        np.testing.assert_allclose(freqs, freqs2)
+        self.assertAlmostEqual(np.sum(freqs * (mid_points[1] - mid_points[0])), 1.0)
+
+    def test_streamed_histogram(self):
+        counts, bin_edges = loader.histogram_from_file(filepath, numbins=12, chunksize=500)
+        expected, expected_edges = np.histogram(self.d, bins=12, range=(0, self.d.max()))
+        np.testing.assert_array_equal(counts, expected)
+        np.testing.assert_allclose(bin_edges, expected_edges)
+
+        counts, bin_edges = loader.histogram_from_file(filepath, numbins=12, left_edge='min',
+                                                       max_diameter=100, chunksize=500)
+        self.assertEqual(counts.sum(), np.sum(self.d <= 100))
+        self.assertAlmostEqual(bin_edges[0], self.d.min())
+
+    def test_wrong_numbins(self):
+        self.assertRaises(ValueError, stereology.Saltykov, self.d, numbins=0)
+        self.assertRaises(ValueError, loader.histogram_from_file, filepath, numbins=2.5)
+
+
+class test_mle_fit(unittest.TestCase):
+
+    def test_wicksell_density(self):
+        from scipy.integrate import quad
+        from scipy.stats import lognorm
+
+        msd, gmean = 1.6, 30.0
+        mean = gmean * np.exp(np.log(msd)**2 / 2)
+        for d in (0.5, 30.0, 120.0):
+            expected = d / mean * quad(lambda D: lognorm.pdf(D, np.log(msd), scale=gmean) / np.sqrt(D**2 - d**2),
+                                       d, np.inf, limit=200)[0]
+            self.assertAlmostEqual(stereology.wicksell_lognormal(d, msd, gmean) / expected, 1.0, places=6)
+
+    def test_recovers_parameters(self):
+        # random sections through lognormal spheres (sampled proportional to size)
+        rng = np.random.default_rng(42)
+        D = rng.lognormal(np.log(40), np.log(1.5), 100000)
+        D = D[rng.random(D.size) < D / D.max()]
+        d = D[:3000] * np.sqrt(1 - rng.random(3000)**2)
+
+        (msd, gmean), (msd_err, gmean_err) = stereology.mle_fit(d)
+        self.assertLess(abs(msd - 1.5), 3 * msd_err)
+        self.assertLess(abs(gmean - 40), 3 * gmean_err)
+
+    def test_binned_fit(self):
+        d = simulate.section_diameters(100000, shape=1.5, scale=40, seed=7)
+        start = time.perf_counter()
+        params, errors = stereology.mle_fit(d)
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertLess(abs(params[0] - 1.5), 3 * errors[0])
+
+        exact_params, exact_errors = stereology.mle_fit(d[:5000], bins=None)
+        binned_params, binned_errors = stereology.mle_fit(d[:5000], bins=1024)
+        np.testing.assert_allclose(binned_params, exact_params, rtol=1e-3)
+        np.testing.assert_allclose(binned_errors, exact_errors, rtol=1e-2)
+
+        params, errors = stereology.mle_fit(d[:5000], bins=np.int64(1024))
+        np.testing.assert_allclose(params, binned_params)
+
+    def test_failed_fit(self):
+        d = simulate.section_diameters(200, shape=1.5, scale=40, seed=8)
+        with mock.patch.object(stereology, '_hessian', return_value=np.array([[1.0, 0.0], [0.0, -1.0]])):
+            self.assertRaises(ValueError, stereology.mle_fit, d)
+
+        from scipy import optimize
+        minimize = optimize.minimize
+
+        def fail(*args, **kwargs):
+            result = minimize(*args, **kwargs)
+            result.success, result.message = False, 'ABNORMAL'
+            return result
+
+        with mock.patch.object(optimize, 'minimize', side_effect=fail):
+            self.assertRaises(ValueError, stereology.mle_fit, d)
+
+
+if __name__ == "__main__":
+    unittest.main()
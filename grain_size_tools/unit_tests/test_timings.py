@@ -0,0 +1,36 @@
+import json
+import unittest
+
+import numpy as np
+
+from grain_size_tools import stereology, timings
+
+
+class test_timings(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.random.RandomState(3).lognormal(3.0, 0.5, 2000)
+
+    def test_disabled_by_default(self):
+        timings.reset()
+        with timings.stage('foo', 10):
+            pass
+        self.assertFalse(timings.is_enabled())
+        self.assertEqual(timings.stats(), {})
+
+    def test_record_stages(self):
+        with timings.record():
+            stereology.Saltykov(self.data, numbins=12, return_data=True)
+            stereology.Saltykov(self.data, numbins=12, return_data=True)
+        self.assertFalse(timings.is_enabled())
+
+        stats = timings.stats()
+        self.assertEqual(sorted(stats), ['Saltykov.cdf', 'Saltykov.histogram', 'Saltykov.unfold'])
+        self.assertEqual(stats['Saltykov.histogram']['calls'], 2)
+        self.assertEqual(stats['Saltykov.histogram']['max_size'], 2000)
+        self.assertEqual(stats['Saltykov.unfold']['size'], 24)
+        self.assertEqual(json.loads(timings.to_json()), stats)
+
+
+if __name__ == "__main__":
+    unittest.main()
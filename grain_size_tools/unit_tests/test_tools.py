@@ -1,27 +1,63 @@
+import os
 import unittest
-from tools import *
 
-# import test dataset and store expected results
-#TODO
+import numpy as np
 
-class test_tools_function(unittest.TestCase):
+from grain_size_tools import averages
+from grain_size_tools.GrainSizeTools_script import conf_interval, calc_diffstress, describe, estimate_stress
 
-    def test_calc_freq_grainsize(self):       
-        # test default values
-        self.assertAlmostEqual(calc_freq_grainsize(d), results_01)
+# import test dataset (ImageJ output) and estimate the equivalent circular diameters
+filepath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'DATA', 'data_set.txt')
+areas = np.genfromtxt(filepath, delimiter='\t', skip_header=1, usecols=1)  # Area column
+d = 2 * np.sqrt(areas / np.pi)
 
-        # test bin size methods
-        self.assertAlmostEqual(calc_freq_grainsize(d, binsize='fd'), results_01)
-        self.assertAlmostEqual(calc_freq_grainsize(d, binsize='scott'), results_01)
-        self.assertAlmostEqual(calc_freq_grainsize(d, binsize='scott'), results_01)
 
-    def test_calc_freq_grainsize_err(self):
-        # make sure value errors are raised when necessary
-        self.assertRaises(ValueError, calc_freq_grainsize, d, )
+class test_tools_function(unittest.TestCase):
+
+    def test_conf_interval(self):
+        amean, err, (low, high) = conf_interval(d)
+        self.assertAlmostEqual(amean, 34.7857, places=4)
+        self.assertAlmostEqual(err, 0.6963, places=4)
+        self.assertAlmostEqual(high - low, 2 * err)
 
     def test_calc_freq_peak(self):
         # test default values
-        self.assertAlmostEqual(calc_freq_peak(d), )
+        __, peak, density, bw = averages.freq_peak(d)
+        self.assertAlmostEqual(peak, 24.25, places=1)
+        self.assertEqual(bw, 4.01)
+
+    def test_calc_freq_peak_err(self):
+        # make sure value errors are raised when necessary
+        self.assertRaises(ValueError, averages.freq_peak, d, bandwidth=None)
+
+    def test_calc_diffstress(self):
+        stress = calc_diffstress(np.array([10.0, 100.0]), 'quartz', 'Stipp_Tullis')
+        np.testing.assert_allclose(stress, [108.5, 17.6])
+        self.assertRaises(ValueError, calc_diffstress, 10.0, 'foo', 'Stipp_Tullis')
+
+    def test_estimate_stress(self):
+        stress, warn, linear_interceps = estimate_stress(np.array([10.0, 100.0]), 'quartz', 'Stipp_Tullis')
+        np.testing.assert_allclose(stress, [108.5, 17.6], atol=0.01)
+        self.assertIn('root mean square', warn)
+        self.assertRaises(ValueError, estimate_stress, 10.0, 'quartz', 'Shimizu')
+        stress = calc_diffstress(np.array([10.0]), 'quartz', 'Shimizu', temperature=450)
+        np.testing.assert_allclose(stress, estimate_stress(10.0, 'quartz', 'Shimizu', temperature=450)[0], atol=0.01)
+
+    def test_describe(self):
+        results = describe(np.append(d, [0, -1, np.nan]), avg=('amean', 'median'))
+        self.assertEqual(results['n'], len(d))
+        self.assertEqual(results['removed'], 2)
+        self.assertAlmostEqual(results['amean'], 34.7857, places=4)
+        self.assertIn(results['amean_method'], ('ASTM', 'mCox'))
+        self.assertNotIn('gmean', results)
+
+        # statistics are estimated on first access only
+        results = describe(d)
+        self.assertAlmostEqual(results.gmean, np.exp(np.mean(np.log(d))))
+        self.assertAlmostEqual(results['msd'], np.exp(np.std(np.log(d), ddof=1)))
+        self.assertEqual(repr(results), "Summary(n={}, computed=['gmean', 'msd'])" .format(len(d)))
+        self.assertEqual(list(dict(results)), list(results))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -12,8 +12,8 @@ with open('license.txt') as fh:
 
 # Check for Python 3
 v = sys.version_info
-if (v[0] >= 3 and v[:2] < (3, 5)):
-    error = "ERROR: GrainSizeTools requires Python version 3.5 or above."
+if (v[0] >= 3 and v[:2] < (3, 7)):
+    error = "ERROR: GrainSizeTools requires Python version 3.7 or above."
     print(error, file=sys.stderr)
     sys.exit(1)
 
@@ -30,6 +30,10 @@ setup(
     url="https://github.com/marcoalopez/GrainSizeTools",
     license=license,
     packages=find_packages(),
+    entry_points={
+        'console_scripts': ['grainsizetools = grain_size_tools.cli:main',
+                            'grainsizetools-service = grain_size_tools.service:main'],
+    },
     classifiers=(
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: Apache-2.0 License",